@@ -23,24 +23,117 @@ else:
     single_url = APP_SETTINGS.get('sparql_endpoint', '')
     ENDPOINTS = [{"name": "Default", "url": single_url}] if single_url else []
 
+# Endpoints embarqués ("type": "embedded") : fichiers RDF chargés dans le processus, adressés par "embedded:<nom>"
+for _ep in ENDPOINTS:
+    if _ep.get('type') == 'embedded':
+        _ep.setdefault('url', f"embedded:{_ep.get('name', 'local')}")
+
 SPARQL_ENDPOINT_ACCESS = ENDPOINTS[0]['url'] if ENDPOINTS else ""
 
 MAIN_NAMESPACE = APP_SETTINGS.get('main_namespace_uri', '')
 
 PREFIXES = CONFIG.get('prefixes', {})
 
-CUSTOM_PREFIX = ""
-if "xsd" not in PREFIXES: CUSTOM_PREFIX += "PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>\n"
-if "rdf" not in PREFIXES: CUSTOM_PREFIX += "PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>\n"
-if "rdfs" not in PREFIXES: CUSTOM_PREFIX += "PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>\n"
+def _build_custom_prefix():
+    custom_prefix = ""
+    if "xsd" not in PREFIXES: custom_prefix += "PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>\n"
+    if "rdf" not in PREFIXES: custom_prefix += "PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>\n"
+    if "rdfs" not in PREFIXES: custom_prefix += "PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>\n"
 
-for prefix, uri in PREFIXES.items():
-    CUSTOM_PREFIX += f"PREFIX {prefix}: <{uri}>\n"
+    for prefix, uri in PREFIXES.items():
+        custom_prefix += f"PREFIX {prefix}: <{uri}>\n"
+    return custom_prefix
 
 VISUALIZATION = CONFIG.get('visualization', {})
 HIDDEN_PROPERTIES = VISUALIZATION.get('hidden_properties', [])
 LABEL_PROPERTIES = VISUALIZATION.get('label_properties', ["http://www.w3.org/2000/01/rdf-schema#label"])
 
+SPARQL_SETTINGS = CONFIG.get('sparql', {})
+SPARQL_TIMEOUT = SPARQL_SETTINGS.get('timeout', 45)
+SPARQL_POOL_SIZE = SPARQL_SETTINGS.get('pool_size', 16)
+# Réécriture des filtres de l'explorateur en motifs indexables (query_rewriter.py)
+FILTER_REWRITE = SPARQL_SETTINGS.get('rewrite_filters', True)
+FILTER_LANGUAGES = SPARQL_SETTINGS.get('filter_languages', [APP_SETTINGS.get('language', 'fr'), 'en'])
+# Découpage des filtres par endpoint et jointures locales (federated_planner.py)
+FEDERATED_PLANNER = SPARQL_SETTINGS.get('federated_planner', True)
+BIND_JOIN_BATCH_SIZE = SPARQL_SETTINGS.get('bind_join_batch_size', 200)
+MAX_INTERMEDIATE_RESULTS = SPARQL_SETTINGS.get('max_intermediate_results', 10000)
+# Vues de ressources assemblées (resource_view.py) conservées en mémoire
+RESOURCE_VIEW_CACHE_ENTRIES = SPARQL_SETTINGS.get('resource_view_cache_entries', 500)
+
+SEARCH_SETTINGS = CONFIG.get('search', {})
+SEARCH_FACET_PROPERTIES = SEARCH_SETTINGS.get('facet_properties', [
+    "http://purl.org/dc/terms/creator", "http://omeka.org/s/vocabs/o#item_set"
+])
+SEARCH_FACET_LIMIT = SEARCH_SETTINGS.get('facet_limit', 10)
+
+# Validateurs (ETag / 304), Cache-Control par route et compression des réponses (http_cache.py)
+HTTP_CACHE_SETTINGS = CONFIG.get('http_cache', {})
+HTTP_CACHE_ENABLED = HTTP_CACHE_SETTINGS.get('enabled', True)
+HTTP_COMPRESSION_MIN_SIZE = HTTP_CACHE_SETTINGS.get('compression_min_size', 1024)
+HTTP_COMPRESSION_LEVEL = HTTP_CACHE_SETTINGS.get('compression_level', 6)
+HTTP_CACHE_POLICIES = HTTP_CACHE_SETTINGS.get('policies', {
+    "/api/ontology/structure": "private, max-age=300",
+    "/api/resource_details": "private, max-age=60",
+    "/get_properties": "private, max-age=300",
+    "/get_property_values": "private, max-age=300",
+    "/api/search/facets": "private, max-age=60",
+    "/api/network/data": "private, no-cache"
+})
+# Routes dont le contenu ne dépend que des données (versions des endpoints) et des paramètres de la requête :
+# leur ETag est calculée avant d'exécuter la route, qui n'est pas exécutée si le navigateur la détient déjà
+HTTP_CACHE_VERSIONED_ROUTES = HTTP_CACHE_SETTINGS.get('versioned_routes', [
+    "/api/ontology/structure", "/api/resource_details", "/get_properties", "/get_property_values",
+    "/api/search/facets"
+])
+
+METRICS_SETTINGS = CONFIG.get('metrics', {})
+METRICS_ENABLED = METRICS_SETTINGS.get('enabled', True)
+
+TRACING_SETTINGS = CONFIG.get('tracing', {})
+TRACING_ENABLED = TRACING_SETTINGS.get('enabled', True)
+TRACE_DEBUG = TRACING_SETTINGS.get('debug', False)
+TRACE_HISTORY = TRACING_SETTINGS.get('history', 200)
+SLOW_QUERY_THRESHOLD = TRACING_SETTINGS.get('slow_query_threshold', 2.0)
+SLOW_QUERY_LOG = TRACING_SETTINGS.get('slow_query_log')
+MAX_QUERIES_PER_REQUEST = TRACING_SETTINGS.get('max_queries_per_request', 20)
+
+STORAGE_SETTINGS = CONFIG.get('storage', {})
+SESSION_LIFETIME = STORAGE_SETTINGS.get('session_lifetime', 7200)
+SESSION_MAX_ENTRIES = STORAGE_SETTINGS.get('session_max_entries', 2000)
+PAYLOAD_TTL = STORAGE_SETTINGS.get('payload_ttl', 7200)
+PAYLOAD_MAX_ENTRIES = STORAGE_SETTINGS.get('payload_max_entries', 500)
+
+STATS_SETTINGS = CONFIG.get('stats', {})
+STATS_BUCKET_SECONDS = STATS_SETTINGS.get('bucket_seconds', 3600)
+STATS_BUCKET_COUNT = STATS_SETTINGS.get('bucket_count', 168)
+STATS_PRECISION = STATS_SETTINGS.get('hll_precision', 10)
+STATS_FLUSH_PATH = STATS_SETTINGS.get('flush_path')
+STATS_FLUSH_INTERVAL = STATS_SETTINGS.get('flush_interval', 300)
+
+SCHEMA_SETTINGS = CONFIG.get('schema', {})
+SCHEMA_TTL = SCHEMA_SETTINGS.get('ttl', 3600)
+SCHEMA_RETRY_INTERVAL = SCHEMA_SETTINGS.get('retry_interval', 60)
+SCHEMA_PROPERTY_LIMIT = SCHEMA_SETTINGS.get('property_limit', 500)
+SCHEMA_SNAPSHOT_PATH = SCHEMA_SETTINGS.get('snapshot_path', os.path.join(os.getcwd(), 'schema_snapshot.json'))
+
+# Miroirs locaux des endpoints configurés avec "routing": "mirror"
+MIRROR_SETTINGS = CONFIG.get('mirror', {})
+MIRROR_DIRECTORY = MIRROR_SETTINGS.get('directory', os.path.join(os.getcwd(), 'mirror'))
+MIRROR_INTERVAL = MIRROR_SETTINGS.get('interval', 86400)
+MIRROR_MAX_STALENESS = MIRROR_SETTINGS.get('max_staleness', 3 * 86400)
+MIRROR_CHECK_INTERVAL = MIRROR_SETTINGS.get('check_interval', 60)
+MIRROR_SYNC_IN_APP = MIRROR_SETTINGS.get('sync_in_app', True)
+MIRROR_PAGE_SIZE = MIRROR_SETTINGS.get('page_size', 10000)
+MIRROR_TIMEOUT = MIRROR_SETTINGS.get('timeout', 300)
+
+# Versions des données publiées par les scripts d'export : invalidation des caches de l'endpoint concerné
+DATASET_VERSION_SETTINGS = CONFIG.get('dataset_versions', {})
+DATASET_VERSION_CHECK_INTERVAL = DATASET_VERSION_SETTINGS.get('check_interval', 300)
+DATASET_VERSION_STATE_PATH = DATASET_VERSION_SETTINGS.get('state_path', os.path.join(os.getcwd(), 'dataset_versions.json'))
+DATASET_VERSION_TIMEOUT = DATASET_VERSION_SETTINGS.get('timeout', 10)
+RESULT_CACHE_MAX_ENTRIES = DATASET_VERSION_SETTINGS.get('result_cache_entries', 2000)
+
 MANUAL_CLASSES = CONFIG.get('manual_class_mapping', {})
 RESOURCE_TYPES = MANUAL_CLASSES 
 
@@ -69,29 +162,47 @@ SPARQL_KEYWORDS = [
     'GROUP BY', 'HAVING', 'LIMIT', 'OFFSET', 'DISTINCT', 'ASK', 'CONSTRUCT'
 ]
 
-QUICK_INSERT_PREFIXES = [
-    {"label": f"{p}:", "insert": f"PREFIX {p}: <{u}>"} 
-    for p, u in PREFIXES.items()
-]
-
-std_prefixes = ["rdf", "rdfs", "owl", "skos", "xsd"]
-for p in std_prefixes:
-    if p not in PREFIXES:
-        uri = ""
-        if p == "xsd": uri = "http://www.w3.org/2001/XMLSchema#"
-        elif p == "rdfs": uri = "http://www.w3.org/2000/01/rdf-schema#"
-        elif p == "rdf": uri = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
-        elif p == "owl": uri = "http://www.w3.org/2002/07/owl#"
-        elif p == "skos": uri = "http://www.w3.org/2004/02/skos/core#"
-        QUICK_INSERT_PREFIXES.append({"label": f"{p}:", "insert": f"PREFIX {p}: <{uri}>"})
-
-QUICK_INSERT_CLASSES = [
-    {"label": label, "insert": f"a <{uri}>"} 
-    for label, uri in MANUAL_CLASSES.items()
-]
+def _build_quick_insert_prefixes():
+    quick_insert_prefixes = [
+        {"label": f"{p}:", "insert": f"PREFIX {p}: <{u}>"} 
+        for p, u in PREFIXES.items()
+    ]
+
+    std_prefixes = ["rdf", "rdfs", "owl", "skos", "xsd"]
+    for p in std_prefixes:
+        if p not in PREFIXES:
+            uri = ""
+            if p == "xsd": uri = "http://www.w3.org/2001/XMLSchema#"
+            elif p == "rdfs": uri = "http://www.w3.org/2000/01/rdf-schema#"
+            elif p == "rdf": uri = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+            elif p == "owl": uri = "http://www.w3.org/2002/07/owl#"
+            elif p == "skos": uri = "http://www.w3.org/2004/02/skos/core#"
+            quick_insert_prefixes.append({"label": f"{p}:", "insert": f"PREFIX {p}: <{uri}>"})
+    return quick_insert_prefixes
+
+def _build_quick_insert_classes():
+    return [
+        {"label": label, "insert": f"a <{uri}>"} 
+        for label, uri in MANUAL_CLASSES.items()
+    ]
 
 QUERY_TEMPLATES = {
     "Tout voir (Limit 10)": "SELECT * WHERE { ?s ?p ?o } LIMIT 10",
     "Compter les classes": "SELECT ?type (COUNT(?s) as ?count) WHERE { ?s a ?type } GROUP BY ?type ORDER BY DESC(?count)",
     "Lister les propriétés": "SELECT DISTINCT ?p WHERE { ?s ?p ?o } LIMIT 50"
-}
\ No newline at end of file
+}
+
+# Structures dérivées de la configuration, construites une seule fois au premier accès
+_LAZY_BUILDERS = {
+    "CUSTOM_PREFIX": _build_custom_prefix,
+    "QUICK_INSERT_PREFIXES": _build_quick_insert_prefixes,
+    "QUICK_INSERT_CLASSES": _build_quick_insert_classes
+}
+
+def __getattr__(name):
+    builder = _LAZY_BUILDERS.get(name)
+    if builder is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = builder()
+    globals()[name] = value
+    return value
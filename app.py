@@ -1,27 +1,43 @@
+import startup_profile
+
 import os
+import sys
 import time
 import logging
 import math
-import uuid
 import json
+import argparse
 import urllib.parse
 from functools import wraps
-from datetime import datetime
+from datetime import timedelta
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
-import pandas as pd
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, g
+from flask_session import Session
 
 from Constants import (
-    CONFIG, UI_CONFIG, PROJECT_INFO, SPARQL_KEYWORDS, 
-    QUICK_INSERT_PREFIXES, QUICK_INSERT_CLASSES, QUERY_TEMPLATES
+    CONFIG, UI_CONFIG, PROJECT_INFO,
+    TRACE_DEBUG, FEDERATED_PLANNER, SESSION_LIFETIME, SESSION_MAX_ENTRIES, PAYLOAD_TTL, PAYLOAD_MAX_ENTRIES,
+    STATS_BUCKET_SECONDS, STATS_BUCKET_COUNT, STATS_PRECISION, STATS_FLUSH_PATH, STATS_FLUSH_INTERVAL
 )
 from sparql_queries import (
-    get_classes, query_sparql, get_resources_by_type, search_resources,
-    execute_raw_query, get_resource_metadata, get_properties, 
+    get_classes, get_resources_by_type, search_resources,
+    execute_raw_query, get_properties,
     get_unique_values, build_sparql_query, get_bulk_details,
-    get_ontology_structure, get_graph_exploration
+    get_ontology_structure, get_graph_exploration, schema_registry
 )
 from utils import format_property_name, pivot_data_for_visualization
+from payload_store import PayloadStore
+from visit_stats import VisitStats
+from metrics import render_metrics, HTTP_LATENCY, HTTP_RESPONSE_BYTES, CACHE_REQUESTS
+import tracing
+from mirror import mirrors
+from dataset_versions import dataset_versions
+from federated_planner import federated_planner
+from facets import facet_engine
+from resource_view import resource_views
+import http_cache
+
+startup_profile.mark("imports")
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -31,13 +47,32 @@ app.secret_key = os.environ.get('SECRET_KEY', 'sematheque_generic_key_2025')
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
 app.config['MAX_JSON_LENGTH'] = 50 * 1024 * 1024
 app.config['SESSION_TYPE'] = 'filesystem'
+app.config['SESSION_FILE_DIR'] = os.path.join(os.getcwd(), 'flask_session')
+app.config['SESSION_FILE_THRESHOLD'] = SESSION_MAX_ENTRIES
+app.config['SESSION_PERMANENT'] = True
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(seconds=SESSION_LIFETIME)
+Session(app)
+startup_profile.mark("configuration Flask + sessions")
 
 _cache = {}
-visits = []
+visits = VisitStats(
+    bucket_seconds=STATS_BUCKET_SECONDS, bucket_count=STATS_BUCKET_COUNT, precision=STATS_PRECISION,
+    flush_path=STATS_FLUSH_PATH, flush_interval=STATS_FLUSH_INTERVAL
+)
 
+# Les charges volumineuses restent côté serveur : la session ne contient que leur identifiant
 TEMP_VIS_DIR = os.path.join(os.getcwd(), 'temp_vis_data')
-if not os.path.exists(TEMP_VIS_DIR):
-    os.makedirs(TEMP_VIS_DIR)
+payloads = PayloadStore(TEMP_VIS_DIR, ttl=PAYLOAD_TTL, max_entries=PAYLOAD_MAX_ENTRIES)
+
+# Préchauffage du schéma (instantané disque puis découverte en arrière-plan), désactivable pour les usages CLI
+if os.environ.get('SEMATHEQUE_SCHEMA_WARMUP', '1') != '0':
+    schema_registry.start()
+    mirrors.start()
+    dataset_versions.start()
+startup_profile.mark("démarrage du registre de schéma et des miroirs")
+
+# Les résultats de `cached` sont fédérés : un nouvel export sur l'un des endpoints les rend obsolètes
+dataset_versions.on_change(lambda endpoint_url: _cache.clear())
 
 def cached(timeout=3600):
     """Décorateur pour la mise en cache simple en mémoire."""
@@ -49,28 +84,59 @@ def cached(timeout=3600):
                 
             cache_key = f.__name__ + str(args) + str(sorted(kwargs.items()))
             if cache_key in _cache:
+                CACHE_REQUESTS.inc(f.__name__, "hit")
+                tracing.record_cache(f.__name__, True)
                 return _cache[cache_key]
             
+            CACHE_REQUESTS.inc(f.__name__, "miss")
+            tracing.record_cache(f.__name__, False)
             result = f(*args, **kwargs)
             _cache[cache_key] = result
             return result
         return decorated_function
     return decorator
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.trace = tracing.start_trace(f"{request.method} {request.path}")
+
+@app.after_request
+def record_request_metrics(response):
+    """Latence et volume par route (règle d'URL, pour limiter la cardinalité des labels)."""
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "inconnue"
+        HTTP_LATENCY.observe(route, request.method, str(response.status_code), value=time.perf_counter() - start)
+        if response.content_length:
+            HTTP_RESPONSE_BYTES.inc(route, amount=response.content_length)
+
+    trace = tracing.end_trace(g.pop('trace', None))
+    if trace is not None and TRACE_DEBUG:
+        summary = trace.summary(with_events=False)
+        response.headers['X-Sparql-Trace'] = (
+            f"id={summary['id']}; queries={summary['sparql_queries']}; "
+            f"distinct={summary['distinct_queries']}; sparql_ms={summary['sparql_time_ms']}"
+        )
+    return response
+
+@app.teardown_request
+def close_request_trace(exc):
+    """Ferme la trace si after_request n'a pas été exécuté (exception non gérée)."""
+    tracing.end_trace(g.pop('trace', None))
+
+# Enregistré après record_request_metrics : exécuté avant lui, les métriques comptent les octets compressés
+http_cache.init_app(app)
+
 @app.context_processor
 def inject_global_vars():
-    """Injecte les variables globales et les types disponibles dans les templates."""
+    """Injecte les variables globales et les types disponibles (lus dans le registre de schéma) dans les templates."""
     try:
-        types = get_classes()
+        types = get_classes(wait=False)
     except Exception:
         types = []
     return dict(ui_config=UI_CONFIG, project_info=PROJECT_INFO, global_available_types=types)
 
-@cached(3600)
-def cached_query_sparql(resource):
-    """Version mise en cache de la requête de détails d'une ressource."""
-    return query_sparql(resource)
-
 @cached(3600)
 def cached_get_resources_by_type(resource_type):
     """Version mise en cache de la récupération des ressources par type."""
@@ -78,15 +144,57 @@ def cached_get_resources_by_type(resource_type):
 
 @app.route('/')
 def index():
-    """Page d'accueil et compteur de visites basique."""
-    visits.append((request.remote_addr, datetime.now()))
+    """Page d'accueil et compteur de visites (mémoire bornée)."""
+    visits.record(request.remote_addr)
     return render_template('index.html')
 
 @app.route('/stats')
 def stats():
-    """Retourne les statistiques de connexion."""
-    unique_ips = len(set(ip for ip, _ in visits))
-    return {"total_connexions": len(visits), "utilisateurs_uniques": unique_ips}
+    """Retourne les statistiques de connexion (visiteurs uniques estimés par HyperLogLog)."""
+    return visits.summary()
+
+@app.route('/metrics')
+def metrics_api():
+    """Métriques au format texte Prometheus (requêtes SPARQL, routes, caches, pool de threads)."""
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/debug/traces')
+def debug_traces_api():
+    """Résumé des dernières requêtes HTTP tracées, triées par nombre d'appels SPARQL (mode debug)."""
+    if not TRACE_DEBUG:
+        return jsonify({'error': 'Traces désactivées'}), 404
+    return jsonify(tracing.recent_traces())
+
+@app.route('/api/debug/traces/<trace_id>')
+def debug_trace_api(trace_id):
+    """Détail d'une trace : chaque appel SPARQL avec son endpoint, sa durée, ses lignes et octets (mode debug)."""
+    trace = tracing.get_trace(trace_id) if TRACE_DEBUG else None
+    if trace is None:
+        return jsonify({'error': 'Trace introuvable'}), 404
+    return jsonify(trace.summary())
+
+@app.route('/api/schema/status')
+def schema_status_api():
+    """Retourne l'état du registre de schéma (fraîcheur, durée du dernier rafraîchissement)."""
+    return jsonify(schema_registry.stats())
+
+@app.route('/api/mirror/status')
+def mirror_status_api():
+    """Retourne l'état des miroirs locaux (routage effectif, fraîcheur, taille, dernière erreur)."""
+    return jsonify(mirrors.stats())
+
+@app.route('/api/dataset/versions')
+def dataset_versions_api():
+    """Version des données de chaque endpoint et date du dernier changement détecté."""
+    return jsonify(dataset_versions.stats())
+
+@app.route('/api/search/facets')
+def search_facets_api():
+    """Comptes de la recherche plein texte : total, ressources par type et par valeur des propriétés configurées."""
+    query_text = request.args.get('query_text', '')
+    if not query_text:
+        return jsonify({'success': False, 'message': 'query_text manquant'}), 400
+    return jsonify(facet_engine.facets(query_text, request.args.get('filter_type', '')))
 
 @app.route('/about')
 def about():
@@ -166,25 +274,37 @@ def filter_results():
         if not query_text:
             return redirect(url_for('search'))
         
-        results_df = search_resources(query_text, limit=500, resource_type=filter_type)
-        all_results = results_df.to_dict('records')
+        page = max(page, 1)
+        per_page = min(max(per_page, 1), 100)
+        start = (page - 1) * per_page
+        # Les comptes (total, types, propriétés) sont calculés par les endpoints pendant la requête de la page
+        facet_request = facet_engine.submit(query_text, filter_type)
+        results_df = search_resources(query_text, limit=per_page, resource_type=filter_type, offset=start)
+        paginated_results = results_df.to_dict('records')
+        try:
+            facets = facet_request.result()
+        except Exception as e:
+            logger.warning(f"Facettes indisponibles pour '{query_text}' : {e}")
+            facets = facet_request.unavailable()
         
-        total_results = len(all_results)
+        # Le total des facettes est au moins le nombre de résultats déjà vus ; s'il est incomplet et que
+        # la page est pleine, la page suivante reste accessible
+        total_results = max(facets['total'], start + len(paginated_results))
+        if facets['approximate'] and len(paginated_results) == per_page:
+            total_results = max(total_results, start + per_page + 1)
         total_pages = math.ceil(total_results / per_page) if total_results > 0 else 1
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_results = all_results[start:end]
-        all_types = sorted(list(set(r['type'] for r in all_results if r.get('type'))))
         
         return render_template(
             'search_results.html',
             query_text=query_text,
             filter_type=filter_type,
             results=paginated_results,
-            all_types=all_types,
+            all_types=facets['types'],
+            facets=facets,
             current_page=page,
             total_pages=total_pages,
-            total_results=total_results
+            total_results=total_results,
+            total_approximate=facets['approximate']
         )
     except Exception as e:
         logger.error(f"Erreur filter_results: {e}")
@@ -209,30 +329,14 @@ def explore():
         else:
             return render_template('explore.html', error="Impossible de déterminer les classes.")
 
-    df_initial = cached_query_sparql(current_resource)
-    metadata = get_resource_metadata(current_resource)
-    properties = []
-    filters = {}
-    
-    if not df_initial.empty:
-        for _, row in df_initial.iterrows():
-            formatted = format_property_name(row['Property'])
-            if formatted:
-                if row['Property'] not in filters:
-                    val_label = row.get('ValueLabel', row.get('Value', ''))
-                    filters[row['Property']] = [(val_label, "=")] if val_label else []
-                p_info = {'uri': row['Property'], 'label': formatted}
-                if p_info not in properties:
-                    properties.append(p_info)
-
+    view = resource_views.get(current_resource)
     return render_template(
         'explore.html',
         current_resource=current_resource,
-        properties=properties,
-        filters=filters,
-        metadata=metadata,
-        df_initial=df_initial,
-        available_types=get_classes()
+        properties=view.properties(),
+        filters=view.filters(),
+        metadata=view.metadata,
+        rows=view.rows
     )
 
 @app.route('/update_resource/<path:resource_uri>')
@@ -289,14 +393,20 @@ def execute_query():
     try:
         filters = request.json.get('filters', {})
         logic = request.json.get('logic', 'AND')
-        query = build_sparql_query(filters, logic=logic)
-        df = execute_raw_query(query)
+        plan = None
+        if FEDERATED_PLANNER:
+            df, plan = federated_planner.execute(filters, logic=logic)
+            # Requêtes du plan exécuté (aucune si une propriété filtrée est absente de tous les endpoints)
+            query = "\n\n".join(f"# {', '.join(entry['endpoints'])}\n{entry['query']}" for entry in plan['queries'])
+        else:
+            query = build_sparql_query(filters, logic=logic)
+            df = execute_raw_query(query)
         results = []
         if not df.empty:
             rename_map = {'subject': 'SubjectURI', 'subjectLabel': 'SubjectLabel'}
             df.rename(columns=rename_map, inplace=True)
             results = df.to_dict('records')
-        return jsonify({'success': True, 'results': results, 'query': query, 'count': len(results)})
+        return jsonify({'success': True, 'results': results, 'query': query, 'plan': plan, 'count': len(results)})
     except Exception as e:
         logger.error(f"Execute Error: {e}")
         return jsonify({'success': False, 'message': str(e)})
@@ -308,43 +418,23 @@ def resource_details_api():
     if not uri:
         return jsonify({'success': False})
     try:
-        df = cached_query_sparql(uri)
-        results = []
-        if not df.empty:
-            df.rename(columns={'property': 'Property', 'value': 'Value', 'valueLabel': 'ValueLabel'}, inplace=True)
-            for _, row in df.iterrows():
-                prop_uri = row.get('Property', '')
-                prop_label = format_property_name(prop_uri)
-                if not prop_label:
-                    prop_label = prop_uri.split('/')[-1].split('#')[-1]
-                results.append({
-                    'Property': prop_uri,
-                    'PropertyLabel': prop_label,
-                    'Value': row.get('Value', ''),
-                    'ValueLabel': row.get('ValueLabel') or row.get('Value', '')
-                })
-        return jsonify({'success': True, 'details': results})
+        view = resource_views.get(uri)
+        return jsonify({
+            'success': True,
+            'label': view.metadata['label'],
+            'types': [{'uri': type_uri, 'label': label} for type_uri, label in view.types],
+            'details': view.details()
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/prepare_visualization', methods=['POST'])
 def prepare_visualization():
     """
-    Prépare les données pour la visualisation, stocke le résultat et nettoie les vieux fichiers.
-    Supprime les fichiers temporaires vieux de plus de 2 heures (7200 secondes).
+    Prépare les données pour la visualisation et les stocke côté serveur.
+    Les charges expirées sont purgées par le PayloadStore (durée de vie PAYLOAD_TTL).
     """
     try:
-        now = time.time()
-        if os.path.exists(TEMP_VIS_DIR):
-            for filename in os.listdir(TEMP_VIS_DIR):
-                file_path = os.path.join(TEMP_VIS_DIR, filename)
-                if filename.endswith('.json') and os.path.isfile(file_path):
-                    try:
-                        if os.path.getmtime(file_path) < now - 7200:
-                            os.remove(file_path)
-                    except OSError:
-                        pass
-
         data = request.get_json()
         input_results = data.get('visualization_data', [])
         if not input_results:
@@ -358,11 +448,7 @@ def prepare_visualization():
         else:
             final_data = pivot_data_for_visualization(df_details)
         
-        vis_id = str(uuid.uuid4())
-        file_path = os.path.join(TEMP_VIS_DIR, f"{vis_id}.json")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(final_data, f)
-        session['vis_id'] = vis_id
+        session['vis_id'] = payloads.put(final_data, session.get('vis_id'))
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -374,13 +460,7 @@ def visualize():
     vis_id = session.get('vis_id')
     
     if vis_id:
-        file_path = os.path.join(TEMP_VIS_DIR, f"{vis_id}.json")
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    initial_data = json.load(f)
-            except Exception:
-                pass
+        initial_data = payloads.get(vis_id, [])
     elif request.method == 'POST':
         try:
             if request.is_json:
@@ -423,13 +503,15 @@ def get_visualization_data():
 
 @app.route('/save_results_for_export', methods=['POST'])
 def save_results_for_export():
-    """Sauvegarde temporaire des résultats en session pour l'export."""
-    session['results'] = request.json.get('results', [])
+    """Sauvegarde temporaire des résultats côté serveur pour l'export (la session ne garde que l'identifiant)."""
+    session['results_id'] = payloads.put(request.json.get('results', []), session.get('results_id'))
     return jsonify({"success": True})
 
 @app.route('/export/<format>', methods=['POST'])
 def export_data(format):
     """Exporte les données au format CSV ou JSON."""
+    import pandas as pd
+
     try:
         results = request.get_json().get('results', [])
         uris = [r['SubjectURI'] for r in results if 'SubjectURI' in r]
@@ -463,11 +545,11 @@ def visualization_network():
 
 @app.route('/api/network/data', methods=['GET', 'POST'])
 def network_data_api():
-    """API pour stocker/récupérer les données du graphe en session."""
+    """API pour stocker/récupérer les données du graphe (stockées côté serveur, référencées en session)."""
     if request.method == 'POST':
-        session['network_data'] = request.get_json()
+        session['network_id'] = payloads.put(request.get_json(), session.get('network_id'))
         return jsonify({'success': True})
-    return jsonify(session.get('network_data', {}))
+    return jsonify(payloads.get(session.get('network_id'), {}))
 
 @app.route('/ontology')
 def ontology_view():
@@ -510,5 +592,22 @@ def validate_api():
     """API stub pour la validation SPARQL."""
     return jsonify({'success': True, 'valid': True})
 
+startup_profile.mark("déclaration des routes")
+if os.environ.get('SEMATHEQUE_PROFILE_STARTUP'):
+    logger.info("Profil de démarrage :\n" + startup_profile.report())
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sematheque - explorateur sémantique")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Affiche le profil de démarrage et le coût des imports puis quitte")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        print(startup_profile.report())
+        print()
+        print(startup_profile.importtime_report())
+        sys.exit(0)
+
+    app.run(debug=True, host=args.host, port=args.port)
\ No newline at end of file
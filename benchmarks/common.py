@@ -0,0 +1,100 @@
+"""
+Outils partagés par les benchmarks : démarrage des endpoints de substitution, import de
+l'application pointée sur ces endpoints, statistiques de latence.
+"""
+import os
+import sys
+import math
+import socket
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from data import build_datasets
+from standin import start_standins
+
+
+class BenchEnvironment:
+    """Endpoints de substitution démarrés + module `app` configuré pour les interroger."""
+
+    def __init__(self, scale="small", seed=42, plain_literals=False, **standin_options):
+        self.scale = scale
+        self.datasets = build_datasets(scale, seed, plain_literals)
+        self.standins, endpoints = start_standins(self.datasets, **standin_options)
+
+        # L'application écrit sessions et charges dans le répertoire courant : on l'isole
+        self.workdir = tempfile.TemporaryDirectory()
+        os.chdir(self.workdir.name)
+        os.environ['SEMATHEQUE_SCHEMA_WARMUP'] = '0'
+
+        import Constants
+        # ENDPOINTS est partagé par référence avec sparql_queries : on le modifie en place
+        Constants.ENDPOINTS[:] = endpoints
+
+        import app
+        import sparql_queries
+        self.app = app
+        self.sparql_queries = sparql_queries
+        sparql_queries.schema_registry.refresh()
+
+    def sample_uris(self, profile=None, rdf_type=None, limit=None):
+        return sample_uris(self.datasets, profile, rdf_type, limit)
+
+    def reset_caches(self):
+        """Vide les caches applicatifs pour mesurer le chemin complet jusqu'aux endpoints."""
+        self.app._cache.clear()
+        self.sparql_queries.search_properties.cache_clear()
+        self.sparql_queries.get_unique_values.cache_clear()
+        import resource_view
+        resource_view.resource_views.invalidate()
+
+    def close(self):
+        for standin in self.standins:
+            standin.stop()
+        os.chdir(ROOT)
+        self.workdir.cleanup()
+
+
+def sample_uris(datasets, profile=None, rdf_type=None, limit=None):
+    """URIs de sujets présents dans les jeux de données (optionnellement filtrés par type)."""
+    from rdflib.namespace import RDF
+    uris = []
+    for name, graph in datasets.items():
+        if profile and name != profile:
+            continue
+        if rdf_type is not None:
+            uris.extend(str(s) for s in graph.subjects(RDF.type, rdf_type))
+        else:
+            uris.extend(str(s) for s in set(graph.subjects(RDF.type, None)))
+    uris.sort()
+    return uris[:limit] if limit else uris
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    """Percentile au rang le plus proche sur une liste déjà triée."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_stats(durations, wall_time=None):
+    """Débit et percentiles (en millisecondes) d'une série de durées en secondes."""
+    values = sorted(durations)
+    total = wall_time if wall_time is not None else sum(values)
+    return {
+        "count": len(values),
+        "throughput": round(len(values) / total, 2) if total else None,
+        "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+        "max_ms": round(values[-1] * 1000, 2) if values else None
+    }
@@ -0,0 +1,139 @@
+"""
+Jeux de données synthétiques de la forme produite par l'export Omeka S (omekasToRDF.py) :
+items typés, titres et labels, liens entre ressources, dates, collections (o:item_set) et médias.
+La génération est déterministe (graine fixe) pour que les mesures soient reproductibles.
+"""
+import random
+
+from rdflib import Graph, URIRef, Literal, Namespace
+from rdflib.namespace import RDF, RDFS, XSD, DCTERMS, FOAF
+
+PMO = Namespace("http://patrimaths.fr/pmo#")
+BIBO = Namespace("http://purl.org/ontology/bibo/")
+O = Namespace("http://omeka.org/s/vocabs/o#")
+
+# Nombre de ressources (items) par endpoint
+SCALES = {"small": 500, "medium": 5000, "large": 20000}
+
+WORDS = [
+    "analyse", "géométrie", "algèbre", "topologie", "mécanique", "probabilités", "optique",
+    "mémoire", "lettre", "cours", "leçons", "théorie", "fonctions", "équations", "nombres",
+    "calcul", "astronomie", "physique", "méthodes", "recherches", "histoire", "enseignement"
+]
+NAMES = [
+    "Poincaré", "Hermite", "Darboux", "Picard", "Appell", "Borel", "Hadamard", "Lebesgue",
+    "Jordan", "Painlevé", "Goursat", "Koenigs", "Humbert", "Tannery", "Laisant", "Lemoine"
+]
+
+# Profils d'endpoint : espace de noms des items, classes et propriétés utilisées
+PROFILES = {
+    "patrimaths": {
+        "base": "http://patrimaths.fr/api/items/",
+        "person": PMO.Personne,
+        "works": [PMO.Article, PMO.Ouvrage, PMO.Encyclopedie],
+        "place": PMO.Bibliotheque,
+        "author": DCTERMS.creator,
+        "name": FOAF.name
+    },
+    "sciencespo": {
+        "base": "http://bibnum.sciencespo.fr/api/items/",
+        "person": FOAF.Person,
+        "works": [BIBO.AcademicArticle, BIBO.Book, BIBO.Report, BIBO.Thesis],
+        "place": None,
+        "author": DCTERMS.creator,
+        "name": FOAF.name
+    }
+}
+
+
+def _title(rng, n=3):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def build_graph(profile="patrimaths", items=500, seed=42):
+    """Construit un graphe rdflib de `items` ressources pour le profil donné."""
+    rng = random.Random(f"{profile}-{seed}")
+    p = PROFILES[profile]
+    g = Graph()
+    g.bind("pmo", PMO)
+    g.bind("bibo", BIBO)
+    g.bind("o", O)
+    g.bind("dcterms", DCTERMS)
+    g.bind("foaf", FOAF)
+
+    base = p["base"]
+    item_sets = [URIRef(f"{base.replace('/items/', '/item_sets/')}{i}") for i in range(1, 6)]
+    for i, item_set in enumerate(item_sets, 1):
+        g.add((item_set, RDFS.label, Literal(f"Collection {i}")))
+
+    n_persons = max(1, items // 5)
+    persons = [URIRef(f"{base}{i}") for i in range(1, n_persons + 1)]
+    for i, person in enumerate(persons):
+        name = f"{rng.choice(NAMES)} {i}"
+        g.add((person, RDF.type, p["person"]))
+        g.add((person, RDFS.label, Literal(name)))
+        g.add((person, p["name"], Literal(name)))
+        g.add((person, DCTERMS.date, Literal(rng.randint(1800, 1900), datatype=XSD.integer)))
+        g.add((person, O.item_set, rng.choice(item_sets)))
+
+    places = []
+    if p["place"] is not None:
+        places = [URIRef(f"{base}{n_persons + i}") for i in range(1, 11)]
+        for i, place in enumerate(places):
+            g.add((place, RDF.type, p["place"]))
+            g.add((place, RDFS.label, Literal(f"Bibliothèque {i}")))
+
+    offset = n_persons + len(places) + 1
+    for i in range(items - n_persons):
+        uri = URIRef(f"{base}{offset + i}")
+        title = _title(rng)
+        g.add((uri, RDF.type, rng.choice(p["works"])))
+        g.add((uri, RDFS.label, Literal(title)))
+        g.add((uri, DCTERMS.title, Literal(title, lang="fr")))
+        g.add((uri, p["author"], rng.choice(persons)))
+        g.add((uri, DCTERMS.date, Literal(rng.randint(1850, 1950), datatype=XSD.integer)))
+        g.add((uri, DCTERMS.subject, Literal(rng.choice(WORDS))))
+        g.add((uri, O.item_set, rng.choice(item_sets)))
+        if places:
+            g.add((uri, DCTERMS.spatial, rng.choice(places)))
+        if i % 4 == 0:
+            media = URIRef(f"{base.replace('/items/', '/media/')}{offset + i}")
+            g.add((media, RDF.type, O.Media))
+            g.add((media, RDFS.label, Literal(f"{title} (numérisation)")))
+            g.add((media, O.item, uri))
+    return g
+
+
+def add_cross_references(datasets, seed=42):
+    """
+    Liens entre endpoints : Sciences Po cite un ouvrage PatriMaths sur dix (dcterms:isReferencedBy,
+    propriété absente de PatriMaths). Les ressources citées ne sont typées que côté PatriMaths.
+    """
+    rng = random.Random(f"cross-{seed}")
+    works = sorted({s for s in datasets["patrimaths"].subjects(DCTERMS.title, None)})
+    citing = sorted({s for s in datasets["sciencespo"].subjects(DCTERMS.title, None)})
+    for work in works[::10]:
+        datasets["sciencespo"].add((work, DCTERMS.isReferencedBy, rng.choice(citing)))
+
+
+def strip_datatypes(graph):
+    """
+    Littéraux typés remplacés par des littéraux simples, comme ceux qu'écrivent les scripts d'export
+    (`Literal(element["@value"])`, `Literal(element.text.strip())`). Les étiquettes de langue restent.
+    """
+    typed = [(s, p, o) for s, p, o in graph if isinstance(o, Literal) and o.datatype is not None]
+    for s, p, o in typed:
+        graph.remove((s, p, o))
+        graph.add((s, p, Literal(str(o))))
+    return graph
+
+
+def build_datasets(scale="small", seed=42, plain_literals=False):
+    """Un graphe par profil d'endpoint à l'échelle demandée."""
+    items = SCALES[scale] if isinstance(scale, str) else int(scale)
+    datasets = {profile: build_graph(profile, items, seed) for profile in PROFILES}
+    add_cross_references(datasets, seed)
+    if plain_literals:
+        for graph in datasets.values():
+            strip_datatypes(graph)
+    return datasets
@@ -0,0 +1,133 @@
+"""
+Filtres multi-propriétés : requête monolithique envoyée à chaque endpoint contre planificateur
+fédéré (federated_planner.py). Pour chaque cas : ressources trouvées, requêtes SPARQL reçues par
+les endpoints et durée médiane. Les sondes de propriétés restent en cache entre les tours ; les autres
+résultats mis en cache par le planificateur sont vidés avant chaque tour mesuré.
+
+Vérifie aussi qu'en logique ET, ajouter un filtre n'ajoute jamais de ressource : les ressources de
+chaque cas doivent figurer dans celles de chacun de ses filtres pris seul (code de sortie 1 sinon).
+
+Usage :
+    python benchmarks/federation.py --scale medium --backend oxigraph
+"""
+import sys
+import json
+import time
+import argparse
+
+from rdflib.namespace import DCTERMS
+
+from common import BenchEnvironment, latency_stats
+
+SUBJECT = str(DCTERMS.subject)
+DATE = str(DCTERMS.date)
+SPATIAL = str(DCTERMS.spatial)
+REFERENCED = str(DCTERMS.isReferencedBy)
+
+
+def build_cases(env):
+    """Cas (nom, filtres, logique) : PatriMaths seul, deux endpoints, et propriétés d'endpoints différents."""
+    graph = env.datasets["patrimaths"]
+    place = sorted(str(o) for o in graph.objects(None, DCTERMS.spatial))[0]
+    return [
+        ("single_endpoint", {SPATIAL: {"values": [[place, "="]]}}, "AND"),
+        ("both_endpoints", {SUBJECT: {"values": [["analyse", "="]]}, DATE: {"values": [["1940", ">"]]}}, "AND"),
+        ("cross_endpoint", {SUBJECT: {"values": [["analyse", "="]]}, REFERENCED: {"values": [["", "non_null"]]}}, "AND"),
+        ("cross_selective", {SPATIAL: {"values": [[place, "="]]}, REFERENCED: {"values": [["", "non_null"]]}}, "AND"),
+        ("missing_property", {SUBJECT: {"values": [["analyse", "="]]},
+                              "http://example.org/absente": {"values": [["x", "="]]}}, "AND"),
+        ("referenced_subject", {REFERENCED: {"values": [["", "non_null"]]},
+                                SUBJECT: {"values": [["", "non_null"]]}}, "AND"),
+        ("or", {SPATIAL: {"values": [[place, "="]]}, DATE: {"values": [["1949", "="]]}}, "OR"),
+    ]
+
+
+def run(env, iterations):
+    sq = env.sparql_queries
+    planner = env.federated_planner
+    modes = {
+        "monolithic": lambda filters, logic: sq.execute_raw_query(sq.build_sparql_query(filters, logic)),
+        "planned": lambda filters, logic: planner.execute(filters, logic)[0],
+    }
+    results = {}
+    for name, filters, logic in build_cases(env):
+        results[name] = {"strategy": planner.plan(filters, logic)[0]["strategy"]}
+        for mode, op in modes.items():
+            rows = len(op(filters, logic))  # tour de chauffe
+            durations = []
+            queries = 0
+            for _ in range(iterations):
+                uncache_results(env, planner, filters, logic)
+                requests_before = sum(s.requests for s in env.standins)
+                start = time.perf_counter()
+                op(filters, logic)
+                durations.append(time.perf_counter() - start)
+                queries += sum(s.requests for s in env.standins) - requests_before
+            results[name][mode] = dict(latency_stats(durations), rows=rows, queries=queries / iterations)
+    return results
+
+
+def uncache_results(env, planner, filters, logic):
+    """Vide le cache des résultats SPARQL puis y replace les sondes du cas, hors mesure."""
+    sq = env.sparql_queries
+    for ep in sq.ENDPOINTS:
+        sq.query_results.invalidate(ep['url'])
+    planner.plan(filters, logic)
+
+
+def growing(env):
+    """Cas ET dont le résultat contient une ressource absente du résultat de l'un de ses filtres pris seul."""
+    planner = env.federated_planner
+    failed = []
+    for name, filters, logic in build_cases(env):
+        if logic != "AND" or len(filters) < 2:
+            continue
+        subjects = set(planner.execute(filters, logic)[0].get('subject', []))
+        for prop, values in filters.items():
+            alone = set(planner.execute({prop: values}, logic)[0].get('subject', []))
+            if not subjects <= alone:
+                failed.append(f"{name} ({len(subjects - alone)} ressources hors du filtre <{prop}> seul)")
+    return failed
+
+
+def print_results(results):
+    print(f"{'cas':<18} {'stratégie':<10} {'lignes mono':>11} {'lignes plan':>11} {'req. mono':>9} {'req. plan':>9} "
+          f"{'p50 mono':>9} {'p50 plan':>9}")
+    for name, r in results.items():
+        mono, plan = r["monolithic"], r["planned"]
+        print(f"{name:<18} {r['strategy']:<10} {mono['rows']:>11} {plan['rows']:>11} {mono['queries']:>9} "
+              f"{plan['queries']:>9} {mono['p50_ms']:>9} {plan['p50_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='small', help="small, medium, large ou un nombre d'items par endpoint")
+    parser.add_argument('--iterations', type=int, default=10, help="Exécutions mesurées par cas et par mode")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence injectée par requête SPARQL (s)")
+    parser.add_argument('--backend', default='rdflib', choices=['rdflib', 'oxigraph'],
+                        help="Moteur des endpoints de substitution (oxigraph nécessite pyoxigraph)")
+    parser.add_argument('--json', help="Écrit les résultats détaillés dans ce fichier")
+    args = parser.parse_args()
+
+    env = BenchEnvironment(args.scale, latency=args.latency, backend=args.backend)
+    import federated_planner
+    env.federated_planner = federated_planner.federated_planner
+    try:
+        results = run(env, args.iterations)
+        failed = growing(env)
+    finally:
+        env.close()
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"scale": args.scale, "backend": args.backend, "latency": args.latency,
+                       "timestamp": time.time(), "results": results}, f, indent=2)
+
+    if failed:
+        print(f"Filtre ET ajoutant des ressources : {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
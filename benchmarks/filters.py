@@ -0,0 +1,112 @@
+"""
+Durée des requêtes de filtrage de l'explorateur avant/après réécriture (query_rewriter.py).
+
+Chaque cas est exécuté contre les endpoints locaux avec les conditions historiques
+(LCASE(STR()), xsd:decimal()) puis avec les motifs réécrits (VALUES, IRI dans le motif,
+littéraux typés), sans cache applicatif.
+
+Les deux versions doivent trouver les mêmes ressources : le script se termine avec le code 1 sinon.
+`--plain-literals` remplace les littéraux typés par des littéraux simples, comme ceux des exports.
+
+Usage :
+    python benchmarks/filters.py --scale medium
+    python benchmarks/filters.py --scale medium --backend oxigraph --json filters.json
+    python benchmarks/filters.py --backend oxigraph --plain-literals
+"""
+import sys
+import json
+import time
+import argparse
+
+from rdflib.namespace import DCTERMS
+
+from common import BenchEnvironment, latency_stats
+
+SUBJECT = str(DCTERMS.subject)
+TITLE = str(DCTERMS.title)
+CREATOR = str(DCTERMS.creator)
+DATE = str(DCTERMS.date)
+
+
+def build_cases(env):
+    """Cas de filtrage (nom, filtres, logique) tirés des jeux de données générés."""
+    graph = env.datasets["patrimaths"]
+    title = sorted(str(o) for o in graph.objects(None, DCTERMS.title))[0]
+    creator = sorted(str(o) for o in graph.objects(None, DCTERMS.creator))[0]
+    return [
+        ("literal_eq", {SUBJECT: {"values": [["analyse", "="]]}}, "AND"),
+        ("literal_eq_multi", {SUBJECT: {"values": [["analyse", "="], ["optique", "="], ["lettre", "="]]}}, "AND"),
+        ("lang_literal_eq", {TITLE: {"values": [[title, "="]]}}, "AND"),
+        ("uri_eq", {CREATOR: {"values": [[creator, "="]]}}, "AND"),
+        ("number_eq", {DATE: {"values": [["1900", "="]]}}, "AND"),
+        ("range", {DATE: {"values": [["1940", ">"]]}}, "AND"),
+        ("range_and_eq", {DATE: {"values": [["1940", ">"]]}, SUBJECT: {"values": [["analyse", "="]]}}, "AND"),
+        ("range_below", {DATE: {"values": [["1850", "<"]]}}, "AND"),
+        ("eq_or_uri", {SUBJECT: {"values": [["optique", "="]]}, CREATOR: {"values": [[creator, "="]]}}, "OR"),
+        ("contains", {SUBJECT: {"values": [["ana", "contient"]]}}, "AND"),
+    ]
+
+
+def run(env, iterations):
+    execute_raw_query = env.sparql_queries.execute_raw_query
+    build_sparql_query = env.sparql_queries.build_sparql_query
+    results = {}
+    for name, filters, logic in build_cases(env):
+        results[name] = {}
+        for mode, rewrite in (("before", False), ("after", True)):
+            query = build_sparql_query(filters, logic=logic, rewrite=rewrite)
+            rows = len(execute_raw_query(query))  # tour de chauffe
+            durations = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                execute_raw_query(query)
+                durations.append(time.perf_counter() - start)
+            results[name][mode] = dict(latency_stats(durations), rows=rows)
+    return results
+
+
+def mismatches(results):
+    """Cas où la requête réécrite ne trouve pas le même nombre de ressources que la requête historique."""
+    return [name for name, r in results.items() if r["before"]["rows"] != r["after"]["rows"]]
+
+
+def print_results(results):
+    print(f"{'cas':<18} {'lignes av.':>10} {'lignes ap.':>10} {'p50 av. ms':>11} {'p50 ap. ms':>11} {'gain':>7}")
+    for name, r in results.items():
+        before, after = r["before"], r["after"]
+        gain = before["p50_ms"] / after["p50_ms"] if after["p50_ms"] else float('inf')
+        print(f"{name:<18} {before['rows']:>10} {after['rows']:>10} {before['p50_ms']:>11} {after['p50_ms']:>11} "
+              f"{gain:>6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='small', help="small, medium, large ou un nombre d'items par endpoint")
+    parser.add_argument('--iterations', type=int, default=10, help="Exécutions mesurées par cas et par mode")
+    parser.add_argument('--backend', default='rdflib', choices=['rdflib', 'oxigraph'],
+                        help="Moteur des endpoints de substitution (oxigraph nécessite pyoxigraph)")
+    parser.add_argument('--plain-literals', action='store_true',
+                        help="Littéraux simples (sans type), comme ceux écrits par les scripts d'export")
+    parser.add_argument('--json', help="Écrit les résultats détaillés dans ce fichier")
+    args = parser.parse_args()
+
+    env = BenchEnvironment(args.scale, backend=args.backend, plain_literals=args.plain_literals)
+    try:
+        results = run(env, args.iterations)
+    finally:
+        env.close()
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"scale": args.scale, "backend": args.backend, "plain_literals": args.plain_literals,
+                       "timestamp": time.time(), "results": results}, f, indent=2)
+
+    failed = mismatches(results)
+    if failed:
+        print(f"Résultats différents après réécriture : {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
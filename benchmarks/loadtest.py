@@ -0,0 +1,358 @@
+"""
+Test de charge : des utilisateurs virtuels rejouent en parallèle le parcours type
+/parcours -> /explore -> /execute_query -> /api/prepare_visualization contre l'application servie
+dans un ou plusieurs processus séparés, eux-mêmes branchés sur des endpoints SPARQL locaux
+(latence et taux d'échec injectables).
+
+Usage :
+    python benchmarks/loadtest.py --users 20 --duration 60
+    python benchmarks/loadtest.py --users 50 --workers 2 --latency 0.05 --jitter 0.05 --failure-rate 0.01
+    python benchmarks/loadtest.py --users 20 --baseline benchmarks/load_baseline.json
+
+Le rapport donne, par route, les percentiles de latence et le taux d'erreur, ainsi que la
+consommation CPU, la mémoire et le nombre de threads des processus serveur.
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from common import ROOT, free_port, sample_uris, latency_stats
+from data import WORDS, build_datasets
+from standin import start_standins
+from run import compare
+
+# Processus serveur : ENDPOINTS est remplacé en place avant l'import de l'application
+WORKER = (
+    "import os, json, Constants; "
+    "Constants.ENDPOINTS[:] = json.loads(os.environ['SEMATHEQUE_BENCH_ENDPOINTS']); "
+    "import app; app.app.run(host='127.0.0.1', port={port}, debug=False, use_reloader=False, threaded=True)"
+)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Les redirections sont mesurées comme des étapes distinctes du parcours."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ServerProcess:
+    """Un worker de l'application (serveur threadé de Flask) dans un processus dédié."""
+
+    def __init__(self, endpoints, workdir, log=None):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, PYTHONPATH=ROOT, SEMATHEQUE_BENCH_ENDPOINTS=json.dumps(endpoints))
+        self.proc = subprocess.Popen([sys.executable, "-c", WORKER.format(port=self.port)], cwd=workdir, env=env,
+                                     stdout=subprocess.DEVNULL, stderr=log or subprocess.DEVNULL)
+
+    def wait_ready(self, timeout=120):
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Le worker s'est arrêté au démarrage (code {self.proc.returncode})")
+            try:
+                with urllib.request.urlopen(f"{self.url}/about", timeout=timeout) as resp:
+                    if resp.status == 200:
+                        return
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError(f"Le worker {self.url} ne répond pas après {timeout}s")
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+
+class ResourceSampler:
+    """Échantillonne CPU, mémoire résidente et threads des workers via /proc (Linux)."""
+
+    def __init__(self, pids, interval=0.5):
+        self.pids = pids
+        self.interval = interval
+        self.available = os.path.exists(f"/proc/{pids[0]}/stat") if pids else False
+        self.peak_rss = 0
+        self.peak_threads = 0
+        self._start = None
+        self._end = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    def _sample(self):
+        ticks = os.sysconf('SC_CLK_TCK')
+        cpu, rss, threads = 0.0, 0, 0
+        for pid in self.pids:
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / ticks
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            rss += int(line.split()[1]) * 1024
+                        elif line.startswith('Threads:'):
+                            threads += int(line.split()[1])
+            except OSError:
+                continue
+        return time.perf_counter(), cpu, rss, threads
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._record(self._sample())
+
+    def _record(self, sample):
+        _, _, rss, threads = sample
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_threads = max(self.peak_threads, threads)
+        self._end = sample
+
+    def start(self):
+        if self.available:
+            self._start = self._sample()
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Arrête l'échantillonnage ; retourne l'usage sur la fenêtre mesurée (None hors Linux)."""
+        if not self.available:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._record(self._sample())
+        elapsed = self._end[0] - self._start[0]
+        cpu = self._end[1] - self._start[1]
+        return {
+            "workers": len(self.pids),
+            "cpu_seconds": round(cpu, 2),
+            "cpu_percent": round(100 * cpu / elapsed, 1) if elapsed else None,
+            "peak_rss_mb": round(self.peak_rss / 1024 / 1024, 1),
+            "peak_threads": self.peak_threads
+        }
+
+
+class VirtualUser:
+    """Un navigateur avec sa propre session (cookie) rejouant le parcours type."""
+
+    def __init__(self, base_url, uris, think_time, rng, visualization_size):
+        self.base_url = base_url
+        self.uris = uris
+        self.think_time = think_time
+        self.rng = rng
+        self.visualization_size = visualization_size
+        self.samples = []
+        self.journeys = 0
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def _call(self, route, path, payload=None):
+        data, headers = None, {}
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        start = time.perf_counter()
+        body, error = b'', None
+        try:
+            with self.opener.open(req, timeout=120) as resp:
+                body = resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code >= 400:
+                error = f"HTTP {e.code}"
+        except OSError as e:
+            error = type(e).__name__
+        duration = time.perf_counter() - start
+
+        result = None
+        if error is None and payload is not None:
+            try:
+                result = json.loads(body)
+                if result.get('success') is False:
+                    error = "success=false"
+            except ValueError:
+                error = "réponse invalide"
+        self.samples.append((route, duration, error))
+        return result
+
+    def _think(self):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time))
+
+    def journey(self):
+        self._call("parcours", "/parcours")
+        self._think()
+        uri = self.rng.choice(self.uris)
+        self._call("update_resource", "/update_resource/" + urllib.parse.quote(uri, safe=''))
+        self._call("explore", "/explore")
+        self._think()
+        filters = {"http://purl.org/dc/terms/subject": {"values": [[self.rng.choice(WORDS), "="]]}}
+        found = self._call("execute_query", "/execute_query", {"filters": filters, "logic": "AND"})
+        self._think()
+        results = (found or {}).get('results') or []
+        if results:
+            self._call("prepare_visualization", "/api/prepare_visualization",
+                       {"visualization_data": results[:self.visualization_size]})
+        self.journeys += 1
+
+    def run(self, deadline, max_journeys=None):
+        while time.perf_counter() < deadline and (max_journeys is None or self.journeys < max_journeys):
+            self.journey()
+
+
+def run_load(servers, uris, users, duration, ramp=0.0, think_time=0.0, journeys=None, seed=42,
+             visualization_size=50):
+    """Lance `users` utilisateurs virtuels répartis sur les workers ; retourne (utilisateurs, durée réelle)."""
+    rng = random.Random(seed)
+    vusers = [VirtualUser(servers[i % len(servers)].url, uris, think_time, random.Random(rng.random()),
+                          visualization_size) for i in range(users)]
+    start = time.perf_counter()
+    deadline = start + ramp + duration
+    threads = []
+    for i, vuser in enumerate(vusers):
+        t = threading.Thread(target=vuser.run, args=(deadline, journeys), name=f"vuser-{i}", daemon=True)
+        threads.append(t)
+        t.start()
+        if ramp:
+            time.sleep(ramp / users)
+    for t in threads:
+        t.join()
+    return vusers, time.perf_counter() - start
+
+
+def summarize(vusers, wall_time):
+    """Percentiles et taux d'erreur par route."""
+    by_route = {}
+    for vuser in vusers:
+        for route, duration, error in vuser.samples:
+            by_route.setdefault(route, ([], {}))
+            durations, errors = by_route[route]
+            durations.append(duration)
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+    results = {}
+    for route, (durations, errors) in by_route.items():
+        stats = latency_stats(durations, wall_time)
+        n_errors = sum(errors.values())
+        stats.update({"errors": n_errors, "error_rate": round(n_errors / len(durations), 4), "error_types": errors})
+        results[route] = stats
+    return results
+
+
+def print_report(results, resources, standins, journeys, wall_time, baseline=None):
+    print(f"{'route':<22} {'n':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} "
+          f"{'erreurs':>8}  {'Δp95':>7}")
+    for route, r in results.items():
+        line = (f"{route:<22} {r['count']:>6} {r['throughput']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+                f"{r['p99_ms']:>9} {r['max_ms']:>9} {r['error_rate']:>8.2%}")
+        ref = (baseline or {}).get(route)
+        if ref:
+            line += f"  {(r['p95_ms'] / ref['p95_ms'] - 1):>+7.1%}"
+        print(line)
+        for kind, count in r['error_types'].items():
+            print(f"    {kind} : {count}")
+    print()
+    print(f"Parcours complets : {journeys} en {wall_time:.1f} s ({journeys / wall_time:.2f}/s)")
+    if resources:
+        print(f"Serveur ({resources['workers']} worker(s)) : CPU {resources['cpu_seconds']} s "
+              f"({resources['cpu_percent']} %), RSS max {resources['peak_rss_mb']} Mo, "
+              f"threads max {resources['peak_threads']}")
+    for s in standins:
+        print(f"Endpoint {s.name} : {s.requests} requêtes, {s.failures} échecs injectés")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10, help="Nombre d'utilisateurs simultanés")
+    parser.add_argument('--duration', type=float, default=30, help="Durée de la mesure (s), montée en charge exclue")
+    parser.add_argument('--journeys', type=int, help="Nombre maximal de parcours par utilisateur")
+    parser.add_argument('--ramp', type=float, default=0.0, help="Durée de montée en charge (s)")
+    parser.add_argument('--think', type=float, default=0.0, help="Temps de réflexion maximal entre deux étapes (s)")
+    parser.add_argument('--workers', type=int, default=1, help="Nombre de processus serveur")
+    parser.add_argument('--scale', default='small', help="small, medium, large ou un nombre d'items par endpoint")
+    parser.add_argument('--backend', default='rdflib', choices=['rdflib', 'oxigraph'],
+                        help="Moteur des endpoints de substitution (oxigraph nécessite pyoxigraph)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence injectée par requête SPARQL (s)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Variation aléatoire ajoutée à la latence (s)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Proportion de requêtes SPARQL en échec (503)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--server-log', help="Fichier recevant la sortie d'erreur des workers")
+    parser.add_argument('--baseline', help="Fichier de référence à comparer")
+    parser.add_argument('--save-baseline', help="Enregistre les résultats comme référence")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Régression tolérée sur le p95 (0.2 = 20%%)")
+    parser.add_argument('--json', help="Écrit les résultats détaillés dans ce fichier")
+    args = parser.parse_args()
+
+    datasets = build_datasets(args.scale, args.seed)
+    uris = sample_uris(datasets)
+    standins, endpoints = start_standins(datasets, latency=args.latency, jitter=args.jitter,
+                                         failure_rate=args.failure_rate, seed=args.seed, backend=args.backend)
+    log = open(args.server_log, 'ab') if args.server_log else None
+    workdir = tempfile.TemporaryDirectory()
+    servers = []
+    try:
+        # Les workers partagent le répertoire de sessions, comme derrière un répartiteur de charge
+        servers = [ServerProcess(endpoints, workdir.name, log) for _ in range(args.workers)]
+        for server in servers:
+            server.wait_ready()
+        sampler = ResourceSampler([s.proc.pid for s in servers]).start()
+        vusers, wall_time = run_load(servers, uris, args.users, args.duration, ramp=args.ramp,
+                                     think_time=args.think, journeys=args.journeys, seed=args.seed)
+        resources = sampler.stop()
+    finally:
+        for server in servers:
+            server.stop()
+        for standin in standins:
+            standin.stop()
+        workdir.cleanup()
+        if log:
+            log.close()
+
+    results = summarize(vusers, wall_time)
+    journeys = sum(v.journeys for v in vusers)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_report(results, resources, standins, journeys, wall_time, baseline)
+
+    report = {
+        "users": args.users,
+        "workers": args.workers,
+        "scale": args.scale,
+        "backend": args.backend,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "failure_rate": args.failure_rate,
+        "think": args.think,
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "wall_time": round(wall_time, 2),
+        "journeys": journeys,
+        "resources": resources,
+        "results": results
+    }
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Régressions (p95 > +{args.tolerance:.0%}) : {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmark reproductible des routes et helpers principaux sur des endpoints SPARQL locaux.
+
+Usage :
+    python benchmarks/run.py --scale small
+    python benchmarks/run.py --scale medium --save-baseline benchmarks/baseline_medium.json
+    python benchmarks/run.py --scale medium --baseline benchmarks/baseline_medium.json
+
+Le code de retour vaut 1 si une charge de travail régresse au-delà de la tolérance (p95), ou si l'une
+de ses opérations échoue (statut HTTP inattendu, réponse JSON `success` faux, exception) : une route
+en erreur répond vite et passerait sinon pour une accélération.
+"""
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import urllib.parse
+
+from common import BenchEnvironment, latency_stats
+from data import WORDS, PMO
+
+
+def check(response, status=200):
+    """Nombre d'erreurs de la réponse : statut inattendu, ou JSON d'échec (`success` faux, clé `error`)."""
+    if response.status_code != status:
+        return 1
+    payload = response.get_json(silent=True) if response.is_json else None
+    return int(isinstance(payload, dict) and (payload.get('success') is False or 'error' in payload))
+
+
+def build_workloads(env):
+    """
+    Charges de travail fixes : (nom, fonction exécutant une opération, nombre d'itérations par défaut).
+    Chaque opération retourne son nombre de réponses en erreur.
+    """
+    rng = random.Random(7)
+    items = env.sample_uris()
+    articles = env.sample_uris(rdf_type=PMO.Article)
+    client = env.app.app.test_client()
+
+    def search():
+        return check(client.get('/filter_results', query_string={'query_text': rng.choice(WORDS)}))
+
+    def explore():
+        uri = rng.choice(items)
+        return check(client.get('/update_resource/' + urllib.parse.quote(uri, safe='')), 302) \
+            + check(client.get('/explore'))
+
+    def execute_query():
+        filters = {"http://purl.org/dc/terms/subject": {"values": [[rng.choice(WORDS), "="]]}}
+        return check(client.post('/execute_query', json={'filters': filters, 'logic': 'AND'}))
+
+    def bulk_details():
+        env.sparql_queries.get_bulk_details(rng.sample(items, min(60, len(items))))
+        return 0
+
+    def export():
+        results = [{'SubjectURI': u} for u in rng.sample(items, min(30, len(items)))]
+        return check(client.post('/export/csv', json={'results': results}))
+
+    def ontology():
+        return check(client.get('/api/ontology/structure'))
+
+    def graph():
+        return check(client.post('/api/graph/explore', data={'uri': rng.choice(articles or items), 'depth': 2}))
+
+    return [
+        ("search", search, 20),
+        ("explore", explore, 20),
+        ("execute_query", execute_query, 20),
+        ("bulk_details", bulk_details, 10),
+        ("export", export, 10),
+        ("ontology", ontology, 3),
+        ("graph", graph, 20),
+    ]
+
+
+def run(env, only=None, iterations=None, warm=False):
+    results = {}
+    for name, op, default_iterations in build_workloads(env):
+        if only and name not in only:
+            continue
+        n = iterations or default_iterations
+        env.reset_caches()
+        errors = attempt(op)  # tour de chauffe (imports différés, connexions)
+        durations = []
+        wall_start = time.perf_counter()
+        for _ in range(n):
+            if not warm:
+                env.reset_caches()
+            start = time.perf_counter()
+            errors += attempt(op)
+            durations.append(time.perf_counter() - start)
+        results[name] = dict(latency_stats(durations, time.perf_counter() - wall_start), errors=errors)
+    return results
+
+
+def attempt(op):
+    try:
+        return op()
+    except Exception as e:
+        print(f"Opération en échec : {e}", file=sys.stderr)
+        return 1
+
+
+def failures(results):
+    """Charges dont au moins une opération a échoué : leurs durées ne sont pas comparables."""
+    return [name for name, r in results.items() if r.get('errors')]
+
+
+def print_results(results, baseline=None):
+    print(f"{'charge':<15} {'n':>4} {'err.':>4} {'ops/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  {'Δp50':>7} {'Δp95':>7}")
+    for name, r in results.items():
+        line = (f"{name:<15} {r['count']:>4} {r.get('errors', 0):>4} {r['throughput']:>8} {r['p50_ms']:>9} "
+                f"{r['p95_ms']:>9} {r['p99_ms']:>9}")
+        ref = (baseline or {}).get(name)
+        if ref:
+            line += f"  {(r['p50_ms'] / ref['p50_ms'] - 1):>+7.1%} {(r['p95_ms'] / ref['p95_ms'] - 1):>+7.1%}"
+        print(line)
+
+
+def compare(results, baseline, tolerance):
+    """Liste des charges en erreur ou dont le p95 dépasse la référence de plus de `tolerance`."""
+    return [name for name, r in results.items()
+            if r.get('errors') or (name in baseline and r['p95_ms'] > baseline[name]['p95_ms'] * (1 + tolerance))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='small', help="small, medium, large ou un nombre d'items par endpoint")
+    parser.add_argument('--only', nargs='*', help="Sous-ensemble de charges à exécuter")
+    parser.add_argument('--iterations', type=int, help="Nombre d'itérations par charge (sinon valeur par défaut)")
+    parser.add_argument('--warm', action='store_true', help="Conserve les caches applicatifs entre les itérations")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence injectée par requête SPARQL (s)")
+    parser.add_argument('--backend', default='rdflib', choices=['rdflib', 'oxigraph'],
+                        help="Moteur des endpoints de substitution (oxigraph nécessite pyoxigraph)")
+    parser.add_argument('--baseline', help="Fichier de référence à comparer")
+    parser.add_argument('--save-baseline', help="Enregistre les résultats comme référence")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Régression tolérée sur le p95 (0.2 = 20%%)")
+    parser.add_argument('--json', help="Écrit les résultats détaillés dans ce fichier")
+    args = parser.parse_args()
+
+    env = BenchEnvironment(args.scale, latency=args.latency, backend=args.backend)
+    try:
+        results = run(env, only=args.only, iterations=args.iterations, warm=args.warm)
+    finally:
+        env.close()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    report = {
+        "scale": args.scale,
+        "warm": args.warm,
+        "latency": args.latency,
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "results": results
+    }
+    failed = failures(results)
+    # Une référence enregistrée avec des erreurs ferait passer les routes en échec pour la norme
+    for path in (args.json, None if failed else args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+    if failed:
+        details = ', '.join(f"{name} ({results[name]['errors']})" for name in failed)
+        print(f"Opérations en erreur : {details}")
+        if args.save_baseline:
+            print(f"Référence non enregistrée : {args.save_baseline}")
+        sys.exit(1)
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Régressions (p95 > +{args.tolerance:.0%}) : {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
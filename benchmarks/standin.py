@@ -0,0 +1,217 @@
+"""
+Endpoints SPARQL locaux de substitution (protocole SPARQL 1.1 sur HTTP) adossés à un graphe rdflib.
+Ils remplacent les endpoints PatriMaths / Sciences Po pendant les benchmarks et tests de charge,
+avec une latence et un taux d'échec injectables.
+
+Le backend "oxigraph" (pyoxigraph, optionnel) évalue les requêtes hors du GIL : les mesures
+reflètent alors davantage le coût côté application que celui de l'évaluateur rdflib.
+Il accepte aussi les écritures (SPARQL 1.1 Update et Graph Store Protocol, graphes nommés), ce qui
+permet de tester le chargement des exports dans un triplestore ; les requêtes portent alors sur
+l'union des graphes.
+"""
+import time
+import random
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from rdflib.plugins.sparql import prepareQuery
+
+RESULT_TYPES = {
+    'json': 'application/sparql-results+json',
+    'turtle': 'text/turtle',
+    'nt': 'application/n-triples'
+}
+
+
+class StandInEndpoint:
+    """Serveur SPARQL local ; `url` est disponible après `start()`."""
+
+    # Le parseur SPARQL de rdflib (pyparsing) n'est pas thread-safe : l'analyse est sérialisée
+    _parse_lock = threading.Lock()
+
+    def __init__(self, graph, name="stand-in", latency=0.0, jitter=0.0, failure_rate=0.0, seed=None,
+                 backend="rdflib"):
+        self.graph = graph
+        self.backend = backend
+        self._store = None
+        if backend == "oxigraph":
+            import pyoxigraph
+            self._store = pyoxigraph.Store()
+            self._store.load(graph.serialize(format='nt').encode('utf-8'), format=pyoxigraph.RdfFormat.N_TRIPLES)
+        elif backend != "rdflib":
+            raise ValueError(f"Backend inconnu : {backend}")
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self.updates = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self.url = None
+
+    def start(self, host='127.0.0.1', port=0):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                endpoint._handle(self, 'GET', params, None)
+
+            def do_POST(self):
+                self._with_body('POST')
+
+            def do_PUT(self):
+                self._with_body('PUT')
+
+            def do_DELETE(self):
+                params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                endpoint._handle(self, 'DELETE', params, None)
+
+            def _with_body(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                if content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(urllib.parse.parse_qs(body.decode('utf-8')))
+                    body = None
+                endpoint._handle(self, method, params, body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}/sparql"
+        # Même serveur, chemins usuels (Fuseki) pour les écritures
+        self.update_url = f"http://{host}:{self._server.server_address[1]}/update"
+        self.data_url = f"http://{host}:{self._server.server_address[1]}/data"
+        threading.Thread(target=self._server.serve_forever, name=f"standin-{self.name}", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _delay_and_maybe_fail(self):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+            fail = self.failure_rate and self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay:
+            time.sleep(delay)
+        return fail
+
+    def _handle(self, handler, method, params, body):
+        if self._delay_and_maybe_fail():
+            self._send(handler, 503, 'text/plain', b'Injected failure')
+            return
+        content_type = handler.headers.get('Content-Type', '')
+        try:
+            if 'query' in params:
+                self._query(handler, params['query'][0])
+            elif body and content_type.startswith('application/sparql-query'):
+                self._query(handler, body.decode('utf-8'))
+            elif 'update' in params:
+                self._update(handler, params['update'][0])
+            elif body and content_type.startswith('application/sparql-update'):
+                self._update(handler, body.decode('utf-8'))
+            elif 'graph' in params or 'default' in params:
+                self._graph_store(handler, method, params.get('graph', [None])[0], body)
+            else:
+                self._send(handler, 400, 'text/plain', b'Missing query')
+        except Exception as e:
+            self._send(handler, 400, 'text/plain', str(e).encode('utf-8'))
+
+    def _writable_store(self, handler):
+        if self._store is None:
+            self._send(handler, 501, 'text/plain', b'Writes require the oxigraph backend')
+        return self._store
+
+    def _update(self, handler, update):
+        if self._writable_store(handler) is None:
+            return
+        self._store.update(update)
+        with self._lock:
+            self.updates += 1
+        self._send(handler, 204, 'text/plain', b'')
+
+    def _graph_store(self, handler, method, graph, body):
+        """Graph Store Protocol (GET, PUT, POST, DELETE) sur un graphe nommé (`graph`) ou le graphe par défaut."""
+        import pyoxigraph
+
+        if self._writable_store(handler) is None:
+            return
+        target = pyoxigraph.NamedNode(graph) if graph else pyoxigraph.DefaultGraph()
+        exists = graph is None or target in set(self._store.named_graphs())
+
+        if method == 'GET':
+            if not exists:
+                self._send(handler, 404, 'text/plain', b'Unknown graph')
+                return
+            self._send(handler, 200, RESULT_TYPES['nt'],
+                       self._store.dump(format=pyoxigraph.RdfFormat.N_TRIPLES, from_graph=target))
+            return
+        if method in ('PUT', 'DELETE'):
+            if method == 'DELETE' and not exists:
+                self._send(handler, 404, 'text/plain', b'Unknown graph')
+                return
+            if not graph:
+                self._store.clear_graph(target)
+            elif exists:
+                self._store.remove_graph(target)
+        if method in ('PUT', 'POST'):
+            content_type = handler.headers.get('Content-Type', RESULT_TYPES['nt']).split(';')[0].strip()
+            self._store.load(body or b'', format=pyoxigraph.RdfFormat.from_media_type(content_type), to_graph=target)
+        with self._lock:
+            self.updates += 1
+        self._send(handler, 201 if method != 'DELETE' and not exists else 204, 'text/plain', b'')
+
+    def _query(self, handler, query):
+        if self._store is not None:
+            self._query_oxigraph(handler, query)
+            return
+        with self._parse_lock:
+            prepared = prepareQuery(query)
+        result = self.graph.query(prepared)
+        if result.type in ('CONSTRUCT', 'DESCRIBE'):
+            accept = handler.headers.get('Accept', '')
+            fmt = 'nt' if 'n-triples' in accept else 'turtle'
+            self._send(handler, 200, RESULT_TYPES[fmt], result.serialize(format=fmt))
+        else:
+            self._send(handler, 200, RESULT_TYPES['json'], result.serialize(format='json'))
+
+    def _query_oxigraph(self, handler, query):
+        import pyoxigraph
+        result = self._store.query(query, use_default_graph_as_union=True)
+        if isinstance(result, pyoxigraph.QueryTriples):
+            accept = handler.headers.get('Accept', '')
+            fmt = 'nt' if 'n-triples' in accept else 'turtle'
+            rdf_format = pyoxigraph.RdfFormat.N_TRIPLES if fmt == 'nt' else pyoxigraph.RdfFormat.TURTLE
+            self._send(handler, 200, RESULT_TYPES[fmt], result.serialize(format=rdf_format))
+        else:
+            self._send(handler, 200, RESULT_TYPES['json'],
+                       result.serialize(format=pyoxigraph.QueryResultsFormat.JSON))
+
+    @staticmethod
+    def _send(handler, status, content_type, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+
+def start_standins(datasets, **options):
+    """Démarre un endpoint par jeu de données ; retourne la liste de configuration au format ENDPOINTS."""
+    standins = [StandInEndpoint(graph, name=name, **options).start() for name, graph in datasets.items()]
+    return standins, [{"name": s.name, "url": s.url} for s in standins]
@@ -0,0 +1,66 @@
+"""
+Benchmark du démarrage à froid : temps entre le lancement d'un worker et sa première réponse HTTP.
+
+Usage :
+    python benchmarks/startup.py --runs 10 --path /about
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import startup_profile
+from common import free_port
+
+WORKER = "import app; app.app.run(host='127.0.0.1', port={port}, debug=False, use_reloader=False)"
+
+
+def boot_to_first_response(path, timeout=60, warmup=True):
+    """Lance un worker dans un processus neuf et mesure le délai jusqu'à la première réponse 200."""
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT, SEMATHEQUE_SCHEMA_WARMUP='1' if warmup else '0')
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-c", WORKER.format(port=port)], cwd=workdir, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while time.perf_counter() - start < timeout:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as resp:
+                        if resp.status == 200:
+                            return time.perf_counter() - start
+                except OSError:
+                    time.sleep(0.005)
+            raise TimeoutError(f"Aucune réponse de {path} après {timeout}s")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/about')
+    parser.add_argument('--no-warmup', action='store_true', help="Désactive le préchauffage du registre de schéma")
+    parser.add_argument('--top', type=int, default=15, help="Nombre de paquets dans le résumé importtime")
+    args = parser.parse_args()
+
+    timings = [boot_to_first_response(args.path, warmup=not args.no_warmup) for _ in range(args.runs)]
+    timings.sort()
+    print(f"Démarrage -> première réponse ({args.path}, {args.runs} essais)")
+    print(f"  min    {timings[0] * 1000:8.1f} ms")
+    print(f"  médian {statistics.median(timings) * 1000:8.1f} ms")
+    print(f"  max    {timings[-1] * 1000:8.1f} ms")
+    print()
+    print(startup_profile.importtime_report(top=args.top))
+
+
+if __name__ == '__main__':
+    main()
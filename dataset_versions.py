@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from Constants import (
+    ENDPOINTS, DATASET_VERSION_CHECK_INTERVAL, DATASET_VERSION_STATE_PATH, DATASET_VERSION_TIMEOUT
+)
+from metrics import Counter, Gauge
+import embedded_store
+
+logger = logging.getLogger(__name__)
+
+# Tampon publié par les scripts d'export avec leurs données (script_Export_RDF/datasetVersion.py)
+VERSION_QUERY = """SELECT ?dataset ?version WHERE {
+  ?dataset a <http://rdfs.org/ns/void#Dataset> ; <http://purl.org/dc/terms/hasVersion> ?version
+}"""
+
+DATASET_INVALIDATIONS = Counter("dataset_version_changes_total",
+                                "Changements de version détectés (caches invalidés) par endpoint", ["endpoint"])
+
+
+class EndpointCache:
+    """
+    Cache LRU en mémoire dont chaque entrée est rattachée à un endpoint : un changement de version
+    de cet endpoint n'invalide que ses entrées, celles des autres endpoints restent chaudes.
+    """
+
+    def __init__(self, name, max_entries=2000):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, endpoint_url, key):
+        """Retourne (trouvé, valeur)."""
+        with self._lock:
+            try:
+                self._entries.move_to_end((endpoint_url, key))
+            except KeyError:
+                return False, None
+            return True, self._entries[(endpoint_url, key)]
+
+    def set(self, endpoint_url, key, value):
+        with self._lock:
+            self._entries[(endpoint_url, key)] = value
+            self._entries.move_to_end((endpoint_url, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, endpoint_url):
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == endpoint_url]
+            for k in keys:
+                del self._entries[k]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DatasetVersions:
+    """
+    Suivi de la version des données de chaque endpoint. Les scripts d'export publient un tampon
+    (hash du contenu exporté) sous forme de triplets `void:Dataset` / `dcterms:hasVersion`, ou d'un
+    manifeste JSON `dataset_version.json`. Le tampon est relu périodiquement ; quand il change, seuls
+    les caches rattachés à cet endpoint sont invalidés.
+
+    Source par endpoint (clé `version` de la configuration) : `{"url": ...}` (manifeste servi en HTTP),
+    `{"file": ...}` (manifeste local), `false` (pas de suivi) ; par défaut, requête SPARQL du tampon, ou
+    pour un endpoint embarqué, manifestes à côté de ses fichiers (le store est rechargé si ceux-ci changent).
+    """
+
+    def __init__(self, endpoints, check_interval=300, state_path=None, timeout=10):
+        self.check_interval = check_interval
+        self.state_path = state_path
+        self.timeout = timeout
+        self.sources = {ep['url']: ep.get('version', {}) for ep in endpoints if ep.get('version', {}) is not False}
+        self.names = {ep['url']: ep.get('name', ep['url']) for ep in endpoints}
+        self.versions = {}
+        self.changed_at = {}
+        self.checked_at = None
+        self.last_errors = {}
+        self._etags = {}
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._persisted = self._load_state()
+
+    def on_change(self, callback):
+        """`callback(endpoint_url)` est appelé quand la version d'un endpoint change."""
+        self._listeners.append(callback)
+
+    def register_cache(self, cache):
+        self.on_change(cache.invalidate)
+
+    def start(self):
+        if self._thread is not None or not self.sources:
+            return
+        self._thread = threading.Thread(target=self._run, name="dataset-versions", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        delay = 0
+        while not self._stop.wait(delay):
+            self.check()
+            delay = self.check_interval
+
+    def check(self):
+        """Relit le tampon de chaque endpoint ; retourne la liste des endpoints dont la version a changé."""
+        changed = []
+        for url, source in self.sources.items():
+            reloaded = False
+            try:
+                # Store embarqué : rechargé d'abord si un export a remplacé ses fichiers, pour que les
+                # caches invalidés ci-dessous soient reconstruits à partir des nouvelles données
+                if embedded_store.is_embedded(url):
+                    reloaded = embedded_store.reload_if_changed(url)
+                version = self._read_version(url, source)
+                self.last_errors.pop(url, None)
+            except Exception as e:
+                self.last_errors[url] = str(e)
+                logger.warning(f"Version des données de {self.names[url]} illisible : {e}")
+                continue
+            if version is None:
+                continue
+            # Premier relevé : comparé à la version connue au dernier arrêt (caches persistés, ex. schéma)
+            previous = self.versions.get(url, self._persisted.get(url))
+            self.versions[url] = version
+            if reloaded or (previous is not None and previous != version):
+                changed.append(url)
+        self.checked_at = time.time()
+
+        for url in changed:
+            self.changed_at[url] = self.checked_at
+            DATASET_INVALIDATIONS.inc(self.names[url])
+            logger.info(f"Nouvelle version des données de {self.names[url]} : {self.versions[url]}")
+            for callback in self._listeners:
+                try:
+                    callback(url)
+                except Exception as e:
+                    logger.warning(f"Invalidation après changement de version de {self.names[url]} en échec : {e}")
+        if changed or self._persisted != self.versions:
+            self._save_state()
+        return changed
+
+    def _read_version(self, url, source):
+        if source.get('url'):
+            return self._version_from_url(source['url'])
+        if source.get('file'):
+            with open(source['file'], 'r', encoding='utf-8') as f:
+                return json.load(f).get('version')
+        if embedded_store.is_embedded(url):
+            # Le tampon SPARQL d'un store embarqué n'est à jour qu'après son rechargement : manifeste lu sur disque
+            return embedded_store.manifest_version(url)
+        return self._version_from_query(url)
+
+    def _version_from_url(self, manifest_url):
+        """Manifeste HTTP relu avec If-None-Match : un manifeste inchangé ne coûte qu'une réponse 304."""
+        import requests
+
+        headers = {}
+        if manifest_url in self._etags:
+            headers['If-None-Match'] = self._etags[manifest_url][0]
+        response = requests.get(manifest_url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return self._etags[manifest_url][1]
+        response.raise_for_status()
+        try:
+            version = response.json().get('version')
+        except ValueError:
+            version = hashlib.sha256(response.content).hexdigest()
+        if response.headers.get('ETag'):
+            self._etags[manifest_url] = (response.headers['ETag'], version)
+        return version
+
+    def _version_from_query(self, url):
+        """Tampons `void:Dataset` de l'endpoint (tel qu'il est servi : distant ou miroir)."""
+        from sparql_queries import execute_single_query
+
+        df = execute_single_query(VERSION_QUERY, url, strict=True)
+        if df.empty:
+            return None
+        return "|".join(sorted(f"{row['dataset']}={row['version']}" for _, row in df.iterrows()))
+
+    def _load_state(self):
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        self._persisted = dict(self.versions)
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._persisted, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Impossible d'enregistrer les versions des données : {e}")
+
+    def version_key(self):
+        """
+        Versions connues de tous les endpoints, sous une forme stable d'un processus à l'autre ; None si
+        l'une est inconnue (suivi désactivé, pas encore relevée) : le contenu ne peut alors pas en être déduit.
+        """
+        versions = [self.versions.get(url) for url in self.names]
+        if any(version is None for version in versions):
+            return None
+        return "|".join(f"{url}={version}" for url, version in zip(self.names, versions))
+
+    def stats(self):
+        return [{
+            "name": self.names[url],
+            "source": source.get('url') or source.get('file') or "sparql",
+            "version": self.versions.get(url),
+            "changed_at": self.changed_at.get(url),
+            "checked_at": self.checked_at,
+            "last_error": self.last_errors.get(url)
+        } for url, source in self.sources.items()]
+
+
+dataset_versions = DatasetVersions(ENDPOINTS, DATASET_VERSION_CHECK_INTERVAL, DATASET_VERSION_STATE_PATH,
+                                   DATASET_VERSION_TIMEOUT)
+
+Gauge("dataset_version_age_seconds", "Temps écoulé depuis le dernier changement de version détecté", ["endpoint"],
+      callback=lambda: {(dataset_versions.names[url],): time.time() - at for url, at in dataset_versions.changed_at.items()})
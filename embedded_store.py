@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from Constants import ENDPOINTS, CONFIG_PATH
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+EMBEDDED_SCHEME = "embedded:"
+
+# Manifeste écrit par les scripts d'export à côté des fichiers (script_Export_RDF/datasetVersion.py)
+VERSION_MANIFEST = "dataset_version.json"
+
+RDFLIB_FORMATS = {
+    '.ttl': 'turtle', '.nt': 'nt', '.n3': 'n3', '.nq': 'nquads', '.trig': 'trig',
+    '.rdf': 'xml', '.xml': 'xml', '.owl': 'xml', '.jsonld': 'json-ld'
+}
+
+# Le parseur SPARQL de rdflib (pyparsing) n'est pas thread-safe
+_rdflib_parse_lock = threading.Lock()
+
+
+def _resolve(path):
+    """Chemins relatifs exprimés par rapport au fichier config.json."""
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(CONFIG_PATH)), path)
+
+
+def _oxigraph_value(term):
+    return None if term is None else term.value
+
+
+def _rdflib_value(term):
+    return None if term is None else str(term)
+
+
+class EmbeddedStore:
+    """
+    Triplestore indexé chargé dans le processus Flask à partir des fichiers produits par les scripts
+    d'export (items.ttl, medias.ttl, collections.ttl, items.ttl OAI). Les requêtes sont évaluées
+    directement, sans HTTP ni sérialisation JSON.
+
+    Avec pyoxigraph et un `store_path`, la base est persistée sur disque (RocksDB, fichiers projetés en
+    mémoire) : les fichiers sources ne sont ré-analysés que si leur taille ou leur date change.
+    Sans pyoxigraph, un graphe rdflib en mémoire est construit à chaque démarrage.
+    """
+
+    def __init__(self, name, files, store_path=None):
+        self.name = name
+        self.files = [_resolve(f) for f in files]
+        self.store_path = _resolve(store_path) if store_path else None
+        self.backend = None
+        self.loaded_at = None
+        self.load_duration = None
+        self.triples = None
+        self.fingerprint = None
+        self._store = None
+        self._graph = None
+
+    def _fingerprint(self):
+        fingerprint = {}
+        for path in self.files:
+            stat = os.stat(path)
+            fingerprint[path] = [stat.st_size, stat.st_mtime]
+        return fingerprint
+
+    def changed(self):
+        """Vrai si les fichiers sources ont changé (taille ou date) depuis l'ouverture du store."""
+        try:
+            return self.fingerprint is not None and self._fingerprint() != self.fingerprint
+        except OSError:
+            # Fichier en cours de remplacement : nouvel essai à la vérification suivante
+            return False
+
+    def open(self):
+        start = time.perf_counter()
+        self.fingerprint = self._fingerprint()
+        try:
+            import pyoxigraph
+        except ImportError:
+            pyoxigraph = None
+
+        if pyoxigraph is not None:
+            self._open_oxigraph(pyoxigraph)
+        else:
+            if self.store_path:
+                logger.warning(f"{self.name} : pyoxigraph absent, stockage persistant ignoré (graphe rdflib en mémoire)")
+            self._open_rdflib()
+        self.loaded_at = time.time()
+        self.load_duration = time.perf_counter() - start
+        self.triples = len(self._store) if self._store is not None else len(self._graph)
+        logger.info(f"Store embarqué {self.name} ({self.backend}, {self.triples} triplets) prêt en {self.load_duration:.2f}s")
+        return self
+
+    def _open_oxigraph(self, pyoxigraph):
+        self.backend = "oxigraph"
+        if not self.store_path:
+            self._store = pyoxigraph.Store()
+            self._load_files()
+            return
+
+        sources_path = f"{self.store_path}.sources.json"
+        fingerprint = self.fingerprint
+        try:
+            with open(sources_path, 'r', encoding='utf-8') as f:
+                up_to_date = json.load(f) == fingerprint
+        except (OSError, ValueError):
+            up_to_date = False
+
+        try:
+            self._store = pyoxigraph.Store(self.store_path)
+        except OSError:
+            # Base déjà ouverte en écriture par un autre worker : lecture seule
+            logger.info(f"{self.name} : base {self.store_path} verrouillée, ouverture en lecture seule")
+            self._store = pyoxigraph.Store.read_only(self.store_path)
+            return
+
+        if not up_to_date:
+            self._store.clear()
+            self._load_files()
+            self._store.flush()
+            with open(sources_path, 'w', encoding='utf-8') as f:
+                json.dump(fingerprint, f)
+
+    def _load_files(self):
+        for path in self.files:
+            logger.info(f"{self.name} : chargement de {path}")
+            self._store.bulk_load(path=path)
+
+    def _open_rdflib(self):
+        from rdflib import Graph
+
+        self.backend = "rdflib"
+        self._graph = Graph()
+        for path in self.files:
+            logger.info(f"{self.name} : chargement de {path}")
+            self._graph.parse(path, format=RDFLIB_FORMATS.get(os.path.splitext(path)[1].lower(), 'turtle'))
+
+    def query(self, query):
+        """Évalue une requête SELECT ; retourne (variables, lignes de valeurs) comme un endpoint distant."""
+        if self._store is not None:
+            import pyoxigraph
+            results = self._store.query(query)
+            if not isinstance(results, pyoxigraph.QuerySolutions):
+                return [], []
+            variables = [v.value for v in results.variables]
+            return variables, [[_oxigraph_value(solution[v]) for v in variables] for solution in results]
+
+        from rdflib.plugins.sparql import prepareQuery
+        with _rdflib_parse_lock:
+            prepared = prepareQuery(query)
+        results = self._graph.query(prepared)
+        if results.type != 'SELECT':
+            return [], []
+        variables = [str(v) for v in results.vars]
+        return variables, [[_rdflib_value(value) for value in row] for row in results]
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "files": self.files,
+            "store_path": self.store_path,
+            "triples": self.triples,
+            "loaded_at": self.loaded_at,
+            "load_duration_seconds": self.load_duration
+        }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+Gauge("embedded_store_triples", "Triplets chargés par store embarqué", ["endpoint"],
+      callback=lambda: {(s.name,): s.triples for s in list(_stores.values())})
+
+
+def is_embedded(endpoint_url):
+    return endpoint_url.startswith(EMBEDDED_SCHEME)
+
+
+def get_store(endpoint_url):
+    """Store embarqué associé à une URL `embedded:<nom>`, ouvert au premier accès."""
+    store = _stores.get(endpoint_url)
+    if store is not None:
+        return store
+    with _stores_lock:
+        if endpoint_url not in _stores:
+            ep = next((e for e in ENDPOINTS if e['url'] == endpoint_url), None)
+            if ep is None:
+                raise KeyError(f"Endpoint embarqué inconnu : {endpoint_url}")
+            _stores[endpoint_url] = EmbeddedStore(ep.get('name', endpoint_url), ep.get('files', []),
+                                                  ep.get('store_path')).open()
+        return _stores[endpoint_url]
+
+
+def reload_if_changed(endpoint_url):
+    """
+    Rouvre un store déjà ouvert dont les fichiers ont changé (nouvel export) ; le nouveau store remplace
+    l'ancien en une seule affectation, les requêtes en cours terminent sur l'ancien. La base persistante
+    est verrouillée par le processus qui l'a ouverte : le store rechargé est construit en mémoire, et la
+    base est reconstruite au prochain démarrage (ou par `python embedded_store.py`).
+    Retourne True si le store a été remplacé.
+    """
+    store = _stores.get(endpoint_url)
+    if store is None or not store.changed():
+        return False
+    with _stores_lock:
+        if _stores.get(endpoint_url) is not store:
+            return True
+        logger.info(f"{store.name} : fichiers modifiés, rechargement du store embarqué")
+        _stores[endpoint_url] = EmbeddedStore(store.name, store.files).open()
+    return True
+
+
+def manifest_version(endpoint_url):
+    """
+    Version des données d'un endpoint embarqué, lue dans les manifestes `dataset_version.json` placés à
+    côté de ses fichiers ; à défaut de manifeste, empreinte (taille, date) des fichiers.
+    """
+    ep = next((e for e in ENDPOINTS if e['url'] == endpoint_url), None)
+    if ep is None:
+        return None
+    files = [_resolve(f) for f in ep.get('files', [])]
+    versions = []
+    for directory in sorted({os.path.dirname(path) for path in files}):
+        manifest = os.path.join(directory, VERSION_MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest, 'r', encoding='utf-8') as f:
+                versions.append(str(json.load(f).get('version')))
+    if versions:
+        return "|".join(versions)
+    fingerprint = {path: [os.stat(path).st_size, os.stat(path).st_mtime] for path in files if os.path.exists(path)}
+    return json.dumps(fingerprint, sort_keys=True) if fingerprint else None
+
+
+def open_all():
+    """Ouvre (et charge si nécessaire) tous les stores embarqués configurés."""
+    return [get_store(ep['url']) for ep in ENDPOINTS if is_embedded(ep['url'])]
+
+
+def stores_status():
+    return [store.stats() for store in _stores.values()]
+
+
+if __name__ == '__main__':
+    # Préparation des bases persistantes hors du serveur (ex : après un export)
+    for store in open_all():
+        print(json.dumps(store.stats(), ensure_ascii=False))
@@ -0,0 +1,131 @@
+import logging
+
+import Constants
+from Constants import ENDPOINTS, SEARCH_FACET_PROPERTIES, SEARCH_FACET_LIMIT
+import tracing
+from sparql_queries import (
+    _query_pool, execute_single_query, build_label_selection, extract_label_from_uri, get_classes,
+    normalize_search_text, resolve_resource_type, search_pattern
+)
+
+logger = logging.getLogger(__name__)
+
+TOTAL_QUERY = "{prefix} SELECT (COUNT(DISTINCT ?subject) AS ?count) WHERE {{ {pattern} }}"
+TYPE_QUERY = """{prefix} SELECT ?value (COUNT(DISTINCT ?subject) AS ?count) WHERE {{ {pattern} ?subject a ?value . }} GROUP BY ?value"""
+PROPERTY_QUERY = """{prefix} SELECT ?value (SAMPLE(?valueLabel) AS ?label) (COUNT(DISTINCT ?subject) AS ?count) WHERE {{ {pattern} ?subject <{prop}> ?value . {labels} BIND({label} AS ?valueLabel) }} GROUP BY ?value ORDER BY DESC(?count) LIMIT {limit}"""
+
+
+def _count(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class FacetRequest:
+    """Requêtes de facettes soumises au pool SPARQL ; `result()` attend et agrège les comptes des endpoints."""
+
+    def __init__(self, engine, text, type_uri, futures):
+        self.engine = engine
+        self.text = text
+        self.type_uri = type_uri
+        self.futures = futures
+
+    def result(self):
+        total = 0
+        types = {}
+        values = {prop: {} for prop in self.engine.properties}
+        partial = []
+        totals_complete = True
+        for (kind, prop, name), future in self.futures:
+            try:
+                df = future.result()
+            except Exception as e:
+                logger.warning(f"Facette {kind} indisponible sur {name} : {e}")
+                if name not in partial:
+                    partial.append(name)
+                if kind == "total":
+                    totals_complete = False
+                continue
+            for _, row in df.iterrows():
+                if kind == "total":
+                    total += _count(row.get('count'))
+                elif kind == "type":
+                    types[row['value']] = types.get(row['value'], 0) + _count(row.get('count'))
+                else:
+                    entry = values[prop].setdefault(row['value'], {"value": row['value'], "label": None, "count": 0})
+                    entry["count"] += _count(row.get('count'))
+                    entry["label"] = entry["label"] or row.get('label') or None
+
+        class_labels = {c['uri']: c['label'] for c in get_classes(wait=False)}
+        return {
+            "query": self.text,
+            "type": self.type_uri,
+            "total": total,
+            "types": sorted(({"uri": uri, "label": class_labels.get(uri, extract_label_from_uri(uri)), "count": count}
+                             for uri, count in types.items()), key=lambda t: (-t['count'], t['label'])),
+            "properties": [{
+                "uri": prop,
+                "label": extract_label_from_uri(prop),
+                "values": [dict(v, label=v['label'] or extract_label_from_uri(v['value']))
+                           for v in sorted(values[prop].values(), key=lambda v: -v['count'])[:self.engine.limit]]
+            } for prop in self.engine.properties],
+            "partial": partial,
+            # Total incomplet : un endpoint n'a pas répondu
+            "approximate": not totals_complete
+        }
+
+    def unavailable(self):
+        """Facettes vides, quand leur agrégation échoue : la page de résultats reste affichée."""
+        return {"query": self.text, "type": self.type_uri, "total": 0, "types": [],
+                "properties": [{"uri": prop, "label": extract_label_from_uri(prop), "values": []}
+                               for prop in self.engine.properties],
+                "partial": [ep.get('name', ep['url']) for ep in self.engine.endpoints], "approximate": True}
+
+
+class FacetEngine:
+    """
+    Comptes de la recherche plein texte calculés par les endpoints (COUNT / GROUP BY) au lieu de
+    télécharger tous les résultats : total des ressources, ressources par type et valeurs les plus
+    fréquentes des propriétés configurées (`search.facet_properties`).
+
+    Les requêtes partent en parallèle, pendant la requête de la page de résultats. Elles sont écrites à
+    partir du texte normalisé et mises en cache par endpoint (cache des résultats SPARQL, invalidé avec
+    la version des données de l'endpoint). Les comptes des endpoints sont additionnés, les endpoints
+    publiant des ressources d'espaces d'URI distincts ; le total n'est marqué approximatif
+    (`approximate`) que si un endpoint n'a pas répondu. Le palmarès des valeurs est fusionné à partir des
+    `limit` premières valeurs de chaque endpoint.
+    """
+
+    def __init__(self, endpoints, properties, limit=10):
+        self.endpoints = endpoints
+        self.properties = properties
+        self.limit = limit
+
+    def queries(self, text, type_uri=None):
+        pattern = search_pattern(text, type_uri)
+        opt_labels, coal_label = build_label_selection("?value", "?valueLabel", "_fct")
+        # La facette des types ignore le filtre de type : les autres types restent proposés avec leurs comptes
+        queries = [("total", None, TOTAL_QUERY.format(prefix=Constants.CUSTOM_PREFIX, pattern=pattern)),
+                   ("type", None, TYPE_QUERY.format(prefix=Constants.CUSTOM_PREFIX, pattern=search_pattern(text)))]
+        for prop in self.properties:
+            queries.append(("property", prop, PROPERTY_QUERY.format(
+                prefix=Constants.CUSTOM_PREFIX, pattern=pattern, prop=prop, labels=opt_labels, label=coal_label, limit=self.limit)))
+        return queries
+
+    def submit(self, text, resource_type=None):
+        """Lance les requêtes de facettes sans attendre ; retourne une FacetRequest."""
+        text = normalize_search_text(text)
+        type_uri = resolve_resource_type(resource_type)
+        futures = [
+            ((kind, prop, ep.get('name', ep['url'])),
+             tracing.submit(_query_pool, execute_single_query, query, ep['url'], True, True))
+            for kind, prop, query in self.queries(text, type_uri) for ep in self.endpoints
+        ]
+        return FacetRequest(self, text, type_uri, futures)
+
+    def facets(self, text, resource_type=None):
+        return self.submit(text, resource_type).result()
+
+
+facet_engine = FacetEngine(ENDPOINTS, SEARCH_FACET_PROPERTIES, SEARCH_FACET_LIMIT)
@@ -0,0 +1,284 @@
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import Constants
+from Constants import ENDPOINTS, SPARQL_POOL_SIZE, BIND_JOIN_BATCH_SIZE, MAX_INTERMEDIATE_RESULTS
+from metrics import Counter
+import tracing
+from sparql_queries import (
+    _query_pool, execute_single_query, build_sparql_query, build_label_selection,
+    filter_patterns
+)
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de ressources retournées, comme la requête monolithique
+RESULT_LIMIT = 1000
+
+# Une ligne suffit : la sonde est mise en cache par endpoint et invalidée avec la version des données
+PROBE_QUERY = "SELECT ?s WHERE {{ ?s <{prop}> ?o }} LIMIT 1"
+
+IRI_TERM = re.compile(r'^[A-Za-z][\w+.-]*:[^\s<>"{}|\\^`]*$')
+
+# Les lots d'une jointure attendent les requêtes qu'ils soumettent au pool SPARQL : pool distinct
+_join_pool = ThreadPoolExecutor(max_workers=SPARQL_POOL_SIZE, thread_name_prefix="bind-join")
+
+FEDERATED_PLANS = Counter("federated_plans_total", "Requêtes de filtrage par stratégie d'exécution", ["strategy"])
+
+
+def _values(subjects):
+    return f"VALUES ?subject {{ {' '.join(f'<{s}>' for s in subjects)} }}"
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class FilterPart:
+    """Filtre d'une propriété, évalué seul sur les endpoints qui détiennent cette propriété."""
+
+    def __init__(self, prop_uri, pattern, sources):
+        self.prop_uri = prop_uri
+        self.pattern = pattern
+        self.sources = sources
+
+    @property
+    def selective(self):
+        """Motif résolu par les index (IRI, VALUES) plutôt que par un FILTER sur toutes les valeurs."""
+        return "FILTER(" not in self.pattern
+
+    def rank(self):
+        return (not self.selective, len(self.sources))
+
+    def query(self, subjects=None, limit=None):
+        values = f"{_values(subjects)} " if subjects else ""
+        limit_clause = f" LIMIT {limit}" if limit else ""
+        return f"{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?subject WHERE {{ {values}{self.pattern} }}{limit_clause}"
+
+
+class FederatedPlanner:
+    """
+    Exécution fédérée des filtres de l'explorateur. La requête monolithique exige que toutes les
+    propriétés filtrées d'une ressource soient sur le même endpoint, et chaque endpoint l'évalue
+    entièrement. Le planificateur découpe les filtres par propriété et sonde les endpoints qui
+    détiennent chacune :
+    - aucun filtre, ou logique OU : la requête monolithique n'est envoyée qu'aux endpoints concernés ;
+    - une propriété absente de tous les endpoints (logique ET) : résultat vide, sans requête ;
+    - sinon (logique ET), jointure : le filtre le plus sélectif est évalué seul sur ses endpoints, puis
+      ses sujets sont envoyés aux autres filtres par lots `VALUES ?subject` (bind join), jusqu'à
+      RESULT_LIMIT ressources. Un filtre seul, ou tous les filtres sur un même endpoint (« pruned »),
+      suivent le même chemin.
+    Dans les deux cas de la logique ET, une ressource doit être typée sur au moins un endpoint, si bien
+    qu'ajouter un filtre ne peut qu'écarter des ressources. Les endpoints en erreur pendant l'exécution
+    sont listés dans `partial` : le résultat est alors incomplet.
+    """
+
+    def __init__(self, endpoints, batch_size=200, max_intermediate=10000, limit=RESULT_LIMIT):
+        self.endpoints = endpoints
+        self.batch_size = batch_size
+        self.max_intermediate = max_intermediate
+        self.limit = limit
+
+    def _names(self, urls):
+        names = {ep['url']: ep.get('name', ep['url']) for ep in self.endpoints}
+        return [names.get(url, url) for url in urls]
+
+    def plan(self, filters_dict, logic="AND", rewrite=None):
+        """Retourne (plan, filtres ordonnés, endpoints interrogés) ; le plan est un dictionnaire sérialisable."""
+        patterns = filter_patterns(filters_dict, rewrite)
+        probes = {
+            prop_uri: [(ep['url'], tracing.submit(_query_pool, execute_single_query, PROBE_QUERY.format(prop=prop_uri),
+                                                  ep['url'], True, True)) for ep in self.endpoints]
+            for prop_uri, _ in patterns
+        }
+        unprobed = set()
+        parts = [
+            FilterPart(prop_uri, pattern, [url for url, future in probes[prop_uri] if self._holds(url, future, unprobed)])
+            for prop_uri, pattern in patterns
+        ]
+
+        all_urls = [ep['url'] for ep in self.endpoints]
+        if not parts:
+            strategy, targets = "broadcast", all_urls
+        elif logic == "OR":
+            targets = [url for url in all_urls if any(url in part.sources for part in parts)]
+            strategy = "pruned" if targets else "empty"
+        elif any(not part.sources for part in parts):
+            strategy, targets = "empty", []
+        else:
+            targets = sorted({url for part in parts for url in part.sources}, key=all_urls.index)
+            strategy = "pruned" if len(parts) == 1 or len(targets) == 1 else "join"
+            parts.sort(key=FilterPart.rank)
+
+        plan = {
+            "strategy": strategy,
+            "logic": logic,
+            "endpoints": self._names(targets),
+            "parts": [{"property": part.prop_uri, "endpoints": self._names(part.sources), "selective": part.selective}
+                      for part in parts],
+            "unprobed": self._names([ep['url'] for ep in self.endpoints if ep['url'] in unprobed]),
+            "partial": [],
+            "truncated": False,
+            "queries": []
+        }
+        return plan, parts, targets
+
+    @staticmethod
+    def _holds(url, probe, unprobed):
+        """
+        Vrai si l'endpoint détient la propriété sondée. Un endpoint dont la sonde échoue (délai,
+        erreur HTTP) est conservé comme source : son absence ne doit pas vider le résultat.
+        """
+        try:
+            return not probe.result().empty
+        except Exception as e:
+            logger.warning(f"Sonde en échec sur {url}, endpoint conservé : {e}")
+            unprobed.add(url)
+            return True
+
+    def execute(self, filters_dict, logic="AND", rewrite=None):
+        """Exécute les filtres ; retourne (DataFrame ?subject / ?subjectLabel, plan)."""
+        import pandas as pd
+
+        plan, parts, targets = self.plan(filters_dict, logic, rewrite)
+        FEDERATED_PLANS.inc(plan['strategy'])
+        if plan['strategy'] == "empty":
+            return pd.DataFrame(), plan
+        failed = set()
+        if not parts or logic == "OR":
+            query = build_sparql_query(filters_dict, logic, rewrite)
+            plan['queries'] = [{"endpoints": plan['endpoints'], "query": query}]
+            dataframes = [df for df in self._collect(self._submit(query, targets), failed) if not df.empty]
+            df = pd.concat(dataframes, ignore_index=True).drop_duplicates() if dataframes else pd.DataFrame()
+        else:
+            subjects, plan['truncated'], bound = self._join(parts, failed)
+            for entry, part in zip(plan['parts'], parts):
+                entry['join'] = "bind" if part in bound else "local"
+                entry['query'] = (f"# Par lots de {self.batch_size} sujets candidats (VALUES ?subject)\n{part.query()}"
+                                  if part in bound else part.query(limit=self.max_intermediate))
+            plan['queries'] = [{"endpoints": entry['endpoints'], "query": entry['query']} for entry in plan['parts']]
+            df = self._labels(subjects, failed)
+        plan['partial'] = self._names([ep['url'] for ep in self.endpoints if ep['url'] in failed])
+        return df, plan
+
+    @staticmethod
+    def _submit(query, urls):
+        return [(url, tracing.submit(_query_pool, execute_single_query, query, url, True, True)) for url in urls]
+
+    @staticmethod
+    def _collect(futures, failed):
+        """Résultats des endpoints ; un endpoint en erreur est ajouté à `failed` au lieu de vider le résultat."""
+        results = []
+        for url, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.warning(f"Requête fédérée en échec sur {url}, résultat incomplet : {e}")
+                failed.add(url)
+        return results
+
+    def _first_round(self, parts, failed):
+        """Chaque filtre évalué seul, en parallèle sur ses endpoints ; retourne (sujets, complets) par filtre."""
+        futures = {part: self._submit(part.query(limit=self.max_intermediate), part.sources) for part in parts}
+        subjects = {}
+        complete = {}
+        for part in parts:
+            subjects[part], complete[part] = [], True
+            for df in self._collect(futures[part], failed):
+                if df.empty:
+                    continue
+                if len(df) >= self.max_intermediate:
+                    complete[part] = False
+                subjects[part].extend(df['subject'])
+        return subjects, complete
+
+    def _join(self, parts, failed):
+        """
+        Le filtre le plus sélectif est évalué seul, borné à `max_intermediate` sujets, et ses sujets sont
+        appliqués aux autres filtres par bind join. S'il est tronqué, les autres filtres sont évalués en
+        parallèle : les filtres complets sont joints localement (intersection, dans l'ordre du plus
+        sélectif) et seuls les filtres tronqués sont appliqués par bind join.
+        Retourne (sujets, tronqué, filtres appliqués par bind join).
+        """
+        subjects, complete = self._first_round(parts[:1], failed)
+        exact = parts[:1]
+        truncated = False
+        if not complete[parts[0]]:
+            more_subjects, more_complete = self._first_round(parts[1:], failed)
+            subjects.update(more_subjects)
+            complete.update(more_complete)
+            exact = [part for part in parts if complete[part]]
+            truncated = not exact
+            if truncated:
+                # Aucun filtre complet : on part des sujets (tronqués) du plus sélectif
+                logger.warning(f"Résultats intermédiaires tronqués à {self.max_intermediate} sujets pour "
+                               f"<{parts[0].prop_uri}>")
+                exact = parts[:1]
+        candidates = list(dict.fromkeys(s for s in subjects[exact[0]] if IRI_TERM.match(str(s))))
+        for part in exact[1:]:
+            matched = set(subjects[part])
+            candidates = [s for s in candidates if s in matched]
+
+        remaining = [part for part in parts if part not in exact]
+        if not remaining:
+            return candidates[:self.limit], truncated, remaining
+        return self._bind_join(candidates, remaining, failed), truncated, remaining
+
+    def _bind_join(self, candidates, parts, failed):
+        """Lots de sujets candidats appliqués aux filtres restants, en parallèle ; arrêt à `limit` sujets."""
+        pending = {tracing.submit(_join_pool, self._join_batch, batch, parts, failed)
+                   for batch in _batches(candidates, self.batch_size)}
+        found = []
+        for future in as_completed(pending):
+            found.extend(future.result())
+            if len(found) >= self.limit:
+                break
+        for future in pending:
+            future.cancel()
+        return found[:self.limit]
+
+    def _join_batch(self, subjects, parts, failed):
+        """Sujets d'un lot qui satisfont aussi les filtres suivants, sur n'importe lequel de leurs endpoints."""
+        for part in parts:
+            matched = set()
+            for df in self._collect(self._submit(part.query(subjects), part.sources), failed):
+                if not df.empty:
+                    matched.update(df['subject'])
+            subjects = [s for s in subjects if s in matched]
+            if not subjects:
+                break
+        return subjects
+
+    def _labels(self, subjects, failed):
+        """
+        Labels des sujets retenus, cherchés sur tous les endpoints. Seules les ressources typées sur au
+        moins un endpoint sont retournées, quel que soit l'endpoint où les filtres ont été satisfaits.
+        """
+        import pandas as pd
+
+        if not subjects:
+            return pd.DataFrame()
+        opt_labels, coal_label = build_label_selection("?subject", "?subjectLabel", "_m")
+        all_urls = [ep['url'] for ep in self.endpoints]
+        futures = [
+            future
+            for batch in _batches(subjects, self.batch_size)
+            for future in self._submit(
+                f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?subject ?subjectLabel ?typed WHERE {{ {_values(batch)} {opt_labels} BIND({coal_label} AS ?subjectLabel) BIND(EXISTS {{ ?subject a ?type }} AS ?typed) }}""",
+                all_urls)
+        ]
+        labels = {}
+        typed = set()
+        for df in self._collect(futures, failed):
+            for _, row in df.iterrows():
+                if str(row.get('typed')).lower() == 'true':
+                    typed.add(row['subject'])
+                if row.get('subjectLabel') and not labels.get(row['subject']):
+                    labels[row['subject']] = row['subjectLabel']
+        rows = [[s, labels.get(s, '')] for s in subjects if s in typed]
+        return pd.DataFrame(rows, columns=['subject', 'subjectLabel']) if rows else pd.DataFrame()
+
+
+federated_planner = FederatedPlanner(ENDPOINTS, BIND_JOIN_BATCH_SIZE, MAX_INTERMEDIATE_RESULTS)
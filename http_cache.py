@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import logging
+
+from flask import current_app, g, request
+
+from Constants import (
+    HTTP_CACHE_ENABLED, HTTP_CACHE_POLICIES, HTTP_CACHE_VERSIONED_ROUTES, HTTP_COMPRESSION_MIN_SIZE,
+    HTTP_COMPRESSION_LEVEL
+)
+from metrics import Counter
+from dataset_versions import dataset_versions
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = {
+    "application/json", "text/html", "text/csv", "text/plain", "text/css",
+    "application/javascript", "text/javascript", "image/svg+xml"
+}
+
+# Suffixes des ETags des représentations compressées : une ETag forte identifie des octets précis
+ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gz"}
+
+HTTP_BYTES_SAVED = Counter("http_bytes_saved_total",
+                           "Octets non envoyés par route (304 Not Modified, compression)", ["route", "reason"])
+HTTP_EARLY_NOT_MODIFIED = Counter("http_early_not_modified_total",
+                                  "Réponses 304 rendues sans exécuter la route (ETag des versions de données)", ["route"])
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "inconnue"
+
+
+def _base_etag(etag):
+    for suffix in ENCODING_SUFFIXES.values():
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)]
+    return etag
+
+
+def _not_modified(etag):
+    """Vrai si l'une des ETags de If-None-Match désigne la même ressource, quelle que soit son encodage."""
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return False
+    if if_none_match.star_tag:
+        return True
+    return any(_base_etag(tag) == etag for tag in if_none_match.as_set())
+
+
+def _preferred_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return "br"
+    if accepted['gzip']:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=min(HTTP_COMPRESSION_LEVEL, 11))
+    return gzip.compress(data, compresslevel=HTTP_COMPRESSION_LEVEL)
+
+
+def _error_payload(response):
+    """
+    Réponse JSON d'échec (`success` faux ou clé `error`) renvoyée avec le statut 200 par les routes de
+    l'API, ou incomplète (`partial` non vide : endpoint sans réponse).
+    """
+    if not response.is_json:
+        return False
+    payload = response.get_json(silent=True)
+    return isinstance(payload, dict) and (payload.get('success') is False or 'error' in payload
+                                          or bool(payload.get('partial')))
+
+
+def version_etag(route):
+    """
+    ETag d'une route de HTTP_CACHE_VERSIONED_ROUTES, calculée sans exécuter la route : route, paramètres
+    normalisés (triés) et versions des données de tous les endpoints. None si une version est inconnue.
+    """
+    versions = dataset_versions.version_key()
+    if versions is None:
+        return None
+    params = "&".join(f"{key}={value}" for key, values in sorted(request.args.lists()) for value in values)
+    return hashlib.sha1(f"{route}?{params}#{versions}".encode('utf-8')).hexdigest()
+
+
+def check_not_modified():
+    """
+    Avant la route : si le navigateur détient la version courante (mêmes données, mêmes paramètres),
+    répond 304 sans exécuter la route ni ses requêtes SPARQL.
+    """
+    route = _route()
+    if request.method not in ("GET", "HEAD") or route not in HTTP_CACHE_POLICIES \
+            or route not in HTTP_CACHE_VERSIONED_ROUTES:
+        return None
+    etag = version_etag(route)
+    if etag is None:
+        return None
+    g.version_etag = etag
+    if not _not_modified(etag):
+        return None
+    HTTP_EARLY_NOT_MODIFIED.inc(route)
+    response = current_app.response_class(status=304)
+    response.headers.pop('Content-Type', None)
+    response.headers['Cache-Control'] = HTTP_CACHE_POLICIES[route]
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    return response
+
+
+def apply_validators(response):
+    """
+    ETag forte et réponse 304 si le navigateur détient déjà cette version ; politique Cache-Control
+    de la route. L'ETag est celle de la route si elle en fournit une, sinon celle des versions des
+    données (`check_not_modified`), et à défaut le hash du contenu. Les réponses d'erreur ou
+    incomplètes ne sont pas mises en cache.
+    """
+    route = _route()
+    policy = HTTP_CACHE_POLICIES.get(route)
+    if policy is None or request.method not in ("GET", "HEAD") or response.status_code != 200 \
+            or response.direct_passthrough or response.is_streamed:
+        return response
+    if _error_payload(response):
+        # Une erreur passagère (endpoint indisponible) ne doit pas être conservée ni revalidée
+        response.headers['Cache-Control'] = "no-store"
+        return response
+
+    response.headers['Cache-Control'] = policy
+    data = response.get_data()
+    etag, _ = response.get_etag()
+    if not etag:
+        etag = g.get('version_etag') or hashlib.sha1(data).hexdigest()
+        response.set_etag(etag)
+    if _not_modified(etag):
+        HTTP_BYTES_SAVED.inc(route, "not_modified", amount=len(data))
+        response.status_code = 304
+        response.set_data(b"")
+        # Un 304 ne porte pas de corps ni d'en-têtes de contenu
+        for header in ('Content-Type', 'Content-Length'):
+            response.headers.pop(header, None)
+    return response
+
+
+def compress(response):
+    """Compression gzip (ou brotli si le module est installé) des réponses textuelles au-delà du seuil."""
+    if response.mimetype not in COMPRESSIBLE_TYPES or response.direct_passthrough or response.is_streamed \
+            or response.status_code < 200 or response.status_code in (204, 304) \
+            or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _preferred_encoding()
+    data = response.get_data()
+    if encoding is None or len(data) < HTTP_COMPRESSION_MIN_SIZE:
+        return response
+
+    compressed = _compress(data, encoding)
+    if len(compressed) >= len(data):
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + ENCODING_SUFFIXES[encoding], weak)
+    HTTP_BYTES_SAVED.inc(_route(), encoding, amount=len(data) - len(compressed))
+    return response
+
+
+def init_app(app):
+    """
+    Enregistre la validation avant la route et les traitements de fin de requête. À appeler après les
+    autres `before_request` / `after_request` de l'application : la validation s'exécute après le
+    démarrage de la trace, et Flask exécutant les `after_request` dans l'ordre inverse, les métriques
+    voient la taille envoyée.
+    """
+    if not HTTP_CACHE_ENABLED:
+        return
+
+    app.before_request(check_not_modified)
+
+    @app.after_request
+    def http_cache_response(response):
+        try:
+            return compress(apply_validators(response))
+        except Exception as e:
+            logger.warning(f"Cache HTTP / compression ignorés pour {request.path} : {e}")
+            return response
@@ -0,0 +1,159 @@
+import threading
+
+from Constants import METRICS_ENABLED
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labels, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _metrics.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Compteur monotone (ex : erreurs par type, octets reçus)."""
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Valeur instantanée ; `callback` permet de la calculer au moment de l'export."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, *labels, value):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        lines = self._header()
+        if self.callback:
+            try:
+                values = self.callback()
+            except Exception:
+                values = {}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Histogramme à compartiments cumulés (latences, tailles de réponse)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, *labels, value):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = [(labels, list(entry[0]), entry[1], entry[2]) for labels, entry in sorted(self._values.items())]
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def render_metrics():
+    """Export au format texte Prometheus de toutes les métriques déclarées."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Couche SPARQL
+SPARQL_LATENCY = Histogram("sparql_query_duration_seconds", "Durée des requêtes SPARQL par endpoint", ["endpoint"])
+SPARQL_RESPONSE_BYTES = Histogram("sparql_response_bytes", "Taille des réponses SPARQL par endpoint",
+                                  ["endpoint"], buckets=SIZE_BUCKETS)
+SPARQL_ROWS = Counter("sparql_rows_total", "Lignes retournées par endpoint", ["endpoint"])
+SPARQL_ERRORS = Counter("sparql_errors_total", "Erreurs SPARQL par endpoint et par type", ["endpoint", "type"])
+SPARQL_INFLIGHT = Gauge("sparql_queries_in_flight",
+                        "Requêtes SPARQL en cours d'exécution (endpoints distants, embarqués et miroirs, hors cache)")
+
+# Routes Flask
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Durée de traitement par route", ["route", "method", "status"])
+HTTP_RESPONSE_BYTES = Counter("http_response_bytes_total", "Octets envoyés par route", ["route"])
+
+# Caches applicatifs
+CACHE_REQUESTS = Counter("cache_requests_total", "Accès aux caches applicatifs", ["cache", "result"])
@@ -0,0 +1,300 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from Constants import (
+    ENDPOINTS, MIRROR_DIRECTORY, MIRROR_INTERVAL, MIRROR_MAX_STALENESS, MIRROR_PAGE_SIZE,
+    MIRROR_CHECK_INTERVAL, MIRROR_SYNC_IN_APP, MIRROR_TIMEOUT
+)
+from embedded_store import EmbeddedStore
+from metrics import Counter, Gauge
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+NTRIPLES_TYPES = ('application/n-triples', 'text/plain')
+
+PAGE_QUERY = """CONSTRUCT {{ ?s ?p ?o }} WHERE {{
+  {{ SELECT ?s ?p ?o WHERE {{ ?s ?p ?o }} ORDER BY ?s ?p ?o LIMIT {limit} OFFSET {offset} }}
+}}"""
+
+COUNT_QUERY = "SELECT (COUNT(*) AS ?count) WHERE { ?s ?p ?o }"
+
+MIRROR_SYNC_FAILURES = Counter("mirror_sync_failures_total", "Synchronisations de miroir en échec", ["endpoint"])
+
+
+def _slug(name):
+    return re.sub(r'[^\w-]+', '_', name).strip('_') or 'endpoint'
+
+
+@contextmanager
+def _process_lock(path):
+    """Verrou de fichier non bloquant partagé par les workers : donne False s'il est déjà pris."""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class EndpointMirror:
+    """
+    Copie locale des données d'un endpoint distant : un instantané N-Triples sur disque
+    (`<répertoire>/<nom>.nt` et ses métadonnées `<nom>.json`) chargé dans un store embarqué indexé.
+    La synchronisation écrit un nouveau fichier puis le store est reconstruit et remplacé en une
+    seule affectation ; en cas d'échec, l'ancien miroir reste en service.
+    """
+
+    def __init__(self, endpoint, directory, page_size=10000, timeout=300, max_staleness=3 * 86400):
+        self.endpoint = endpoint
+        self.name = endpoint.get('name', endpoint['url'])
+        self.url = endpoint['url']
+        self.dump_url = endpoint.get('dump_url')
+        self.page_size = page_size
+        self.timeout = timeout
+        self.max_staleness = max_staleness
+        self.data_path = os.path.join(directory, f"{_slug(self.name)}.nt")
+        self.meta_path = os.path.join(directory, f"{_slug(self.name)}.json")
+        self.lock_path = os.path.join(directory, f"{_slug(self.name)}.lock")
+        if self.dump_url:
+            ext = os.path.splitext(self.dump_url.split('?')[0])[1] or '.nt'
+            self.data_path = os.path.join(directory, f"{_slug(self.name)}{ext}")
+        self.store = None
+        self.synced_at = None
+        self.sync_duration = None
+        self.triples = None
+        self.last_error = None
+        self._loaded_generation = None
+        self._sync_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def staleness(self):
+        return time.time() - self.synced_at if self.synced_at else None
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def reload(self):
+        """Recharge l'instantané si un autre processus (ou une synchronisation) en a écrit un plus récent."""
+        meta = self._read_meta()
+        if meta is None or meta.get('synced_at') == self._loaded_generation or not os.path.exists(self.data_path):
+            return False
+        store = EmbeddedStore(f"miroir {self.name}", [self.data_path]).open()
+        self.store = store
+        self.synced_at = meta['synced_at']
+        self.sync_duration = meta.get('duration')
+        self.triples = store.triples
+        self._loaded_generation = meta['synced_at']
+        return True
+
+    def sync(self, max_age=None):
+        """
+        Télécharge l'intégralité des données de l'endpoint puis recharge le miroir. Un seul processus
+        synchronise à la fois (verrou de fichier) ; les autres rechargent ensuite son instantané. Avec
+        `max_age`, la synchronisation est abandonnée si l'instantané (éventuellement écrit par un autre
+        worker entre-temps) est plus récent.
+        """
+        with self._sync_lock, _process_lock(self.lock_path) as acquired:
+            if not acquired:
+                logger.info(f"Miroir {self.name} : synchronisation déjà en cours dans un autre processus")
+                return False
+            self.reload()
+            staleness = self.staleness()
+            if max_age is not None and staleness is not None and staleness < max_age:
+                return True
+            start = time.perf_counter()
+            tmp_path = f"{self.data_path}.{os.getpid()}.tmp"
+            try:
+                if self.dump_url:
+                    self._download_dump(tmp_path)
+                else:
+                    self._fetch_pages(tmp_path)
+                os.replace(tmp_path, self.data_path)
+            except Exception as e:
+                self.last_error = str(e)
+                MIRROR_SYNC_FAILURES.inc(self.name)
+                logger.warning(f"Synchronisation du miroir {self.name} en échec : {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return False
+
+            meta = {'synced_at': time.time(), 'duration': time.perf_counter() - start, 'source': self.dump_url or self.url}
+            meta_tmp = f"{self.meta_path}.{os.getpid()}.tmp"
+            with open(meta_tmp, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(meta_tmp, self.meta_path)
+            self.last_error = None
+            self.reload()
+            logger.info(f"Miroir {self.name} synchronisé : {self.triples} triplets en {meta['duration']:.1f}s")
+            return True
+
+    def _download_dump(self, path):
+        import requests
+
+        with requests.get(self.dump_url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+
+    def _fetch_pages(self, path):
+        """CONSTRUCT paginé (ordre stable) ; chaque page N-Triples est ajoutée telle quelle au fichier."""
+        import requests
+
+        offset = 0
+        total = 0
+        with requests.Session() as http, open(path, 'wb') as f:
+            while True:
+                response = http.post(
+                    self.url,
+                    data={'query': PAGE_QUERY.format(limit=self.page_size, offset=offset)},
+                    headers={'Accept': 'application/n-triples'},
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '')
+                if content_type.startswith(NTRIPLES_TYPES):
+                    page = response.content
+                else:
+                    page = self._to_ntriples(response.content, content_type)
+                count = sum(1 for line in page.splitlines() if line.strip() and not line.startswith(b'#'))
+                # Fin des données sur une page vide seulement : un endpoint peut plafonner ses réponses
+                # sous `page_size` (ResultSetMaxRows de Virtuoso) ; la page suivante reprend après ses lignes
+                if count == 0:
+                    break
+                f.write(page if page.endswith(b'\n') else page + b'\n')
+                offset += count
+                total += count
+            expected = self._count(http)
+            if expected is not None and total < expected:
+                raise RuntimeError(f"instantané incomplet : {total} triplets reçus sur {expected}")
+
+    def _count(self, http):
+        """Nombre de triplets annoncé par l'endpoint ; None s'il ne sait pas répondre."""
+        try:
+            response = http.post(self.url, data={'query': COUNT_QUERY},
+                                 headers={'Accept': 'application/sparql-results+json'}, timeout=self.timeout)
+            response.raise_for_status()
+            return int(response.json()['results']['bindings'][0]['count']['value'])
+        except Exception as e:
+            logger.warning(f"Miroir {self.name} : comptage des triplets impossible ({e})")
+            return None
+
+    @staticmethod
+    def _to_ntriples(content, content_type):
+        """Certains endpoints ignorent l'en-tête Accept : la page est convertie via rdflib."""
+        from rdflib import Graph
+
+        fmt = 'xml' if 'rdf+xml' in content_type else 'json-ld' if 'json' in content_type else 'turtle'
+        return Graph().parse(data=content, format=fmt).serialize(format='nt', encoding='utf-8')
+
+    def serves(self):
+        """Le miroir répond si l'instantané est chargé et pas trop ancien."""
+        staleness = self.staleness()
+        return self.store is not None and staleness is not None and staleness <= self.max_staleness
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "routing": "mirror" if self.serves() else "live",
+            "source": self.dump_url or self.url,
+            "synced_at": self.synced_at,
+            "staleness_seconds": self.staleness(),
+            "last_sync_duration_seconds": self.sync_duration,
+            "triples": self.triples,
+            "last_error": self.last_error
+        }
+
+
+class MirrorManager:
+    """Miroirs des endpoints configurés avec `"routing": "mirror"` et leur tâche de synchronisation."""
+
+    def __init__(self, endpoints, directory, interval=86400, check_interval=60, sync_in_app=True,
+                 page_size=10000, timeout=300, max_staleness=3 * 86400):
+        self.interval = interval
+        self.check_interval = check_interval
+        self.sync_in_app = sync_in_app
+        self.mirrors = {
+            ep['url']: EndpointMirror(ep, directory, page_size, timeout, max_staleness)
+            for ep in endpoints if ep.get('routing') == 'mirror' and ep.get('type') != 'embedded'
+        }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def store_for(self, endpoint_url):
+        """Store du miroir à interroger pour cet endpoint, None s'il faut interroger l'endpoint distant."""
+        mirror = self.mirrors.get(endpoint_url)
+        if mirror is None or not mirror.serves():
+            return None
+        return mirror.store
+
+    def start(self):
+        if self._thread is not None or not self.mirrors:
+            return
+        self._thread = threading.Thread(target=self._run, name="mirror-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        delay = 0
+        while not self._stop.wait(delay):
+            self.check()
+            delay = self.check_interval
+
+    def check(self):
+        """Recharge les instantanés écrits par ailleurs puis synchronise les miroirs échus."""
+        for mirror in self.mirrors.values():
+            try:
+                mirror.reload()
+            except Exception as e:
+                logger.warning(f"Rechargement du miroir {mirror.name} impossible : {e}")
+            staleness = mirror.staleness()
+            if self.sync_in_app and (staleness is None or staleness >= self.interval):
+                mirror.sync(max_age=self.interval)
+
+    def sync_all(self):
+        return {mirror.name: mirror.sync() for mirror in self.mirrors.values()}
+
+    def stats(self):
+        return [mirror.stats() for mirror in self.mirrors.values()]
+
+
+mirrors = MirrorManager(ENDPOINTS, MIRROR_DIRECTORY, MIRROR_INTERVAL, MIRROR_CHECK_INTERVAL, MIRROR_SYNC_IN_APP,
+                        MIRROR_PAGE_SIZE, MIRROR_TIMEOUT, MIRROR_MAX_STALENESS)
+
+Gauge("mirror_staleness_seconds", "Âge de l'instantané de chaque miroir", ["endpoint"],
+      callback=lambda: {(m.name,): m.staleness() for m in mirrors.mirrors.values()})
+Gauge("mirror_triples", "Triplets chargés par miroir", ["endpoint"],
+      callback=lambda: {(m.name,): m.triples for m in mirrors.mirrors.values()})
+Gauge("mirror_sync_duration_seconds", "Durée de la dernière synchronisation de chaque miroir", ["endpoint"],
+      callback=lambda: {(m.name,): m.sync_duration for m in mirrors.mirrors.values()})
+Gauge("mirror_serving", "1 si les requêtes sont servies par le miroir, 0 si par l'endpoint distant", ["endpoint"],
+      callback=lambda: {(m.name,): int(m.serves()) for m in mirrors.mirrors.values()})
+
+
+if __name__ == '__main__':
+    # Synchronisation hors du serveur (cron) : les workers rechargent l'instantané à la vérification suivante
+    for name, ok in mirrors.sync_all().items():
+        print(f"{name} : {'ok' if ok else 'échec'}")
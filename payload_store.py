@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PayloadStore:
+    """
+    Stockage serveur borné des charges volumineuses (résultats, graphes, visualisations).
+    Chaque charge est écrite dans un fichier JSON identifié par un UUID : la session
+    ne conserve que cet identifiant. Les fichiers expirent après `ttl` secondes et le
+    nombre total d'entrées est limité à `max_entries` (les plus anciennes sont supprimées).
+    """
+
+    def __init__(self, directory, ttl=7200, max_entries=500, purge_interval=300):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, payload_id):
+        # L'identifiant vient de la session : on n'accepte qu'un UUID pour éviter toute traversée de chemin
+        try:
+            payload_id = str(uuid.UUID(str(payload_id)))
+        except ValueError:
+            return None
+        return os.path.join(self.directory, f"{payload_id}.json")
+
+    def put(self, data, payload_id=None):
+        """Enregistre une charge et retourne son identifiant (réutilise `payload_id` s'il est valide)."""
+        self.purge()
+        file_path = self._path(payload_id) if payload_id else None
+        if not file_path:
+            payload_id = str(uuid.uuid4())
+            file_path = self._path(payload_id)
+
+        tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, file_path)
+        return os.path.basename(file_path)[:-len('.json')]
+
+    def get(self, payload_id, default=None):
+        """Retourne la charge associée à l'identifiant, ou `default` si elle est absente ou expirée."""
+        file_path = self._path(payload_id) if payload_id else None
+        if not file_path:
+            return default
+        try:
+            if os.path.getmtime(file_path) < time.time() - self.ttl:
+                os.remove(file_path)
+                return default
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def delete(self, payload_id):
+        """Supprime une charge si elle existe."""
+        file_path = self._path(payload_id) if payload_id else None
+        if file_path:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+    def purge(self, force=False):
+        """Supprime les charges expirées puis les plus anciennes au-delà de `max_entries`."""
+        now = time.time()
+        if not force and now - self._last_purge < self.purge_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._last_purge = now
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                    # Fichiers temporaires abandonnés ou charges expirées
+                    if mtime < now - self.ttl:
+                        os.remove(entry.path)
+                    elif entry.name.endswith('.json'):
+                        entries.append((mtime, entry.path))
+                except OSError:
+                    pass
+
+            if len(entries) > self.max_entries:
+                entries.sort()
+                for _, file_path in entries[:len(entries) - self.max_entries]:
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        pass
+        except OSError as e:
+            logger.warning(f"Purge du stockage {self.directory} impossible : {e}")
+        finally:
+            self._lock.release()
@@ -0,0 +1,127 @@
+import re
+
+from Constants import FILTER_LANGUAGES
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+INTEGER_PATTERN = re.compile(r'^[+-]?\d+$')
+DECIMAL_PATTERN = re.compile(r'^[+-]?(\d+\.\d*|\.\d+)$')
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+DATETIME_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+IRI_PATTERN = re.compile(r'^https?://[^\s<>"{}|\\^`]+$')
+
+
+def sparql_literal(value):
+    """Littéral SPARQL entre guillemets, caractères spéciaux échappés."""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'))
+    return f'"{escaped}"'
+
+
+def is_iri(value):
+    return bool(IRI_PATTERN.match(str(value)))
+
+
+def range_clause(var, value, op):
+    """
+    Comparaison d'ordre (`<`, `>`). Les scripts d'export écrivent des littéraux simples ("1890") :
+    la valeur de la propriété est convertie (xsd:decimal) pour un nombre, et les dates ISO sont
+    comparées sur leur forme lexicale, ce qui couvre à la fois les littéraux simples et typés.
+    Seule la valeur saisie est écrite comme constante typée.
+    """
+    value = str(value).strip()
+    if INTEGER_PATTERN.match(value) or DECIMAL_PATTERN.match(value):
+        return f'<{XSD}decimal>({var}) {op} {sparql_literal(value)}^^<{XSD}decimal>'
+    return f'STR({var}) {op} {sparql_literal(value)}'
+
+
+def term_variants(value):
+    """
+    Termes RDF pouvant représenter une valeur saisie pour une égalité exacte : l'IRI elle-même, ou le
+    littéral simple, ses variantes étiquetées dans les langues configurées et, pour un nombre ou une
+    date, ses formes typées.
+    """
+    if is_iri(value):
+        return [f"<{value}>"]
+    value = str(value)
+    literal = sparql_literal(value)
+    variants = [literal] + [f"{literal}@{lang}" for lang in FILTER_LANGUAGES]
+    stripped = value.strip()
+    if INTEGER_PATTERN.match(stripped):
+        variants += [f'{sparql_literal(stripped)}^^<{XSD}{t}>' for t in ("integer", "int", "gYear")]
+    elif DECIMAL_PATTERN.match(stripped):
+        variants += [f'{sparql_literal(stripped)}^^<{XSD}{t}>' for t in ("decimal", "double")]
+    elif DATE_PATTERN.match(stripped):
+        variants.append(f'{sparql_literal(stripped)}^^<{XSD}date>')
+    elif DATETIME_PATTERN.match(stripped):
+        variants.append(f'{sparql_literal(stripped)}^^<{XSD}dateTime>')
+    return list(dict.fromkeys(variants))
+
+
+def filter_clause(var, value, op):
+    """
+    Condition FILTER d'un opérateur qui ne peut pas s'exprimer par un motif de triplet. Seuls `=i`
+    et `contient` ignorent la casse (LCASE(STR())).
+    """
+    if op == "=i":
+        return f"LCASE(STR({var})) = {sparql_literal(str(value).lower())}"
+    if op == "contient":
+        return f"CONTAINS(LCASE(STR({var})), {sparql_literal(str(value).lower())})"
+    if op == "!=":
+        if is_iri(value):
+            return f"{var} != <{value}>"
+        return f"STR({var}) != {sparql_literal(value)}"
+    if op in (">", "<"):
+        return range_clause(var, value, op)
+    return ""
+
+
+def property_pattern(prop_uri, var, values):
+    """
+    Motif de groupe d'une propriété filtrée. Les valeurs d'une même propriété sont combinées en OU :
+    - une seule IRI attendue est placée dans le motif de triplet (`?subject <p> <iri>`) ;
+    - les autres égalités exactes forment un bloc VALUES, résolu par les index du triplestore ;
+    - les autres opérateurs restent dans un FILTER, dans une branche UNION séparée si besoin ;
+    - `non_null` (la propriété existe) englobe toutes les autres valeurs.
+    Retourne None si aucune valeur n'est exploitable.
+    """
+    exact = []
+    clauses = []
+    for val, op in values:
+        if op == "non_null":
+            return f"?subject <{prop_uri}> {var} ."
+        if op == "=":
+            exact.extend(term_variants(val))
+        else:
+            clause = filter_clause(var, val, op)
+            if clause:
+                clauses.append(clause)
+    exact = list(dict.fromkeys(exact))
+
+    branches = []
+    if len(exact) == 1 and exact[0].startswith("<"):
+        branches.append(f"?subject <{prop_uri}> {exact[0]} .")
+    elif exact:
+        branches.append(f"VALUES {var} {{ {' '.join(exact)} }} ?subject <{prop_uri}> {var} .")
+    if clauses:
+        branches.append(f"?subject <{prop_uri}> {var} . FILTER({' || '.join(clauses)})")
+
+    if not branches:
+        return None
+    if len(branches) == 1:
+        return branches[0]
+    return " UNION ".join(f"{{ {branch} }}" for branch in branches)
+
+
+def rewrite_filters(filters_dict):
+    """
+    Motifs de groupe (un par propriété filtrée) des filtres de l'explorateur. Les motifs sans FILTER,
+    les plus sélectifs, viennent en premier : les moteurs qui évaluent les motifs dans l'ordre écrit
+    (rdflib) partent ainsi des quelques sujets correspondants plutôt que de toutes les ressources.
+    """
+    conditions = []
+    for var_counter, (prop_uri, filter_data) in enumerate(filters_dict.items(), 1):
+        pattern = property_pattern(prop_uri, f"?val{var_counter}", filter_data.get('values', []))
+        if pattern:
+            conditions.append(pattern)
+    return sorted(conditions, key=lambda pattern: "FILTER(" in pattern)
@@ -0,0 +1,158 @@
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import Constants
+from Constants import ENDPOINTS, LABEL_PROPERTIES, RESOURCE_VIEW_CACHE_ENTRIES
+from metrics import Gauge, CACHE_REQUESTS
+import tracing
+from dataset_versions import dataset_versions
+from sparql_queries import _query_pool, execute_single_query, build_label_selection
+from utils import format_property_name
+
+logger = logging.getLogger(__name__)
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+
+# Une seule requête par endpoint : le label et les types du sujet sont des lignes comme les autres
+VIEW_QUERY = """{prefix} SELECT ?property ?value ?valueLabel WHERE {{ <{uri}> ?property ?value . {labels} BIND({label} AS ?valueLabel) }} LIMIT {limit}"""
+
+ResourceRow = namedtuple("ResourceRow", ["property", "property_label", "value", "value_label"])
+
+
+class ResourceView(namedtuple("ResourceView", ["uri", "label", "types", "rows"])):
+    """
+    Vue assemblée d'une ressource (propriétés, valeurs et leurs labels, types, label du sujet),
+    partagée par /explore, /api/resource_details et le panneau de l'ontologie. Immuable : la même
+    instance est servie depuis le cache à toutes les requêtes ; les méthodes retournent des copies.
+    """
+    __slots__ = ()
+
+    @property
+    def metadata(self):
+        return {
+            "label": self.label or "Inconnu",
+            "type": self.types[0][0].split('/')[-1] if self.types else "Resource",
+            "uri": self.uri
+        }
+
+    def properties(self):
+        """Propriétés affichables (hors `hidden_properties`), dans l'ordre de première apparition."""
+        seen = {}
+        for row in self.rows:
+            if row.property_label and row.property not in seen:
+                seen[row.property] = {'uri': row.property, 'label': row.property_label}
+        return list(seen.values())
+
+    def filters(self):
+        """Filtres préremplis de l'explorateur : première valeur de chaque propriété affichable."""
+        filters = {}
+        for row in self.rows:
+            if row.property_label and row.property not in filters:
+                filters[row.property] = [(row.value_label, "=")] if row.value_label else []
+        return filters
+
+    def details(self):
+        return [{
+            'Property': row.property,
+            'PropertyLabel': row.property_label or row.property.split('/')[-1].split('#')[-1],
+            'Value': row.value,
+            'ValueLabel': row.value_label
+        } for row in self.rows]
+
+
+def _label_priority():
+    props = list(LABEL_PROPERTIES)
+    if RDFS_LABEL not in props:
+        props.append(RDFS_LABEL)
+    return props
+
+
+class ResourceViews:
+    """
+    Cache LRU des vues de ressources, par URI. Une vue manquante est assemblée à partir d'une
+    requête par endpoint, envoyées en parallèle ; le résultat de chaque endpoint est aussi conservé
+    dans le cache des résultats SPARQL. Après un changement de version des données, les vues sont
+    vidées et seul l'endpoint modifié est réinterrogé. Une vue incomplète (endpoint en erreur) n'est
+    pas conservée.
+    """
+
+    def __init__(self, endpoints, max_entries=500, limit=1000):
+        self.endpoints = endpoints
+        self.max_entries = max_entries
+        self.limit = limit
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def query(self, uri):
+        opt_labels, coal_label = build_label_selection("?value", "?valueLabel", "_det")
+        return VIEW_QUERY.format(prefix=Constants.CUSTOM_PREFIX, uri=uri, labels=opt_labels, label=coal_label, limit=self.limit)
+
+    def get(self, uri):
+        """Vue de la ressource `uri` (avec ou sans chevrons)."""
+        uri = uri.strip().strip('<>')
+        with self._lock:
+            view = self._views.get(uri)
+            if view is not None:
+                self._views.move_to_end(uri)
+        CACHE_REQUESTS.inc("resource_view", "hit" if view is not None else "miss")
+        tracing.record_cache("resource_view", view is not None)
+        if view is not None:
+            return view
+
+        view, complete = self.fetch(uri)
+        if complete:
+            with self._lock:
+                self._views[uri] = view
+                while len(self._views) > self.max_entries:
+                    self._views.popitem(last=False)
+        return view
+
+    def fetch(self, uri):
+        """Assemble la vue ; retourne (vue, tous les endpoints ont répondu)."""
+        query = self.query(uri)
+        futures = [(ep.get('name', ep['url']), tracing.submit(_query_pool, execute_single_query, query, ep['url'], True, True))
+                   for ep in self.endpoints]
+        rows = {}
+        complete = True
+        for name, future in futures:
+            try:
+                df = future.result()
+            except Exception as e:
+                logger.warning(f"Détails de {uri} indisponibles sur {name} : {e}")
+                complete = False
+                continue
+            for _, row in df.iterrows():
+                prop, value = row.get('property'), row.get('value')
+                if prop is None or value is None:
+                    continue
+                label = str(row.get('valueLabel') or '').strip()
+                # Une valeur à plusieurs labels (langues) ne donne qu'une ligne
+                if (prop, value) not in rows or not rows[(prop, value)]:
+                    rows[(prop, value)] = label
+        return self._assemble(uri, rows), complete
+
+    @staticmethod
+    def _assemble(uri, rows):
+        view_rows = tuple(ResourceRow(prop, format_property_name(prop), value, label or value)
+                          for (prop, value), label in rows.items())
+        label = None
+        for label_prop in _label_priority():
+            label = next((row.value for row in view_rows if row.property == label_prop and row.value), None)
+            if label:
+                break
+        types = tuple((row.value, row.value_label) for row in view_rows if row.property == RDF_TYPE)
+        return ResourceView(uri, label, types, view_rows)
+
+    def invalidate(self, endpoint_url=None):
+        with self._lock:
+            self._views.clear()
+
+    def __len__(self):
+        return len(self._views)
+
+
+resource_views = ResourceViews(ENDPOINTS, RESOURCE_VIEW_CACHE_ENTRIES)
+dataset_versions.on_change(resource_views.invalidate)
+Gauge("resource_view_cache_entries", "Vues de ressources assemblées en cache", callback=lambda: {(): len(resource_views)})
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import logging
+import threading
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaRegistry:
+    """
+    Registre du schéma (classes, propriétés, préfixes) rafraîchi en arrière-plan.
+    Chaque rafraîchissement construit un nouvel instantané immuable qui remplace l'ancien
+    en une seule affectation : les lectures ne prennent aucun verrou. Si un chargeur échoue,
+    la valeur précédente est conservée et un nouvel essai est programmé plus tôt.
+    """
+
+    def __init__(self, loaders, ttl=3600, retry_interval=60, snapshot_path=None):
+        self.loaders = loaders
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.snapshot_path = snapshot_path
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_refresh = None
+        self.last_refresh_duration = None
+        self.last_error = None
+        self.refresh_count = 0
+        self.failure_count = 0
+
+    def get(self, name, default=None, wait=True):
+        """Lecture sans verrou ; seul le tout premier appel attend un chargement s'il n'y a aucun instantané."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            if not wait:
+                return default
+            self.refresh(only_if_missing=True)
+            snapshot = self._snapshot or {}
+        return snapshot.get(name, default)
+
+    def refresh(self, only_if_missing=False):
+        """Recharge toutes les entrées ; retourne False si au moins un chargeur a échoué."""
+        with self._refresh_lock:
+            if only_if_missing and self._snapshot is not None:
+                return True
+
+            start = time.perf_counter()
+            previous = self._snapshot or {}
+            data = {}
+            complete = True
+            for name, loader in self.loaders.items():
+                try:
+                    data[name] = loader()
+                except Exception as e:
+                    complete = False
+                    self.last_error = f"{name}: {e}"
+                    logger.warning(f"Rafraîchissement du schéma incomplet ({name}) : {e}")
+                    if name in previous:
+                        data[name] = previous[name]
+
+            self._snapshot = MappingProxyType(data)
+            self.last_refresh_duration = time.perf_counter() - start
+            self.refresh_count += 1
+            if complete:
+                self.last_refresh = time.time()
+                self.last_error = None
+                self._save_snapshot(data)
+            else:
+                self.failure_count += 1
+            return complete
+
+    def start(self):
+        """Charge l'instantané persistant s'il existe puis lance le rafraîchissement périodique."""
+        if self._thread is not None:
+            return
+        self._load_snapshot()
+        self._thread = threading.Thread(target=self._run, name="schema-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        delay = 0
+        if self._snapshot is not None and self.last_refresh:
+            delay = max(0, self.ttl - (time.time() - self.last_refresh))
+        while not self._stop.wait(delay):
+            delay = self.ttl if self.refresh() else self.retry_interval
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            self._snapshot = MappingProxyType(stored['data'])
+            self.last_refresh = stored['generated_at']
+            logger.info(f"Schéma chargé depuis {self.snapshot_path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Instantané de schéma illisible ({self.snapshot_path}) : {e}")
+
+    def _save_snapshot(self, data):
+        if not self.snapshot_path:
+            return
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'generated_at': self.last_refresh, 'data': data}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Impossible d'enregistrer l'instantané de schéma : {e}")
+
+    def stats(self):
+        """Métriques du registre : fraîcheur, durée du dernier rafraîchissement, erreurs."""
+        staleness = time.time() - self.last_refresh if self.last_refresh else None
+        return {
+            "ready": self._snapshot is not None,
+            "last_refresh": self.last_refresh,
+            "staleness_seconds": staleness,
+            "last_refresh_duration_seconds": self.last_refresh_duration,
+            "refresh_count": self.refresh_count,
+            "failure_count": self.failure_count,
+            "last_error": self.last_error,
+            "ttl": self.ttl
+        }
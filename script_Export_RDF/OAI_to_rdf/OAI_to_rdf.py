@@ -1,12 +1,32 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import argparse
+import html
+import json
+import os
+import queue
+import re
+import sys
+import tempfile
+import threading
+import time
 import requests
 import logging
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from triplesCreation import *
 from constants import *
 
+# Le chargement dans le triplestore est commun avec l'export Omeka
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from graphStoreLoader import GraphStoreLoader
+from datasetVersion import writeDatasetVersion, VERSION_FILE
+
 def configureLogging():
     """Log simple dans un fichier local."""
     logging.basicConfig(
@@ -20,63 +40,439 @@ def configureLogging():
     console.setLevel(logging.INFO)
     logging.getLogger('').addHandler(console)
 
-def harvestOAI():
-    """Boucle de moissonnage OAI avec gestion du resumptionToken et limite de sécurité."""
-    graph = initializeRDFdatabase()
-    
-    request_url = f"{OAI_ENDPOINT}?verb=ListRecords&metadataPrefix={METADATA_PREFIX}"
-    token = None
-    call_count = 0
-
-    while True:
-        # Vérification de la limite de batch
-        if MAX_BATCHES and call_count >= MAX_BATCHES:
-            logging.info(f"Limite de {MAX_BATCHES} batchs atteinte. Arrêt.")
-            break
-
-        logging.info(f"Récupération batch {call_count + 1}...")
-        
+def createSession():
+    """Session HTTP réutilisée, avec nouvelles tentatives espacées (erreurs réseau, 429, 5xx)."""
+    retry = Retry(total=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR,
+                  status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+    # Une connexion par producteur de pages (un par set moissonné simultanément)
+    adapter = HTTPAdapter(pool_connections=SET_WORKERS, pool_maxsize=SET_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def loadJSON(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def saveJSON(path, data):
+    """Écriture atomique : un arrêt brutal laisse l'ancienne version intacte."""
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+OAI_TAG = '{' + XML_NS['oai'] + '}'
+TOKEN_PATTERN = re.compile(rb'<(?:\w+:)?resumptionToken\b[^>]*?(?:/>|>([^<]*)</(?:\w+:)?resumptionToken>)')
+TOKEN_SEARCH_SIZE = 65536
+
+class OAIError(Exception):
+    """Erreur renvoyée par l'entrepôt dans la réponse OAI-PMH (élément error)."""
+
+class RateLimiter:
+    """Intervalle minimal entre deux requêtes vers l'entrepôt, partagé par tous les moissonnages en cours."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next - now
+            self.next = max(now, self.next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+def identify(session):
+    """Granularité des datestamps et politique de suppression déclarées par l'entrepôt (verbe Identify)."""
+    response = session.get(OAI_ENDPOINT, params={'verb': 'Identify'}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    root = ET.fromstring(response.content)
+    granularity = root.findtext('oai:Identify/oai:granularity', 'YYYY-MM-DD', XML_NS)
+    deleted_record = root.findtext('oai:Identify/oai:deletedRecord', 'no', XML_NS)
+    return granularity, deleted_record
+
+def parseListRecords(stream, sink):
+    """
+    Analyse incrémentale (iterparse) d'une réponse ListRecords : les triplets de chaque oai:record sont
+    émis dès la fin de l'élément, qui est ensuite vidé et détaché de l'arbre.
+    Retourne un dictionnaire : nombre d'enregistrements, identifiants supprimés, resumptionToken,
+    date de la réponse et erreur OAI éventuelle (code, message).
+    """
+    page = {'records': 0, 'deleted': [], 'token': None, 'responseDate': None, 'error': None}
+    list_records = None
+
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == OAI_TAG + 'ListRecords':
+                list_records = element
+            continue
+
+        if element.tag == OAI_TAG + 'record':
+            header = element.find('oai:header', XML_NS)
+            try:
+                if header is not None and header.get('status') == 'deleted':
+                    page['deleted'].append(header.findtext('oai:identifier', None, XML_NS))
+                else:
+                    page['records'] += createRecordTriples(element, sink)
+            except:
+                logging.exception("Erreur traitement record")
+            element.clear()
+            if list_records is not None:
+                list_records.remove(element)
+        elif element.tag == OAI_TAG + 'resumptionToken':
+            page['token'] = element.text.strip() if element.text and element.text.strip() else None
+        elif element.tag == OAI_TAG + 'responseDate':
+            page['responseDate'] = element.text.strip()
+        elif element.tag == OAI_TAG + 'error':
+            page['error'] = (element.get('code'), element.text)
+
+    return page
+
+def listSets(session):
+    """setSpec de tous les sets de l'entrepôt (verbe ListSets, paginé par resumptionToken)."""
+    specs = []
+    params = {'verb': 'ListSets'}
+    while params:
+        response = session.get(OAI_ENDPOINT, params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+        error = root.find('oai:error', XML_NS)
+        if error is not None:
+            raise OAIError(f"{error.get('code')}: {error.text}")
+        specs += [spec.text for spec in root.iterfind('oai:ListSets/oai:set/oai:setSpec', XML_NS)]
+        token = root.findtext('oai:ListSets/oai:resumptionToken', None, XML_NS)
+        params = {'verb': 'ListSets', 'resumptionToken': token} if token and token.strip() else None
+    return specs
+
+def findResumptionToken(page):
+    """
+    resumptionToken d'une page téléchargée, sans analyser le XML : c'est le dernier élément de
+    ListRecords, il est recherché dans les derniers octets de la page.
+    """
+    page.seek(0, os.SEEK_END)
+    page.seek(max(0, page.tell() - TOKEN_SEARCH_SIZE))
+    match = None
+    for match in TOKEN_PATTERN.finditer(page.read()):
+        pass
+    page.seek(0)
+    if match is None or not match.group(1) or not match.group(1).strip():
+        return None
+    return html.unescape(match.group(1).decode('utf-8').strip())
+
+def fetchPages(session, params, limiter):
+    """
+    Producteur du pipeline : télécharge les pages ListRecords (dans des fichiers temporaires, en mémoire
+    jusqu'à SPOOL_SIZE) et demande la suivante dès que son resumptionToken est connu, pendant que la page
+    précédente est convertie. Générateur de (page, resumptionToken) ; au plus PIPELINE_DEPTH pages d'avance.
+    """
+    pages = queue.Queue(maxsize=PIPELINE_DEPTH)
+    stop = threading.Event()
+
+    def produce():
+        request_params = params
+        count = 0
         try:
-            response = requests.get(request_url)
-            response.raise_for_status()
-            
-            root = ET.fromstring(response.content)
-            
-            # Vérification erreurs OAI
-            error = root.find('oai:error', XML_NS)
-            if error is not None:
-                logging.error(f"Erreur API OAI: {error.text}")
-                break
-
-            list_records = root.find('oai:ListRecords', XML_NS)
-            if list_records is None: break
-                
-            records = list_records.findall('oai:record', XML_NS)
-            if records:
-                createRecordsTriples(records, graph)
-                logging.info(f"{len(records)} items traités.")
-
-            # Gestion pagination
-            token_node = list_records.find('oai:resumptionToken', XML_NS)
-            
-            if token_node is not None and token_node.text:
-                token = token_node.text
-                request_url = f"{OAI_ENDPOINT}?verb=ListRecords&resumptionToken={token}"
-                call_count += 1
-            else:
-                logging.info("Fin du moissonnage (plus de token).")
-                break
-                
+            while request_params and not stop.is_set():
+                if MAX_BATCHES and count >= MAX_BATCHES:
+                    break
+                limiter.wait()
+                page = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+                with session.get(OAI_ENDPOINT, params=request_params, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        page.write(chunk)
+                token = findResumptionToken(page)
+                pages.put((page, token))
+                count += 1
+                request_params = {'verb': 'ListRecords', 'resumptionToken': token} if token else None
         except Exception as e:
-            logging.error(f"Arrêt sur erreur: {e}")
-            break
+            pages.put(e)
+        pages.put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            with item[0]:
+                yield item
+    finally:
+        # Arrêt anticipé (erreur, fin de liste) : le producteur est libéré s'il attend de la place dans la file
+        stop.set()
+        while producer.is_alive() or not pages.empty():
+            try:
+                item = pages.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if isinstance(item, tuple):
+                item[0].close()
+
+def shardFile(name):
+    """Fichier d'un moissonnage partiel : le fichier final pour l'entrepôt entier, un fichier par set sinon."""
+    if name == '':
+        return ITEMS_FILE
+    return ITEMS_FILE + "." + re.sub(r'[^\w-]+', '_', name)
+
+def harvestShard(session, limiter, harvest, name, lock):
+    """
+    Moissonne une liste ListRecords (l'entrepôt entier ou un set) dans son propre fichier temporaire.
+    Après chaque page, le resumptionToken et la taille du fichier sont enregistrés dans CHECKPOINT_FILE.
+    Retourne True si la liste a été moissonnée entièrement.
+    """
+    shard = harvest['shards'][name]
+    if shard['done']:
+        return True
+
+    sink = TriplesFileSink(shardFile(name), resume=shard['sink'])
+    if shard['token']:
+        params = {'verb': 'ListRecords', 'resumptionToken': shard['token']}
+    else:
+        params = dict(harvest['params'], set=name) if name else harvest['params']
+    label = f"set {name}" if name else "entrepôt"
+
+    try:
+        with closing(fetchPages(session, params, limiter)) as pages:
+            for page, token in pages:
+                result = parseListRecords(page, sink)
+                # Vérification erreurs OAI
+                if result['error'] is not None:
+                    code, message = result['error']
+                    if code != 'noRecordsMatch':
+                        raise OAIError(f"{code}: {message}")
+                    logging.info(f"{label} : aucun enregistrement à moissonner.")
+                elif result['token'] != token:
+                    raise OAIError(f"resumptionToken mal détecté dans la page ({token} au lieu de {result['token']})")
+
+                # Le point de reprise est enregistré par un autre thread : compteurs, suppressions, token et
+                # position du fichier d'une même page sont modifiés ensemble, sous le verrou
+                with lock:
+                    shard['started'] = shard['started'] or result['responseDate']
+                    shard['records'] += result['records']
+                    shard['deleted'] += len(result['deleted'])
+                    if harvest['mode'] == 'incremental':
+                        shard['removed'] += result['deleted']
+                    shard['batches'] += 1
+                    shard['token'] = result['token']
+                    shard['sink'] = sink.checkpoint()
+                    shard['done'] = not result['token']
+                    saveJSON(CHECKPOINT_FILE, harvest)
+                logging.info(f"{label}, batch {shard['batches']} : {result['records']} items traités, "
+                             f"{len(result['deleted'])} supprimés ({shard['records']} au total).")
+    finally:
+        sink.stream.close()
+
+    return shard['done']
+
+def newShard():
+    return {'token': None, 'sink': None, 'started': None, 'records': 0, 'deleted': 0, 'removed': [],
+            'batches': 0, 'done': False}
 
-    saveGraphToFile(graph, ITEMS_FILE)
+def previousFileUsable():
+    """Un moissonnage incrémental complète le fichier précédent, lu ligne à ligne : il doit exister et être en N-Triples."""
+    return FORMAT in ('turtle', 'nt', 'ntriples') and os.path.exists(FILES_REPOSITORY + ITEMS_FILE)
+
+def incrementalHarvestPossible(state):
+    """Il faut un moissonnage précédent réussi, un fichier N-Triples/Turtle à compléter et un moissonnage complet récent."""
+    if not state or not previousFileUsable():
+        return False
+    last_full = datetime.fromisoformat(state['last_full'])
+    return datetime.now(timezone.utc) - last_full <= timedelta(days=FULL_HARVEST_INTERVAL)
+
+def datestamp(moment):
+    """
+    Datestamp OAI-PMH (UTC, à la seconde, suffixe Z) accepté comme paramètre `from`. Accepte aussi une
+    date ISO 8601 (états enregistrés par les versions précédentes, avec décalage et microsecondes).
+    """
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def newHarvest(session, state, full, date_from, date_until, sets):
+    """
+    Paramètres d'un nouveau moissonnage : complet, ou limité aux changements depuis le dernier moissonnage ;
+    de tout l'entrepôt, ou de chacun des sets demandés (moissonnés en parallèle).
+    """
+    params = {'verb': 'ListRecords', 'metadataPrefix': METADATA_PREFIX}
+    mode = 'full'
+
+    if date_from and not full and not previousFileUsable():
+        # Sans fichier N-Triples précédent à compléter, un moissonnage partiel remplacerait toutes les données
+        logging.warning(f"--from ignoré : {ITEMS_FILE} absent ou au format {FORMAT} ; moissonnage complet.")
+        date_from = None
+
+    if not full and (date_from or incrementalHarvestPossible(state)):
+        granularity, deleted_record = identify(session)
+        if deleted_record == 'no':
+            logging.warning("L'entrepôt ne signale pas les suppressions : seul un moissonnage complet (--full) les prend en compte.")
+        date_from = date_from or datestamp(state['last_harvest'])
+        # Datestamps au jour si l'entrepôt n'accepte pas les heures (le chevauchement est sans effet)
+        params['from'] = date_from if 'hh' in granularity else date_from[:10]
+        if date_until:
+            params['until'] = date_until if 'hh' in granularity else date_until[:10]
+        mode = 'incremental'
+
+    if sets == 'all':
+        sets = listSets(session)
+        logging.info(f"{len(sets)} sets à moissonner.")
+    shards = {name: newShard() for name in sets} if sets else {'': newShard()}
+
+    return {'mode': mode, 'params': params, 'until': date_until, 'shards': shards}
+
+def publish(harvest):
+    """
+    Rassemble les fichiers partiels dans ITEMS_FILE (un enregistrement présent dans plusieurs sets n'est
+    écrit qu'une fois) ; en incrémental, complète avec les descriptions inchangées du fichier précédent.
+    """
+    shards = harvest['shards']
+    incremental = harvest['mode'] == 'incremental'
+    removed = set(identifier for shard in shards.values() for identifier in shard['removed'])
+
+    if list(shards) == ['']:
+        sink = TriplesFileSink(ITEMS_FILE, resume=shards['']['sink'])
+        harvested = sink.writtenSubjects() if incremental else set()
+    else:
+        sink = TriplesFileSink(ITEMS_FILE)
+        harvested = set()
+        for name in shards:
+            shardPath = FILES_REPOSITORY + shardFile(name) + '.tmp'
+            harvested |= sink.appendFile(shardPath, harvested)
+            os.remove(shardPath)
+
+    if incremental:
+        if not harvested and not removed:
+            sink.abort()
+            return
+        # Les descriptions moissonnées remplacent les précédentes, les enregistrements supprimés disparaissent
+        sink.copyPreviousFile(harvested | removed)
+    sink.close()
+
+def discardHarvest(harvest):
+    for name in harvest['shards']:
+        shardPath = FILES_REPOSITORY + shardFile(name) + '.tmp'
+        if os.path.exists(shardPath):
+            os.remove(shardPath)
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+def harvestOAI(session, full=False, restart=False, date_from=None, date_until=None, sets=HARVEST_SETS):
+    """
+    Moissonnage OAI en pipeline : téléchargement des pages suivantes pendant la conversion, et jusqu'à
+    SET_WORKERS sets moissonnés simultanément. Un moissonnage interrompu (erreur, arrêt, limite
+    MAX_BATCHES) reprend au dernier point de reprise enregistré.
+    Retourne True si le moissonnage est terminé et le fichier publié.
+    """
+    state = loadJSON(SYNC_STATE_FILE)
+    harvest = None if restart else loadJSON(CHECKPOINT_FILE)
+    if harvest and not all(os.path.exists(FILES_REPOSITORY + shardFile(name) + '.tmp')
+                           for name, shard in harvest['shards'].items() if shard['sink']):
+        harvest = None
+
+    if harvest:
+        logging.info(f"Reprise du moissonnage {harvest['mode']} : "
+                     f"{sum(shard['records'] for shard in harvest['shards'].values())} items déjà moissonnés.")
+    else:
+        harvest = newHarvest(session, state, full, date_from, date_until, sets)
+        logging.info(f"Moissonnage {harvest['mode']} : {harvest['params']}")
+
+    limiter = RateLimiter(REQUEST_INTERVAL)
+    lock = threading.Lock()
+    try:
+        with ThreadPoolExecutor(max_workers=SET_WORKERS) as executor:
+            futures = [executor.submit(harvestShard, session, limiter, harvest, name, lock) for name in harvest['shards']]
+            complete = all([future.result() for future in futures])
+    except OAIError as e:
+        # Ex : token expiré côté entrepôt (badResumptionToken) ; le moissonnage repartira du début
+        discardHarvest(harvest)
+        logging.error(f"Erreur API OAI: {e}")
+        return False
+
+    if not complete:
+        logging.info(f"Limite de {MAX_BATCHES} batchs atteinte. Relancer le script pour poursuivre le moissonnage.")
+        return False
+
+    publish(harvest)
+    discardHarvest(harvest)
+
+    # Le prochain moissonnage incrémental part de la date de la première réponse (horloge de l'entrepôt)
+    now = datetime.now(timezone.utc)
+    started = min((shard['started'] for shard in harvest['shards'].values() if shard['started']), default=None)
+    records = sum(shard['records'] for shard in harvest['shards'].values())
+    deleted = sum(shard['deleted'] for shard in harvest['shards'].values())
+    state = dict(state or {}, last_harvest=harvest['until'] or started or datestamp(now), mode=harvest['mode'],
+                 records=records, deleted=deleted)
+    if harvest['mode'] == 'full':
+        state['last_full'] = now.isoformat()
+    saveJSON(SYNC_STATE_FILE, state)
+    logging.info(f"Moissonnage {harvest['mode']} terminé : {records} items, {deleted} suppressions.")
+    return True
+
+def loadTripleStore():
+    """Charge ITEMS_FILE dans le triplestore de l'application (remplacement atomique du graphe LOAD_GRAPH)."""
+    loader = GraphStoreLoader(LOAD_UPDATE_URL, LOAD_STORE_URL, LOAD_METHOD, LOAD_BATCH_SIZE, LOAD_WORKERS,
+                              REQUEST_TIMEOUT, MAX_RETRIES, BACKOFF_FACTOR, LOAD_AUTH)
+    # Le fichier Turtle produit par le moissonnage est en N-Triples : il est lu ligne à ligne
+    format = 'nt' if FORMAT in ('turtle', 'nt', 'ntriples') else FORMAT
+    files = [(FILES_REPOSITORY + ITEMS_FILE, format, LOAD_GRAPH)]
+    # Le tampon de version est remplacé en même temps que les données
+    stamp = FILES_REPOSITORY + VERSION_FILE + '.nt'
+    if os.path.exists(stamp):
+        files.append((stamp, 'nt', LOAD_GRAPH + '/dataset'))
+    try:
+        loader.load(files)
+    finally:
+        loader.close()
 
 #### Main ####
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Moissonnage OAI-PMH vers un fichier RDF.")
+    parser.add_argument('--full', action='store_true',
+                        help="Moissonnage complet au lieu des seuls changements depuis le dernier moissonnage")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignorer le point de reprise d'un moissonnage interrompu")
+    parser.add_argument('--from', dest='date_from', help="Datestamp de début (YYYY-MM-DD ou YYYY-MM-DDThh:mm:ssZ)")
+    parser.add_argument('--until', dest='date_until', help="Datestamp de fin")
+    parser.add_argument('--sets', help="Sets à moissonner en parallèle : \"all\" (ListSets) ou setSpec séparés par des virgules")
+    parser.add_argument('--no-load', action='store_true', help="Ne pas charger le fichier dans le triplestore")
+    parser.add_argument('--load-only', action='store_true',
+                        help="Charger le fichier actuel dans le triplestore sans moissonner")
+    args = parser.parse_args()
+    sets = HARVEST_SETS if args.sets is None else 'all' if args.sets == 'all' else args.sets.split(',')
+
     configureLogging()
-    logging.info('Démarrage import OAI...')
-    harvestOAI()
-    logging.info('Terminé.')
\ No newline at end of file
+    done = False
+    if not args.load_only:
+        logging.info('Démarrage import OAI...')
+        session = createSession()
+        try:
+            done = harvestOAI(session, args.full, args.restart, args.date_from, args.date_until, sets)
+        except Exception as e:
+            logging.error(f"Arrêt sur erreur: {e} (le moissonnage reprendra au dernier point de reprise)")
+            sys.exit(1)
+        finally:
+            session.close()
+        logging.info('Terminé.' if done else 'Interrompu.')
+
+    if done:
+        # Version des données exportées (hash du contenu), relue par l'application web
+        _, version = writeDatasetVersion(FILES_REPOSITORY, DATASET_URI, [FILES_REPOSITORY + ITEMS_FILE])
+        logging.info(f"Version des données : {version}")
+
+    if LOAD_UPDATE_URL and not args.no_load and (done or args.load_only):
+        logging.info('Chargement dans le triplestore...')
+        try:
+            loadTripleStore()
+        except (requests.RequestException, OSError) as e:
+            logging.error(f"Chargement impossible, le triplestore conserve ses données précédentes : {e}")
+            sys.exit(1)
@@ -3,15 +3,42 @@ from rdflib import Namespace
 # Configuration OAI-PMH
 OAI_ENDPOINT = "https://bibnum.sciencespo.fr/oai"
 METADATA_PREFIX = "oai_dc"
-FORMAT = "turtle"
+FORMAT = "turtle" # Les triplets sont écrits en N-Triples (sous-ensemble du Turtle) ; "xml" ou "json-ld" imposent une conversion finale
+REQUEST_TIMEOUT = 120 # Secondes
+MAX_RETRIES = 5 # Nouvelles tentatives par requête (erreurs réseau, 429, 5xx)
+BACKOFF_FACTOR = 2 # Délai croissant entre deux tentatives (secondes)
 
 # Dossier courant
 FILES_REPOSITORY = "./"
 ITEMS_FILE = "items.ttl"
 
+# Moissonnage incrémental (paramètre from=) et reprise après interruption
+SYNC_STATE_FILE = FILES_REPOSITORY + "harvest_state.json"
+CHECKPOINT_FILE = FILES_REPOSITORY + "harvest_checkpoint.json"
+FULL_HARVEST_INTERVAL = 7 # Jours entre deux moissonnages complets
 
-MAX_BATCHES = 1
+MAX_BATCHES = 0 # Batchs par exécution (0 = sans limite) ; la suite est moissonnée à l'exécution suivante
 
+# Pipeline et moissonnage par sets
+HARVEST_SETS = None # None : tout l'entrepôt ; "all" : chaque set de ListSets ; ou une liste de setSpec (les enregistrements hors de ces sets sont ignorés)
+SET_WORKERS = 3 # Sets moissonnés simultanément
+REQUEST_INTERVAL = 0.2 # Secondes minimum entre deux requêtes vers l'entrepôt (tous sets confondus)
+PIPELINE_DEPTH = 2 # Pages téléchargées d'avance pendant la conversion
+SPOOL_SIZE = 16 * 1024 * 1024 # Au-delà, une page téléchargée est conservée sur disque plutôt qu'en mémoire
+
+
+# Tampon de version des données (dataset_version.json et dataset_version.nt), voir ../datasetVersion.py
+DATASET_URI = "https://bibnum.sciencespo.fr/oai#dataset"
+
+# Chargement dans le triplestore de l'application (désactivé si LOAD_UPDATE_URL vaut None)
+# Le fichier est chargé dans un graphe temporaire, puis remplace le graphe cible par une seule requête SPARQL
+LOAD_UPDATE_URL = None # Endpoint SPARQL Update, ex : "http://localhost:3030/sematheque/update"
+LOAD_STORE_URL = None # Endpoint Graph Store Protocol, ex : "http://localhost:3030/sematheque/data"
+LOAD_METHOD = "gsp" # "gsp" (Graph Store Protocol) ou "update" (lots INSERT DATA)
+LOAD_GRAPH = "https://bibnum.sciencespo.fr/graph/oai" # Graphe nommé cible
+LOAD_BATCH_SIZE = 20000 # Triplets par requête
+LOAD_WORKERS = 4 # Lots envoyés en parallèle
+LOAD_AUTH = None # (utilisateur, mot de passe) pour une authentification HTTP basique
 
 # Namespaces
 XML_NS = {
@@ -1,6 +1,8 @@
 import logging
+import os
 from rdflib import Graph, URIRef, Literal
 from rdflib.namespace import RDF
+from rdflib.plugins.serializers.nt import _nt_row
 from constants import *
 
 def initializeRDFdatabase():
@@ -20,46 +22,143 @@ def saveGraphToFile(graph, filename):
     except:
         logging.exception(f"Erreur écriture fichier : {file_path}")
 
+class TriplesFileSink:
+    """
+    Écriture des triplets au fil du moissonnage, en N-Triples ligne à ligne, dans un fichier temporaire
+    renommé à la fermeture : la mémoire ne dépend pas du nombre d'enregistrements.
+    Le N-Triples étant un sous-ensemble du Turtle, le fichier .ttl reste lisible tel quel ; les autres
+    formats (xml, json-ld) sont obtenus par conversion du fichier complet à la fin.
+    """
+
+    def __init__(self, filename, format=FORMAT, resume=None):
+        self.file = FILES_REPOSITORY + filename
+        self.tmpFile = self.file + ".tmp"
+        self.format = format
+        self.count = 0
+        if resume is None:
+            self.stream = open(self.tmpFile, "wb")
+        else:
+            # Reprise : le fichier temporaire est tronqué à la taille du dernier point de reprise
+            self.stream = open(self.tmpFile, "r+b")
+            self.stream.truncate(resume["size"])
+            self.stream.seek(resume["size"])
+            self.count = resume["triples"]
+
+    def add(self, triple):
+        self.stream.write(_nt_row(triple).encode("utf-8"))
+        self.count += 1
+
+    def checkpoint(self):
+        """Vide les tampons sur disque ; retourne la position à laquelle reprendre l'écriture."""
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+        return {"size": self.stream.tell(), "triples": self.count}
+
+    def writtenSubjects(self):
+        """Sujets déjà écrits dans le fichier temporaire (enregistrements moissonnés avant une reprise)."""
+        self.stream.flush()
+        return readSubjects(self.tmpFile)
+
+    def appendFile(self, filePath, skippedSubjects):
+        """
+        Ajoute les triplets d'un fichier N-Triples partiel (un set), sauf ceux des sujets déjà écrits
+        depuis un autre fichier ; retourne les sujets ajoutés.
+        """
+        added = set()
+        with open(filePath, "rb") as f:
+            for line in f:
+                subject = line.split(b" ", 1)[0][1:-1].decode("utf-8")
+                if subject in skippedSubjects:
+                    continue
+                added.add(subject)
+                self.stream.write(line)
+                self.count += 1
+        return added
+
+    def copyPreviousFile(self, excludedSubjects):
+        """
+        Moissonnage incrémental : recopie les triplets du fichier précédent, sauf ceux des enregistrements
+        modifiés ou supprimés. Chaque ligne N-Triples commence par son sujet, aucune analyse n'est nécessaire.
+        """
+        excluded = set(("<" + subject + ">").encode("utf-8") for subject in excludedSubjects)
+        with open(self.file, "rb") as previous:
+            for line in previous:
+                if line.split(b" ", 1)[0] not in excluded:
+                    self.stream.write(line)
+                    self.count += 1
+
+    def close(self):
+        """Publie le fichier (conversion éventuelle puis renommage atomique)."""
+        self.stream.close()
+        if self.format not in ("turtle", "nt", "ntriples"):
+            logging.info(f"Conversion de {self.file} en {self.format}")
+            graph = initializeRDFdatabase()
+            graph.parse(self.tmpFile, format="nt")
+            graph.serialize(destination=self.tmpFile + ".converted", format=self.format)
+            os.replace(self.tmpFile + ".converted", self.tmpFile)
+        os.replace(self.tmpFile, self.file)
+        logging.info(f"Sauvegarde du fichier : {self.file} ({self.count} triplets)")
+
+    def abort(self):
+        """Abandonne le fichier temporaire ; le fichier précédent est conservé."""
+        self.stream.close()
+        if os.path.exists(self.tmpFile):
+            os.remove(self.tmpFile)
+
+def readSubjects(filePath):
+    """Identifiants (URI sans chevrons) des sujets d'un fichier N-Triples."""
+    subjects = set()
+    with open(filePath, "rb") as f:
+        for line in f:
+            subject = line.split(b" ", 1)[0]
+            if subject.startswith(b"<"):
+                subjects.add(subject[1:-1].decode("utf-8"))
+    return subjects
+
+def createRecordTriples(record, graph):
+    """Transforme un enregistrement XML OAI en triplets RDF ; `graph` est un Graph ou un TriplesFileSink."""
+    # Récupération Header
+    header = record.find('oai:header', XML_NS)
+    if header is None: return 0
+
+    if 'status' in header.attrib and header.attrib['status'] == 'deleted':
+        return 0
+
+    # Création URI
+    identifier = header.find('oai:identifier', XML_NS).text
+    uri = URIRef(identifier)
+
+    # Récupération Metadata
+    metadata = record.find('oai:metadata', XML_NS)
+    if metadata is None: return 0
+
+    oai_dc = metadata.find('oai_dc:dc', XML_NS)
+    if oai_dc is None: return 0
+
+    # Boucle sur toutes les propriétés Dublin Core
+    for element in oai_dc:
+        # Nettoyage du tag pour enlever le namespace XML (ex: {http://...}title -> title)
+        if '}' in element.tag:
+            tag_name = element.tag.split('}')[-1]
+        else:
+            tag_name = element.tag
+
+        # On crée dynamiquement le prédicat RDF (ex: dc:title, dc:creator...)
+        predicate = namespaces['dc'][tag_name]
+
+        # Ajout de la valeur si elle n'est pas vide
+        if element.text and element.text.strip():
+            graph.add((uri, predicate, Literal(element.text.strip())))
+
+    # Ajout du type Record
+    graph.add((uri, RDF.type, namespaces['dc'].Record))
+    return 1
+
 def createRecordsTriples(records_xml, graph):
     """Transforme les enregistrements XML OAI en triplets RDF avec toutes les métadonnées."""
     for record in records_xml:
         try:
-            # Récupération Header
-            header = record.find('oai:header', XML_NS)
-            if header is None: continue
-                
-            if 'status' in header.attrib and header.attrib['status'] == 'deleted':
-                continue
-
-            # Création URI
-            identifier = header.find('oai:identifier', XML_NS).text
-            uri = URIRef(identifier)
-
-            # Récupération Metadata
-            metadata = record.find('oai:metadata', XML_NS)
-            if metadata is None: continue
-            
-            oai_dc = metadata.find('oai_dc:dc', XML_NS)
-            if oai_dc is None: continue
-
-            # Boucle sur toutes les propriétés Dublin Core
-            for element in oai_dc:
-                # Nettoyage du tag pour enlever le namespace XML (ex: {http://...}title -> title)
-                if '}' in element.tag:
-                    tag_name = element.tag.split('}')[-1]
-                else:
-                    tag_name = element.tag
-                
-                # On crée dynamiquement le prédicat RDF (ex: dc:title, dc:creator...)
-                predicate = namespaces['dc'][tag_name]
-                
-                # Ajout de la valeur si elle n'est pas vide
-                if element.text and element.text.strip():
-                    graph.add((uri, predicate, Literal(element.text.strip())))
-
-            # Ajout du type Record
-            graph.add((uri, RDF.type, namespaces['dc'].Record))
-
+            createRecordTriples(record, graph)
         except:
             logging.exception("Erreur traitement record")
-            continue
\ No newline at end of file
+            continue
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Dataset version stamp published with the exported files (shared by omeka_to_rdf and OAI_to_rdf)
+# The version is a hash of the content of the exported files: a run which changes nothing keeps the same
+# version. It is written twice, next to the exported files:
+# - dataset_version.json, a manifest for consumers reading the files (or served over HTTP),
+# - dataset_version.nt, triples describing the dataset, loaded into the triple store with the data,
+#   so that the web application can poll the version with a cheap SPARQL query and only invalidate
+#   the caches of the endpoints whose data changed.
+
+import hashlib
+import json
+import os
+
+from datetime import datetime, timezone
+
+VERSION_FILE = "dataset_version"
+CHUNK_SIZE = 1 << 20
+
+VOID_DATASET = "http://rdfs.org/ns/void#Dataset"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+DCTERMS = "http://purl.org/dc/terms/"
+XSD_DATETIME = "http://www.w3.org/2001/XMLSchema#dateTime"
+
+
+def hashFile(filePath):
+    digest = hashlib.sha256()
+    with open(filePath, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Write the version stamp of the given files in directory, returns the path of the N-Triples stamp and the version
+
+def writeDatasetVersion(directory, datasetUri, files):
+    hashes = {os.path.basename(f): hashFile(f) for f in files if os.path.exists(f)}
+    version = hashlib.sha256(json.dumps(hashes, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    generatedAt = datetime.now(timezone.utc).replace(microsecond=0)
+
+    manifestPath = os.path.join(directory, VERSION_FILE + ".json")
+    try:
+        with open(manifestPath, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+    # An unchanged dataset keeps the date of its version
+    if previous.get("version") == version:
+        generatedAt = datetime.fromisoformat(previous["generated_at"])
+
+    manifest = {"dataset": datasetUri, "version": version, "generated_at": generatedAt.isoformat(), "files": hashes}
+    with open(manifestPath + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifestPath + ".tmp", manifestPath)
+
+    triplesPath = os.path.join(directory, VERSION_FILE + ".nt")
+    with open(triplesPath + ".tmp", "w", encoding="utf-8") as f:
+        f.write(f"<{datasetUri}> <{RDF_TYPE}> <{VOID_DATASET}> .\n")
+        f.write(f"<{datasetUri}> <{DCTERMS}hasVersion> \"{version}\" .\n")
+        f.write(f"<{datasetUri}> <{DCTERMS}modified> \"{generatedAt.isoformat()}\"^^<{XSD_DATETIME}> .\n")
+    os.replace(triplesPath + ".tmp", triplesPath)
+    return triplesPath, version
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Bulk load of the exporter output into the triple store queried by the web application
+# Shared by omeka_to_rdf and OAI_to_rdf, which pass the settings of their constants.py.
+#
+# Each RDF file is loaded into a staging named graph ("<target graph>/staging"), by batches of N-Triples
+# sent in parallel with the SPARQL 1.1 Graph Store Protocol (POST appends to a graph) or as SPARQL
+# "INSERT DATA" updates. Once every file is loaded, a single SPARQL update moves all the staging graphs
+# to their target graphs: the application never queries a half-loaded graph, and a failed load leaves
+# the previous data in place.
+
+import gzip
+import logging
+import time
+
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rdflib import Graph
+from rdflib.plugins.serializers.nt import _nt_row
+
+NTRIPLES = "application/n-triples"
+NTRIPLES_FORMATS = ("nt", "ntriples")
+
+
+# Batches of N-Triples rows read from an exported file
+# N-Triples files are read line by line; other serializations are parsed in memory first.
+
+def readBatches(filePath, format, batchSize):
+    opener = gzip.open if filePath.endswith(".gz") else open
+
+    if format in NTRIPLES_FORMATS:
+        with opener(filePath, "rb") as f:
+            rows = (line if line.endswith(b"\n") else line + b"\n"
+                    for line in f if line.strip() and not line.startswith(b"#"))
+            yield from groupRows(rows, batchSize)
+    else:
+        graph = Graph()
+        with opener(filePath, "rb") as f:
+            graph.parse(f, format=format)
+        yield from groupRows((_nt_row(triple).encode("utf-8") for triple in graph), batchSize)
+
+
+def groupRows(rows, batchSize):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batchSize:
+            yield b"".join(batch), len(batch)
+            batch = []
+    if batch:
+        yield b"".join(batch), len(batch)
+
+
+class GraphStoreLoader:
+
+    def __init__(self, updateUrl, storeUrl=None, method="gsp", batchSize=20000, workers=4, timeout=300,
+                 retries=5, backoffFactor=2, auth=None):
+        if method not in ("gsp", "update"):
+            raise ValueError("Unknown load method: " + method)
+        if method == "gsp" and not storeUrl:
+            raise ValueError("The Graph Store Protocol method requires the URL of the graph store")
+        self.updateUrl = updateUrl
+        self.storeUrl = storeUrl
+        self.method = method
+        self.batchSize = batchSize
+        self.workers = workers
+        self.timeout = timeout
+
+        # POST and PUT are retried too: adding a triple twice to a graph has no effect
+        retry = Retry(total=retries, backoff_factor=backoffFactor, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET", "POST", "PUT", "DELETE"])
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.auth = auth
+
+    def update(self, update):
+        response = self.session.post(self.updateUrl, data={"update": update}, timeout=self.timeout)
+        response.raise_for_status()
+
+    def sendBatch(self, graph, rows):
+        if self.method == "gsp":
+            response = self.session.post(self.storeUrl, params={"graph": graph}, data=rows,
+                                         headers={"Content-Type": NTRIPLES}, timeout=self.timeout)
+            response.raise_for_status()
+        else:
+            self.update("INSERT DATA { GRAPH <" + graph + "> {\n" + rows.decode("utf-8") + "} }")
+
+    # Send the batches of a file, with at most 2 * workers batches read in advance
+
+    def loadFile(self, executor, filePath, format, graph):
+        pending = set()
+        count = 0
+        for rows, size in readBatches(filePath, format, self.batchSize):
+            if len(pending) >= 2 * self.workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(self.sendBatch, graph, rows))
+            count += size
+        for future in pending:
+            future.result()
+        return count
+
+    # Load files into their target graphs: files is a list of (file path, serialization, graph URI)
+    # Several files can target the same graph. Returns the number of triples sent.
+
+    def load(self, files):
+        start = time.perf_counter()
+        staging = {graph: graph + "/staging" for (_, _, graph) in files}
+
+        # Staging graphs left by an interrupted load
+        self.update(" ;\n".join("DROP SILENT GRAPH <" + graph + ">" for graph in staging.values()))
+
+        count = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for filePath, format, graph in files:
+                    loaded = self.loadFile(executor, filePath, format, staging[graph])
+                    logging.info(f"Loaded {loaded} triples of {filePath} into <{staging[graph]}>")
+                    count += loaded
+
+            # Atomic swap: one update request replaces all the target graphs
+            self.update(" ;\n".join("MOVE SILENT GRAPH <" + stagingGraph + "> TO GRAPH <" + graph + ">"
+                                    for graph, stagingGraph in staging.items()))
+        except Exception:
+            try:
+                self.update(" ;\n".join("DROP SILENT GRAPH <" + graph + ">" for graph in staging.values()))
+            except requests.RequestException:
+                logging.warning("The staging graphs could not be dropped.")
+            raise
+
+        duration = time.perf_counter() - start
+        logging.info(f"{count} triples loaded into {len(staging)} graphs in {duration:.1f}s "
+                     f"({count / duration if duration else 0:.0f} triples/s).")
+        return count
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Incremental backups of the RDF base
+# Each file is stored once as a compressed blob named after the SHA-256 of its content
+# (BACKUP_REPOSITORY/blobs/ab/abcdef....gz). A small manifest per day ("YYYYmmdd_manifest.json")
+# lists the files of that day with their hash: an unchanged file only costs a line in the manifest.
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from datetime import date, datetime
+from constants import *
+
+BLOBS_REPOSITORY = os.path.join(BACKUP_REPOSITORY, "blobs")
+MANIFEST_SUFFIX = "_manifest.json"
+CHUNK_SIZE = 1 << 20
+
+
+# Compression of the blobs: zstd if requested and the zstandard package is installed, gzip otherwise
+
+def getCompression():
+    if BACKUP_COMPRESSION == "zstd":
+        try:
+            import zstandard
+            return "zstd"
+        except ImportError:
+            logging.warning("zstandard is not installed, gzip is used for the backup.")
+    return "gzip"
+
+
+def openBlob(path, mode, compression):
+    if compression == "zstd":
+        import zstandard
+        if "w" in mode:
+            return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=BACKUP_COMPRESSION_LEVEL))
+        return zstandard.open(path, mode)
+    return gzip.open(path, mode, compresslevel=BACKUP_COMPRESSION_LEVEL) if "w" in mode else gzip.open(path, mode)
+
+
+def blobPath(digest, compression):
+    extension = ".zst" if compression == "zstd" else ".gz"
+    return os.path.join(BLOBS_REPOSITORY, digest[:2], digest + extension)
+
+
+def hashFile(filePath):
+    digest = hashlib.sha256()
+    with open(filePath, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def listManifests():
+    return sorted(file for file in os.listdir(BACKUP_REPOSITORY) if file.endswith(MANIFEST_SUFFIX))
+
+
+def loadManifest(day):
+    with open(os.path.join(BACKUP_REPOSITORY, day + MANIFEST_SUFFIX), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Files to back up: the RDF base without the logs and the temporary files of an interrupted export
+
+def listBackedUpFiles():
+    logsRepository = os.path.abspath(LOGS_REPOSITORY)
+    for (r, d, f) in os.walk(FILES_REPOSITORY):
+        d[:] = [folder for folder in d if os.path.abspath(os.path.join(r, folder)) != logsRepository]
+        for file in f:
+            if not file.endswith(".tmp"):
+                yield os.path.join(r, file)
+
+
+# Back up the RDF base and write the manifest of the given day
+# Files whose size and modification date did not change since the previous manifest are not read again,
+# and a blob is only written if no file with the same content has already been stored.
+
+def createIncrementalBackup(day):
+    compression = getCompression()
+    manifests = listManifests()
+    previous = {}
+    if manifests:
+        with open(os.path.join(BACKUP_REPOSITORY, manifests[-1]), "r", encoding="utf-8") as f:
+            previousManifest = json.load(f)
+        if previousManifest.get("compression") == compression:
+            previous = previousManifest["files"]
+
+    files = {}
+    written = reused = storedBytes = 0
+
+    for filePath in listBackedUpFiles():
+        relativePath = os.path.relpath(filePath, FILES_REPOSITORY)
+        stat = os.stat(filePath)
+        entry = previous.get(relativePath)
+
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime \
+                and os.path.exists(blobPath(entry["sha256"], compression)):
+            files[relativePath] = entry
+            reused += 1
+            continue
+
+        digest = hashFile(filePath)
+        blob = blobPath(digest, compression)
+        if os.path.exists(blob):
+            reused += 1
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmpBlob = blob + ".tmp"
+            with open(filePath, "rb") as source, openBlob(tmpBlob, "wb", compression) as destination:
+                shutil.copyfileobj(source, destination, CHUNK_SIZE)
+            os.replace(tmpBlob, blob)
+            os.chmod(blob, 0o644)
+            storedBytes += os.path.getsize(blob)
+            written += 1
+
+        files[relativePath] = {"sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime,
+                               "mode": stat.st_mode & 0o777}
+
+    manifest = {"date": day, "created": datetime.now().isoformat(), "compression": compression, "files": files}
+    manifestFile = os.path.join(BACKUP_REPOSITORY, day + MANIFEST_SUFFIX)
+    with open(manifestFile + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifestFile + ".tmp", manifestFile)
+    os.chmod(manifestFile, 0o644)
+
+    logging.info(f"Backup {day}: {len(files)} files, {written} new blobs ({storedBytes / 1e6:.1f} MB), "
+                 f"{reused} unchanged files")
+    return manifest
+
+
+# Restore the files of a day from its manifest (to FILES_REPOSITORY by default)
+
+def restoreBackup(day, destination=FILES_REPOSITORY):
+    manifest = loadManifest(day)
+    for relativePath, entry in manifest["files"].items():
+        target = os.path.join(destination, relativePath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with openBlob(blobPath(entry["sha256"], manifest["compression"]), "rb", manifest["compression"]) as source, \
+                open(target + ".tmp", "wb") as restored:
+            shutil.copyfileobj(source, restored, CHUNK_SIZE)
+        os.chmod(target + ".tmp", entry.get("mode", 0o644))
+        os.replace(target + ".tmp", target)
+    logging.info(f"Backup {day} restored to {destination}: {len(manifest['files'])} files.")
+    return len(manifest["files"])
+
+
+# Remove the manifests older than MAX_DAYS, then the blobs which are no longer referenced by any manifest
+
+def cleanBackups():
+    today = date.today()
+    for file in listManifests():
+        try:
+            if (today - datetime.strptime(file[:8], '%Y%m%d').date()).days > MAX_DAYS:
+                os.remove(os.path.join(BACKUP_REPOSITORY, file))
+        except ValueError:
+            continue
+
+    referenced = set()
+    for file in listManifests():
+        with open(os.path.join(BACKUP_REPOSITORY, file), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        referenced.update(blobPath(entry["sha256"], manifest["compression"]) for entry in manifest["files"].values())
+
+    if not os.path.exists(BLOBS_REPOSITORY):
+        return
+    for (r, d, f) in os.walk(BLOBS_REPOSITORY):
+        for file in f:
+            blob = os.path.join(r, file)
+            if blob not in referenced:
+                os.remove(blob)
@@ -1,7 +1,19 @@
 from rdflib import Namespace
 
 RESULTS_PER_PAGE = 500
-FORMAT = "turtle" #Options: {"rdfxml", "jsonld", "turtle", "ntriples"}
+
+#HTTP calls to the Omeka S API
+MAX_WORKERS = 4 #Number of pages fetched in parallel
+REQUEST_TIMEOUT = 60 #Seconds before a call is considered as failed
+MAX_RETRIES = 5 #Retries for a page (connection errors, 429 and 5xx responses)
+BACKOFF_FACTOR = 2 #Delay before retry n: BACKOFF_FACTOR * 2^(n - 1) seconds
+
+#Conversion of the API pages to triples
+CONVERSION_WORKERS = 4 #Processes converting pages in parallel (0: conversion in the main process)
+FORMAT = "ntriples" #Options: {"ntriples", "turtle", "xml", "json-ld"}
+#"ntriples" is streamed to disk while the API is read (constant memory). Other formats are converted
+#afterwards by loading the whole graph in memory.
+COMPRESS = False #Write gzip compressed files (".gz" is appended to the file names)
 
 #Path for API call
 API_PATH = "http://henripoincare.fr/api/"
@@ -17,10 +29,35 @@ FILES_REPOSITORY = "/var/lib/rdf_db_hp/"
 BACKUP_REPOSITORY = "/opt/backup/rdf_db_hp/"
 LOGS_REPOSITORY = "/var/lib/rdf_db_hp/logs/"
 
+#Backups of the RDF base (logs are not backed up)
+BACKUP_MODE = "blobs" #Options: {"blobs", "zip"}
+#"blobs": content-hashed compressed files + a manifest per day, unchanged files are not stored again
+#"zip": a full compressed archive per day
+BACKUP_COMPRESSION = "gzip" #Options: {"gzip", "zstd"} (zstd requires the zstandard package)
+BACKUP_COMPRESSION_LEVEL = 6
+
 ITEMS_FILE = "items.ttl"
 MEDIAS_FILE = "medias.ttl"
 COLLECTIONS_FILE = "collections.ttl"
 
+#Incremental sync (only resources created or modified since the last run are fetched)
+SYNC_STATE_FILE = FILES_REPOSITORY + "sync_state.json" #Date of the last successful sync of each category
+PATCHES_REPOSITORY = FILES_REPOSITORY + "patches/" #SPARQL Update patches of incremental runs
+FULL_SYNC_INTERVAL = 7 #Days between two full rebuilds (deleted resources are only removed by a full rebuild)
+
+#Dataset version stamp (dataset_version.json and dataset_version.nt in FILES_REPOSITORY), see ../datasetVersion.py
+DATASET_URI = "http://henripoincare.fr/dataset/rdf"
+
+#Load of the RDF files into the triple store queried by the web application (disabled if LOAD_UPDATE_URL is None)
+#Files are loaded into staging graphs, then all target graphs are replaced at once with a SPARQL update
+LOAD_UPDATE_URL = None #SPARQL Update endpoint, ex: "http://localhost:3030/sematheque/update"
+LOAD_STORE_URL = None #Graph Store Protocol endpoint, ex: "http://localhost:3030/sematheque/data"
+LOAD_METHOD = "gsp" #Options: {"gsp", "update"} (Graph Store Protocol POST or SPARQL "INSERT DATA" batches)
+LOAD_GRAPH_BASE = "http://henripoincare.fr/graph/" #Target graph of each file: LOAD_GRAPH_BASE + items/medias/collections
+LOAD_BATCH_SIZE = 20000 #Triples per request
+LOAD_WORKERS = 4 #Batches sent in parallel
+LOAD_AUTH = None #(user, password) for HTTP basic authentication
+
 #Prefixes which will store prefixes with RDF namespaces by calling Omeka S vocabularies API
 namespaces = {}
 
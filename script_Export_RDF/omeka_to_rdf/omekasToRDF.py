@@ -1,16 +1,31 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import argparse
 import requests
 import json
 import rdflib
 import logging
+import math
 import os
-
-from datetime import date, datetime, timedelta
-from zipfile import ZipFile
+import sys
+import time
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qs
+from zipfile import ZipFile, ZIP_DEFLATED
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from triplesCreation import *
 from constants import *
+from backup import createIncrementalBackup, restoreBackup, cleanBackups, listBackedUpFiles, listManifests
+
+#The graph store loader is shared with the OAI exporter
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from graphStoreLoader import GraphStoreLoader
+from datasetVersion import writeDatasetVersion, VERSION_FILE
 
 
 #TODO check trailing / in API_PATH
@@ -30,40 +45,32 @@ def alterFilesPermissions():
                 next
 
 
-# Create a backup archive containing current RDF base content
+# Create a backup of the current RDF base content
 
 def createBackup():
     yesterday = datetime.now() - timedelta(days=1)
 
-    # Create archive file
-
-    if os.path.exists(BACKUP_REPOSITORY):
-        archiveFile = BACKUP_REPOSITORY + yesterday.strftime('%Y%m%d') \
-            + '_base_rdf' + '.zip'
-
-       
-        # Add all RDF files to the archive (see https://docs.python.org/2.7/library/zipfile.html for documentation)
-
-        with ZipFile(archiveFile, 'w') as zipObj:
-
-        # Iterate over all the files in directory
+    if not os.path.exists(BACKUP_REPOSITORY):
+        logging.exception('The backup repository with path "'
+                          + BACKUP_REPOSITORY + '" has not been found.')
+        sys.exit("Quitting script...please create the backup repository first.")
 
-            for (r, d, f) in os.walk(FILES_REPOSITORY):
-                for file in f:
+    if BACKUP_MODE == 'blobs':
+        createIncrementalBackup(yesterday.strftime('%Y%m%d'))
+        return
 
-                   # create complete filepath of file in directory
+    # Create archive file
 
-                    filePath = os.path.join(r, file)
+    archiveFile = BACKUP_REPOSITORY + yesterday.strftime('%Y%m%d') \
+        + '_base_rdf' + '.zip'
 
-                   # Add file to zip
+    # Add all RDF files to the archive (see https://docs.python.org/3/library/zipfile.html for documentation)
 
-                    zipObj.write(filePath)
+    with ZipFile(archiveFile, 'w', compression=ZIP_DEFLATED, compresslevel=BACKUP_COMPRESSION_LEVEL) as zipObj:
+        for filePath in listBackedUpFiles():
+            zipObj.write(filePath)
 
-        os.chmod(archiveFile, 0o644)
-    else:
-        logging.exception('The backup repository with path "'
-                          + BACKUP_REPOSITORY + '" has not been found.')
-        sys.exit("Quitting script...please create the backup repository first.")
+    os.chmod(archiveFile, 0o644)
 
 
 # Clean repository by removing X days old file (default set to 30 days)
@@ -91,12 +98,10 @@ def cleanRepository():
                 logging.exception('Exception message:', exc_info=True)
                 next
 
-    # Clean backup archives repository
+    # Clean SPARQL Update patches repository
 
-    for (r, d, f) in os.walk(BACKUP_REPOSITORY):
+    for (r, d, f) in os.walk(PATCHES_REPOSITORY):
         for file in f:
-            filePath = os.path.join(r, file)
-
             try:
                 creationDate = datetime.strptime(file[:8], '%Y%m%d')
 
@@ -108,6 +113,25 @@ def cleanRepository():
             except:
                 next
 
+    # Clean backup archives repository (zip archives, then manifests and unreferenced blobs)
+
+    for file in os.listdir(BACKUP_REPOSITORY):
+        if not file.endswith('.zip'):
+            continue
+
+        try:
+            creationDate = datetime.strptime(file[:8], '%Y%m%d')
+
+            # Remove X days old file
+
+            if (today - datetime.date(creationDate)).days \
+                > MAX_DAYS:
+                os.remove(os.path.join(BACKUP_REPOSITORY, file))
+        except:
+            next
+
+    cleanBackups()
+
 
 # Configure logger (see https://realpython.com/python-logging/ for details)
 
@@ -131,92 +155,361 @@ def configureLogging():
         sys.exit("Quitting script...please create the logs repository first.")
 
 
-#Retrieve Omeka S vocabularies and save prefixes with associated URI in the namespaces object
-def saveNamespaces():
-    logging.info('---- Calling ' + API_PATH + VOCABULARIES + " ----")
-    response = requests.get(API_PATH + VOCABULARIES)
+# HTTP session shared by all API calls: pooled connections, timeout and retries with exponential backoff
 
-    if response:
-        vocabularies = response.json()
+def createSession():
+    retry = Retry(total=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR,
+                  status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
-        if len(vocabularies) > 0:
-            for vocab in vocabularies:
-                namespaces[vocab["o:prefix"]] = vocab["o:namespace_uri"]
-                logging.info("Add namespace " + vocab["o:namespace_uri"] + " with prefix " + vocab["o:prefix"])
 
-# Get Omeka S resource by making REST API calls
-# Save items, medias or collections to RDF base (several files)
-def saveResources(category):
+# Call the Omeka S API, raise an exception for non-2xx responses (once retries are exhausted)
 
-    graph = initializeRDFdatabase()
-    callOver = False
-    page = 0
+def callAPI(path, params=None):
+    response = session.get(API_PATH + path, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response
 
-    # The call is split into several pages to avoid loosing data
 
-    while not callOver:
+# Number of resources and pages of a category, from the Omeka-S-Total-Results header
+# or, if missing, from the "last" pagination link (None if neither is available)
 
-        # Python request package is used to make the HTTP call
-        # See https://realpython.com/python-requests/ for examples
+def countPages(response):
+    total = response.headers.get('Omeka-S-Total-Results')
+    if total is not None:
+        return int(total), math.ceil(int(total) / RESULTS_PER_PAGE)
 
-        logging.info('---- Calling ' + API_PATH + category + " ----")
+    last = response.links.get('last')
+    if last:
+        return None, int(parse_qs(urlparse(last['url']).query).get('page', ['1'])[0])
 
-        stringParams = {'page': page, 'per_page': RESULTS_PER_PAGE}
-        response = requests.get(API_PATH + category, stringParams)
+    return None, None
 
-        # Response ok if status code between 200 and 400
 
-        if response:
-            resources = response.json()
+# Fetch all pages of a category and yield (page number, response) in page order
+# Omeka S pages start at 1. Pages are fetched concurrently, with a bounded number of pages in advance.
 
-            if len(resources) > 0:
-                logging.info('Page number ' + str(page) + ' with '
-                             + str(len(resources)) + ' resources.')
-                page += 1
+def fetchPages(category):
+    params = {'page': 1, 'per_page': RESULTS_PER_PAGE}
+    first = callAPI(category, params)
+    total, pages = countPages(first)
+    logging.info('---- Calling ' + API_PATH + category + ' : ' + str(total if total is not None else '?')
+                 + ' resources, ' + str(pages if pages is not None else '?') + ' pages ----')
+    yield 1, first
 
-                if category == ITEMS:
-                    createItemsTriples(resources, graph)
-                elif category == MEDIAS:
-                    createMediasTriples(resources, graph)
-                else:
-                    createCollectionsTriples(resources, graph)
-            else:
-                callOver = True
-                logging.info('No further data to fetch. Call is over for '
-                              + str(category) + '.')
-        else:
-            logging.error('An error has occured. Response code: '
-                          + str(response.status_code))
+    if pages is None:
+        # No pagination information: fetch pages one after the other until an empty page
+        page = 2
+        while True:
+            response = callAPI(category, {'page': page, 'per_page': RESULTS_PER_PAGE})
+            if len(response.json()) == 0:
+                return
+            yield page, response
+            page += 1
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        pending = deque()
+        nextPage = 2
+        while pending or nextPage <= pages:
+            while nextPage <= pages and len(pending) < 2 * MAX_WORKERS:
+                future = executor.submit(callAPI, category, {'page': nextPage, 'per_page': RESULTS_PER_PAGE})
+                pending.append((nextPage, future))
+                nextPage += 1
+            page, future = pending.popleft()
+            yield page, future.result()
 
-    # Save graph resources to a RDF file
 
-    saveGraphToFile(graph, category, FORMAT)
+#Retrieve Omeka S vocabularies and save prefixes with associated URI in the namespaces object
+def saveNamespaces():
+    logging.info('---- Calling ' + API_PATH + VOCABULARIES + " ----")
+    try:
+        response = callAPI(VOCABULARIES, {'per_page': RESULTS_PER_PAGE})
+    except requests.RequestException:
+        logging.exception('Unable to retrieve the Omeka S vocabularies.')
+        sys.exit('Quitting script...the Omeka S API call failed for ' + VOCABULARIES + '.')
 
+    vocabularies = response.json()
 
-#### Main program ####
+    if len(vocabularies) > 0:
+        for vocab in vocabularies:
+            namespaces[vocab["o:prefix"]] = vocab["o:namespace_uri"]
+            logging.info("Add namespace " + vocab["o:namespace_uri"] + " with prefix " + vocab["o:prefix"])
 
-# Add backup archive and remove old files
-createBackup()
-cleanRepository()
+# Get Omeka S resource by making REST API calls
+# Save items, medias or collections to RDF base (several files)
+def saveResources(category):
+
+    writer = TriplesWriter(getCategoryFile(category))
+    start = time.perf_counter()
+    pages = resourcesCount = downloaded = 0
+    total = None
+
+    # Pages are converted to N-Triples by a pool of processes (CONVERSION_WORKERS) while the next pages
+    # are downloaded; converted pages are written to the output stream in page order
+
+    pool = None
+    if CONVERSION_WORKERS > 0:
+        pool = ProcessPoolExecutor(max_workers=CONVERSION_WORKERS, initializer=initializeConversionWorker,
+                                   initargs=(dict(namespaces),))
+    pending = deque()
 
-# Instanciate and configure a logger
+    def writeConvertedPage():
+        nonlocal resourcesCount
+        page, future = pending.popleft()
+        rows, count, triples = future.result()
+        writer.writeRows(rows, triples)
+        resourcesCount += count
+        logging.info('Page number ' + str(page) + ' with ' + str(count) + ' resources.')
 
-configureLogging()
+    # The call is split into several pages to avoid loosing data
+    # If a page still fails after all retries, the export stops and the previous RDF file is kept
+
+    try:
+        for page, response in fetchPages(category):
+            if page == 1:
+                total = countPages(response)[0]
+            pages += 1
+            downloaded += len(response.content)
+
+            if pool is not None:
+                pending.append((page, pool.submit(convertPage, category, response.content)))
+            else:
+                future = Future()
+                future.set_result(convertPage(category, response.content))
+                pending.append((page, future))
+
+            # Bounded number of pages waiting for conversion: memory does not grow with the collection
+            while len(pending) > 2 * max(CONVERSION_WORKERS, 1):
+                writeConvertedPage()
+
+        while pending:
+            writeConvertedPage()
+    except requests.RequestException:
+        writer.abort()
+        logging.exception('An error has occured while fetching ' + category + ', export aborted.')
+        sys.exit('Quitting script...the Omeka S API call failed for ' + category + '.')
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    logging.info('No further data to fetch. Call is over for ' + str(category) + '.')
+    logging.info(f'{category}: {resourcesCount} resources, {writer.count} triples, {pages} pages, '
+                 f'{downloaded / 1e6:.1f} MB in {elapsed:.1f}s ({resourcesCount / elapsed if elapsed else 0:.1f} '
+                 f'resources/s, {writer.count / elapsed if elapsed else 0:.0f} triples/s, '
+                 f'{MAX_WORKERS} parallel calls, {CONVERSION_WORKERS} conversion processes)')
+    if total is not None and total != resourcesCount:
+        logging.warning(f'{category}: {total} resources announced by the API but {resourcesCount} received '
+                        '(collection modified during the export?)')
+
+    # Replace the previous RDF file with the new one
+
+    writer.close()
+
+
+# Date of the last change of an Omeka S resource (o:modified, or o:created if never modified)
+
+def resourceModified(resource):
+    value = resource.get('o:modified') or resource.get('o:created')
+    if not value:
+        return None
+    return datetime.fromisoformat(value['@value'])
+
+
+# Fetch the resources created or modified after a date
+# Resources are sorted by modification date (most recent first) and pages are read until an older one is found.
+# A second pass sorted by creation date is required: Omeka S leaves o:modified empty until the first edit.
+
+def fetchChangedResources(category, since):
+    changed = {}
+    for sortBy in ('modified', 'created'):
+        page = 1
+        while True:
+            params = {'page': page, 'per_page': RESULTS_PER_PAGE, 'sort_by': sortBy, 'sort_order': 'desc'}
+            resources = callAPI(category, params).json()
+            recent = [r for r in resources if (resourceModified(r) or since) > since]
+            for resource in recent:
+                changed[resource['@id']] = resource
+            if len(recent) < len(resources) or len(resources) < RESULTS_PER_PAGE:
+                break
+            page += 1
+    return list(changed.values())
+
+
+# Incremental sync: the description of each changed resource replaces the previous one in the RDF file,
+# and a SPARQL Update patch with the same changes is written to PATCHES_REPOSITORY
+
+def updateResources(category, since):
+    start = time.perf_counter()
+    logging.info('---- Calling ' + API_PATH + category + ' for resources changed since ' + since.isoformat() + ' ----')
+
+    try:
+        resources = fetchChangedResources(category, since)
+    except requests.RequestException:
+        logging.exception('An error has occured while fetching ' + category + ', export aborted.')
+        sys.exit('Quitting script...the Omeka S API call failed for ' + category + '.')
+
+    if not resources:
+        logging.info(f'{category}: no resource changed since the last sync.')
+        return 0
+
+    subjects = [resource['@id'] for resource in resources]
+    os.makedirs(PATCHES_REPOSITORY, exist_ok=True)
+    patch = PatchWriter(PATCHES_REPOSITORY + datetime.now().strftime('%Y%m%d%H%M%S') + '_' + category + '.ru', subjects)
+    writer = TriplesWriter(getCategoryFile(category), patch = patch)
+
+    try:
+        writer.copyPreviousFile(subjects)
+        createTriples(category, resources, writer)
+    except BaseException:
+        writer.abort()
+        raise
+
+    writer.close()
+    logging.info(f'{category}: {len(resources)} changed resources applied in {time.perf_counter() - start:.1f}s')
+    return len(resources)
+
+
+# Last successful sync of each category
+
+def loadSyncState():
+    try:
+        with open(SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveSyncState(state):
+    tmpFile = SYNC_STATE_FILE + '.tmp'
+    with open(tmpFile, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmpFile, SYNC_STATE_FILE)
+
+
+# An incremental sync needs a previous N-Triples file and a recent enough full rebuild
+
+def incrementalSyncPossible(category, categoryState):
+    if not categoryState or FORMAT != 'ntriples':
+        return False
+    lastFull = datetime.fromisoformat(categoryState['last_full'])
+    if datetime.now(timezone.utc) - lastFull > timedelta(days=FULL_SYNC_INTERVAL):
+        return False
+    return os.path.exists(getOutputFile(getCategoryFile(category)))
 
-logging.info('RDF database update initialization.')
 
-saveNamespaces()
+def syncResources(category, state, full=False):
+    # The start date is saved: resources modified during the export are fetched again next time
+    start = datetime.now(timezone.utc)
+    categoryState = state.get(category)
 
-logging.info('Starting items creation.')
-saveResources(ITEMS)
+    if not full and incrementalSyncPossible(category, categoryState):
+        changed = updateResources(category, datetime.fromisoformat(categoryState['synced_at']))
+        state[category] = dict(categoryState, synced_at=start.isoformat(), mode='incremental', changed=changed)
+    else:
+        saveResources(category)
+        state[category] = {'synced_at': start.isoformat(), 'last_full': start.isoformat(), 'mode': 'full'}
 
-logging.info('Starting medias creation.')
-saveResources(MEDIAS)
+    saveSyncState(state)
 
-logging.info('Starting collections creation.')
-saveResources(COLLECTIONS)
 
-logging.info('Updating files permissions')
-alterFilesPermissions()
+#### Main program ####
 
-logging.info('RDF database successfully updated.')
+# Load the RDF files into the triple store of the web application (graphs replaced atomically)
+
+def loadTripleStore():
+    loader = GraphStoreLoader(LOAD_UPDATE_URL, LOAD_STORE_URL, LOAD_METHOD, LOAD_BATCH_SIZE, LOAD_WORKERS,
+                              REQUEST_TIMEOUT, MAX_RETRIES, BACKOFF_FACTOR, LOAD_AUTH)
+    format = "nt" if FORMAT == "ntriples" else FORMAT
+    files = [(getOutputFile(getCategoryFile(category)), format, LOAD_GRAPH_BASE + name)
+             for category, name in ((ITEMS, "items"), (MEDIAS, "medias"), (COLLECTIONS, "collections"))]
+    #The version stamp is swapped with the data: the web application sees the new version with the new data
+    stamp = FILES_REPOSITORY + VERSION_FILE + ".nt"
+    if os.path.exists(stamp):
+        files.append((stamp, "nt", LOAD_GRAPH_BASE + "dataset"))
+    try:
+        loader.load(files)
+    except (requests.RequestException, OSError):
+        logging.exception("The RDF files could not be loaded into the triple store, its previous data is kept.")
+        sys.exit(1)
+    finally:
+        loader.close()
+
+
+def main():
+    global session
+
+    parser = argparse.ArgumentParser(description='Export of the Omeka S database to RDF files.')
+    parser.add_argument('--full', action='store_true',
+                        help='Rebuild all RDF files instead of applying the changes since the last sync')
+    parser.add_argument('--restore', metavar='YYYYmmdd',
+                        help='Restore the RDF files of a backup day (see --list-backups) and quit')
+    parser.add_argument('--restore-to', metavar='DIRECTORY', default=FILES_REPOSITORY,
+                        help='Destination of the restored files (default: FILES_REPOSITORY)')
+    parser.add_argument('--list-backups', action='store_true', help='List the backup days which can be restored')
+    parser.add_argument('--no-load', action='store_true', help='Do not load the RDF files into the triple store')
+    parser.add_argument('--load-only', action='store_true',
+                        help='Load the current RDF files into the triple store without exporting again')
+    args = parser.parse_args()
+
+    if args.list_backups:
+        for manifest in listManifests():
+            print(manifest[:8])
+        return
+
+    if args.restore:
+        logging.basicConfig(format='%(levelname)s - %(asctime)s - %(message)s', level=logging.INFO)
+        restoreBackup(args.restore, args.restore_to)
+        return
+
+    # Instanciate and configure a logger (first, so that the backup is logged too)
+
+    configureLogging()
+
+    if args.load_only:
+        loadTripleStore()
+        return
+
+    # Add backup archive and remove old files
+    createBackup()
+    cleanRepository()
+
+    logging.info('RDF database update initialization (' + ('full rebuild' if args.full else 'incremental sync') + ').')
+
+    session = createSession()
+    saveNamespaces()
+    state = loadSyncState()
+
+    logging.info('Starting items creation.')
+    syncResources(ITEMS, state, args.full)
+
+    logging.info('Starting medias creation.')
+    syncResources(MEDIAS, state, args.full)
+
+    logging.info('Starting collections creation.')
+    syncResources(COLLECTIONS, state, args.full)
+
+    # Publish the version of the exported data (content hash), polled by the web application
+    _, version = writeDatasetVersion(FILES_REPOSITORY, DATASET_URI,
+                                     [getOutputFile(getCategoryFile(c)) for c in (ITEMS, MEDIAS, COLLECTIONS)])
+    logging.info('Dataset version: ' + version)
+
+    logging.info('Updating files permissions')
+    alterFilesPermissions()
+
+    if LOAD_UPDATE_URL and not args.no_load:
+        logging.info('Loading the RDF files into the triple store.')
+        loadTripleStore()
+
+    logging.info('RDF database successfully updated.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
-import requests, json, rdflib, sys, logging
+import requests, json, rdflib, sys, logging, gzip, os
 
 from rdflib import Graph, RDF, RDFS, URIRef, Literal, Namespace
 from rdflib.namespace import XSD
+from rdflib.plugins.serializers.nt import _nt_row
 from constants import *
 
 #RDFLib library is used to create the RDF document (in Turtle syntax)
@@ -22,12 +23,7 @@ def initializeRDFdatabase():
 def saveGraphToFile(graph, category, format):
 
 	#Get the name of the file to
-	if category == ITEMS:
-		file = FILES_REPOSITORY + ITEMS_FILE
-	elif category == MEDIAS:
-		file = FILES_REPOSITORY + MEDIAS_FILE
-	else:
-		file = FILES_REPOSITORY + COLLECTIONS_FILE
+	file = getCategoryFile(category)
 
 	logging.info("Saving graph to file " + file + " using " + FORMAT + " serialization.")
 
@@ -37,6 +33,163 @@ def saveGraphToFile(graph, category, format):
 		logging.exception("An error occured during the creation of the RDF file: " + file)
 		logging.exception("Exception message:", exc_info=True)
 
+#Get the path of the RDF file of a category
+def getCategoryFile(category):
+	if category == ITEMS:
+		return FILES_REPOSITORY + ITEMS_FILE
+	elif category == MEDIAS:
+		return FILES_REPOSITORY + MEDIAS_FILE
+	else:
+		return FILES_REPOSITORY + COLLECTIONS_FILE
+
+#Name of the file actually written (".gz" is appended to compressed files)
+def getOutputFile(file, compress = COMPRESS):
+	return file + ".gz" if compress else file
+
+#Streaming replacement of the RDF graph: triples are written as N-Triples as soon as they are created,
+#so memory does not grow with the size of the collection. It exposes the same add() method as a Graph.
+#The output goes to a temporary file which only replaces the previous RDF file once the export is complete
+#(N-Triples is a subset of Turtle: the .ttl files remain readable by any Turtle parser).
+class TriplesWriter:
+
+	def __init__(self, file, format = FORMAT, compress = COMPRESS, patch = None):
+		self.format = format
+		self.compress = compress
+		self.file = getOutputFile(file, compress)
+		self.tmpFile = self.file + ".tmp"
+		self.count = 0
+		self.patch = patch
+		self.stream = self.openFile(self.tmpFile, "wb")
+
+	def openFile(self, file, mode):
+		return gzip.open(file, mode) if self.compress else open(file, mode)
+
+	def add(self, triple):
+		row = _nt_row(triple).encode("utf-8")
+		self.stream.write(row)
+		if self.patch is not None:
+			self.patch.write(row)
+		self.count += 1
+
+	#Write N-Triples rows already serialized (ex. by a conversion worker)
+	def writeRows(self, rows, count):
+		self.stream.write(rows)
+		if self.patch is not None:
+			self.patch.write(rows)
+		self.count += count
+
+	#Copy the triples of the previous file, except those describing the given subjects (incremental sync)
+	#N-Triples lines start with the subject, so resources are replaced without parsing the file
+	def copyPreviousFile(self, excludedSubjects):
+		excluded = set(("<" + subject + ">").encode("utf-8") for subject in excludedSubjects)
+		with self.openFile(self.file, "rb") as previous:
+			for line in previous:
+				if line.split(b" ", 1)[0] not in excluded:
+					self.stream.write(line)
+					self.count += 1
+
+	#Publish the file: optional conversion to another serialization, then atomic rename
+	def close(self):
+		self.stream.close()
+
+		if self.format != "ntriples":
+			#The conversion loads the whole graph in memory (prefixed, more compact output)
+			logging.info("Converting " + self.file + " to " + self.format + " serialization.")
+			graph = initializeRDFdatabase()
+			with self.openFile(self.tmpFile, "rb") as source:
+				graph.parse(source, format = "nt")
+			convertedFile = self.tmpFile + ".converted"
+			with self.openFile(convertedFile, "wb") as destination:
+				graph.serialize(destination = destination, format = self.format)
+			os.replace(convertedFile, self.tmpFile)
+
+		os.replace(self.tmpFile, self.file)
+		if self.patch is not None:
+			self.patch.close()
+		logging.info("Saved " + str(self.count) + " triples to file " + self.file + ".")
+
+	#Drop the temporary file and keep the previous RDF file
+	def abort(self):
+		self.stream.close()
+		if os.path.exists(self.tmpFile):
+			os.remove(self.tmpFile)
+		if self.patch is not None:
+			self.patch.abort()
+
+#SPARQL Update patch replacing the description of the changed resources, for triple stores
+#which are updated in place instead of reloading the RDF files (ex: Fuseki "s-update")
+class PatchWriter:
+
+	def __init__(self, file, subjects):
+		self.file = file
+		self.tmpFile = file + ".tmp"
+		self.stream = open(self.tmpFile, "wb")
+		for subject in subjects:
+			self.stream.write(("DELETE WHERE { <" + subject + "> ?p ?o } ;\n").encode("utf-8"))
+		self.stream.write(b"INSERT DATA {\n")
+
+	def write(self, row):
+		self.stream.write(row)
+
+	def close(self):
+		self.stream.write(b"}\n")
+		self.stream.close()
+		os.replace(self.tmpFile, self.file)
+		logging.info("SPARQL Update patch saved to file " + self.file + ".")
+
+	def abort(self):
+		self.stream.close()
+		if os.path.exists(self.tmpFile):
+			os.remove(self.tmpFile)
+
+#Lookup tables built from the Omeka S vocabularies (see saveNamespaces): Omeka key (ex. "dcterms:subject")
+#-> full predicate URI (ex. http://purl.org/dc/terms/subject), or None for keys which are not saved.
+#Each key is resolved once, the first time it is met, instead of once per value of every item.
+predicates = {}
+classes = {}
+unknownPrefixes = set()
+
+#Reset the lookup tables (ex. in a conversion worker receiving the vocabularies)
+def setNamespaces(vocabularies):
+	namespaces.clear()
+	namespaces.update(vocabularies)
+	predicates.clear()
+	classes.clear()
+	unknownPrefixes.clear()
+
+def resolvePrefixedName(name, resourceId):
+	prefix, _, localName = name.partition(":")
+	if prefix in namespaces:
+		return URIRef(namespaces[prefix] + localName)
+	if prefix not in unknownPrefixes:
+		# a non declared namespace,
+		# often an omeka module property (ex: "o-module-mapping:" for map module)
+		unknownPrefixes.add(prefix)
+		logging.info(f"prefix {prefix} not found (key {name}, first met for resource {resourceId})")
+	return None
+
+def getPredicate(key, resourceId):
+	if key not in predicates:
+		#2 conditions are required to save only required property and values
+		#The first thing to check is that the format of the key is "prefix:value" (ex. dcterms:subject)
+		#The second thing is to avoid saving Omeka S related content (ex. "o:resource_class"
+		# or "o-module-mapping:marker")
+		if ":" in key and not (key.startswith("o:") or key.startswith("o-module")):
+			predicates[key] = resolvePrefixedName(key, resourceId)
+		else:
+			predicates[key] = None
+	return predicates[key]
+
+def getClass(type, resourceId):
+	if type not in classes:
+		# We want to save the type associated with items,
+		# but not saving that every item is an Omeka item (o:item)
+		if ":" in type and not type.startswith("o:"):
+			classes[type] = resolvePrefixedName(type, resourceId)
+		else:
+			classes[type] = None
+	return classes[type]
+
 #Add the given items to the RDF database by creating appropriate triples
 def createItemsTriples(items, graph):
 
@@ -54,46 +207,28 @@ def createItemsTriples(items, graph):
 					graph.add( (uri, O.item_set, URIRef(item_set["@id"].strip())) )
 
 			#All properties
-			for key in item:
-				#2 conditions are required to save only required property and values
-				#The first thing to check is that the format of the key is "prefix:value" (ex. dcterms:subject)
-				#The second thing is to avoid saving Omeka S related content (ex. "o:resource_class"
-				# or "o-module-mapping:marker")
-				#if only retrieve (isinstance(item[key], list) and
-				#in other cases a Warning strange prefix is logged
-				if ":" in key and not (key.startswith("o:") or key.startswith("o-module")):
-					prefix = key[0:key.index(":")]
-					if prefix not in namespaces:
-						# a non declared namespace,
-						# often an omeka module property (ex: "o-module-mapping:" for map module)
-						# go to next key
-						logging.info(f"prefix {prefix} not found for item {item}")
-						continue
-					for element in item[key]:
-						#Omeka returns predicate under the form "prefix:value" (ex. dcterms:subject)
-						#But  RDFlib method needs the full URI to create the RDF node (ex. http://purl.org/dc/terms/subject )
-						#which is part of a triple (prefixes given as keys of json resources)
-
-						if len(prefix) > 0:
-							predicate = URIRef(namespaces[prefix] + key[len(prefix) + 1:])
-							if "@value" in element:
-								graph.add( (uri, predicate, Literal(element["@value"])) )
-
-							if "@id" in element:
-								if element["@id"].strip().startswith("http"):
-									graph.add( (uri, predicate, URIRef(element["@id"].strip())) )
-								else:
-									graph.add( (uri, predicate, Literal(element["@id"].strip())) )
-
-
-			# We want to save the type associated with items,
-			# but not saving that every item is an Omeka item (o:item)
+			for key, elements in item.items():
+				#Omeka returns predicate under the form "prefix:value" (ex. dcterms:subject)
+				#But  RDFlib method needs the full URI to create the RDF node (ex. http://purl.org/dc/terms/subject )
+				#which is part of a triple (prefixes given as keys of json resources)
+				predicate = getPredicate(key, item["@id"])
+				if predicate is None:
+					continue
+				for element in elements:
+					if "@value" in element:
+						graph.add( (uri, predicate, Literal(element["@value"])) )
+
+					if "@id" in element:
+						value = element["@id"].strip()
+						if value.startswith("http"):
+							graph.add( (uri, predicate, URIRef(value)) )
+						else:
+							graph.add( (uri, predicate, Literal(value)) )
+
 			for type in item["@type"]:
-				if ":" in type and not type.startswith("o:"):
-					prefix = type[0:type.index(":")]
-					if len(prefix) > 0:
-						object = URIRef(namespaces[prefix] + type[len(prefix) + 1:])
-						graph.add( (uri, RDF.type, object) )
+				object = getClass(type, item["@id"])
+				if object is not None:
+					graph.add( (uri, RDF.type, object) )
 
 		except:
 			logging.exception("An error occured for item with id: " + str(item["@id"]))
@@ -144,3 +279,36 @@ def createCollectionsTriples(collections, graph):
 				logging.exception("An error occured for set with id: " + str(set["@id"]))
 				logging.exception("Exception message:", exc_info=True)
 				continue #Go to next collection
+
+#Create the triples of a category
+def createTriples(category, resources, graph):
+	if category == ITEMS:
+		createItemsTriples(resources, graph)
+	elif category == MEDIAS:
+		createMediasTriples(resources, graph)
+	else:
+		createCollectionsTriples(resources, graph)
+
+#Collects N-Triples rows in memory (conversion of one page in a worker process)
+class RowsCollector:
+
+	def __init__(self):
+		self.rows = []
+
+	def add(self, triple):
+		self.rows.append(_nt_row(triple))
+
+	def getvalue(self):
+		return "".join(self.rows).encode("utf-8")
+
+#Initializer of the conversion worker processes
+def initializeConversionWorker(vocabularies):
+	setNamespaces(vocabularies)
+
+#Convert one API page (raw JSON response) to N-Triples
+#Returns (N-Triples bytes, number of resources, number of triples)
+def convertPage(category, content):
+	resources = json.loads(content)
+	collector = RowsCollector()
+	createTriples(category, resources, collector)
+	return collector.getvalue(), len(resources), len(collector.rows)
@@ -1,14 +1,26 @@
-import pandas as pd
 import re
+import json
 import time
+import socket
 import logging
 import ssl
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from SPARQLWrapper import SPARQLWrapper, JSON, POST
+import Constants
 from Constants import (
-    ENDPOINTS, CUSTOM_PREFIX, RESOURCE_TYPES, 
-    HIDDEN_PROPERTIES, LABEL_PROPERTIES, MAIN_NAMESPACE
+    ENDPOINTS, RESOURCE_TYPES, PREFIXES,
+    HIDDEN_PROPERTIES, LABEL_PROPERTIES, MAIN_NAMESPACE,
+    SPARQL_TIMEOUT, SPARQL_POOL_SIZE, FILTER_REWRITE,
+    SCHEMA_TTL, SCHEMA_RETRY_INTERVAL, SCHEMA_PROPERTY_LIMIT, SCHEMA_SNAPSHOT_PATH, RESULT_CACHE_MAX_ENTRIES
+)
+from schema_registry import SchemaRegistry
+from query_rewriter import rewrite_filters, sparql_literal, is_iri
+import embedded_store
+from mirror import mirrors
+from dataset_versions import dataset_versions, EndpointCache
+import tracing
+from metrics import (
+    Gauge, SPARQL_LATENCY, SPARQL_RESPONSE_BYTES, SPARQL_ROWS, SPARQL_ERRORS, SPARQL_INFLIGHT, CACHE_REQUESTS
 )
 
 try:
@@ -21,51 +33,133 @@ else:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def execute_single_query(query, endpoint_url):
-    """Exécute une requête SPARQL sur un endpoint unique."""
+# Pool partagé pour les requêtes fédérées (évite de recréer des threads à chaque requête)
+_query_pool = ThreadPoolExecutor(max_workers=SPARQL_POOL_SIZE, thread_name_prefix="sparql")
+Gauge("sparql_pool_size", "Nombre de threads du pool de requêtes SPARQL", callback=lambda: {(): SPARQL_POOL_SIZE})
+
+# Résultats par endpoint des requêtes dont le résultat était déjà mis en cache (schéma, valeurs, détails) :
+# après un export, seules les entrées de l'endpoint modifié sont recalculées
+query_results = EndpointCache("sparql_results", RESULT_CACHE_MAX_ENTRIES)
+dataset_versions.register_cache(query_results)
+Gauge("sparql_result_cache_entries", "Résultats SPARQL par endpoint en cache", callback=lambda: {(): len(query_results)})
+
+def endpoint_name(endpoint_url):
+    """Nom configuré d'un endpoint (utilisé comme label de métrique), à défaut son URL."""
+    for ep in ENDPOINTS:
+        if ep['url'] == endpoint_url:
+            return ep.get('name', endpoint_url)
+    return endpoint_url
+
+def _error_type(e):
+    """Catégorie d'erreur pour les métriques : les timeouts sont distingués des autres exceptions."""
+    if isinstance(e, (socket.timeout, TimeoutError)) or isinstance(getattr(e, 'reason', None), (socket.timeout, TimeoutError)):
+        return "timeout"
+    return type(e).__name__
+
+def _run_remote_query(query, endpoint_url):
+    """Interroge un endpoint SPARQL HTTP et retourne (variables, lignes de valeurs, taille de la réponse en octets)."""
+    from SPARQLWrapper import SPARQLWrapper, JSON, POST
+
+    sparql = SPARQLWrapper(endpoint_url)
+    sparql.setQuery(query)
+    sparql.setReturnFormat(JSON)
+    sparql.setMethod(POST)
+    sparql.setTimeout(SPARQL_TIMEOUT)
+
+    raw = sparql.query().response.read()
+    results = json.loads(raw)
+
+    if 'results' in results and 'bindings' in results['results']:
+        vars_list = results['head']['vars']
+        rows = [[binding[var]['value'] if var in binding else None for var in vars_list]
+                for binding in results['results']['bindings']]
+        return vars_list, rows, len(raw)
+    return [], [], len(raw)
+
+def _run_embedded_query(query, endpoint_url):
+    """Évalue la requête sur un store embarqué (pas d'aller-retour HTTP, taille de réponse nulle)."""
+    vars_list, rows = embedded_store.get_store(endpoint_url).query(query)
+    return vars_list, rows, 0
+
+def execute_single_query(query, endpoint_url, strict=False, use_cache=False):
+    """
+    Exécute une requête SPARQL sur un endpoint unique (distant, embarqué ou servi par son miroir local).
+    En mode `strict`, les erreurs sont propagées au lieu de retourner un DataFrame vide.
+    Avec `use_cache`, le résultat est conservé jusqu'au prochain changement de version de l'endpoint.
+    """
+    # Import différé : pandas n'est chargé qu'à la première requête
+    import pandas as pd
+
+    if use_cache:
+        hit, cached_df = query_results.get(endpoint_url, query)
+        CACHE_REQUESTS.inc(query_results.name, "hit" if hit else "miss")
+        tracing.record_cache(query_results.name, hit)
+        if hit:
+            return cached_df.copy()
+
+    name = endpoint_name(endpoint_url)
+    rows, size, error, served = 0, 0, None, "none"
+    start = time.perf_counter()
+    SPARQL_INFLIGHT.inc()
     try:
-        sparql = SPARQLWrapper(endpoint_url)
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        sparql.setMethod(POST)
-        sparql.setTimeout(45)
-        
-        results = sparql.query().convert()
-        
-        if 'results' in results and 'bindings' in results['results']:
-            bindings = results['results']['bindings']
-            if not bindings:
-                return pd.DataFrame()
-            
-            vars_list = results['head']['vars']
-            data = []
-            for binding in bindings:
-                row = {}
-                for var in vars_list:
-                    row[var] = binding[var]['value'] if var in binding else None
-                data.append(row)
-            return pd.DataFrame(data)
-        return pd.DataFrame()
+        mirror_store = mirrors.store_for(endpoint_url)
+        if embedded_store.is_embedded(endpoint_url):
+            vars_list, data, size = _run_embedded_query(query, endpoint_url)
+        elif mirror_store is not None:
+            served = "mirror"
+            vars_list, data = mirror_store.query(query)
+        else:
+            vars_list, data, size = _run_remote_query(query, endpoint_url)
+        rows = len(data)
+        SPARQL_RESPONSE_BYTES.observe(name, value=size)
+        SPARQL_ROWS.inc(name, amount=rows)
+        df = pd.DataFrame(data, columns=vars_list) if data else pd.DataFrame()
+        if use_cache:
+            query_results.set(endpoint_url, query, df.copy())
+        return df
             
     except Exception as e:
+        error = _error_type(e)
+        SPARQL_ERRORS.inc(name, error)
         logger.warning(f"Timeout ou erreur sur {endpoint_url}: {e}")
+        if strict:
+            raise
         return pd.DataFrame()
+    finally:
+        duration = time.perf_counter() - start
+        SPARQL_INFLIGHT.dec()
+        SPARQL_LATENCY.observe(name, value=duration)
+        tracing.record_query(query, name, duration, rows=rows, size=size, cache=served, error=error)
+
+def execute_raw_query(query, specific_endpoint=None, strict=False, use_cache=False, endpoint_urls=None):
+    """
+    Exécute la requête de manière fédérée et fusionne les résultats.
+    En mode `strict`, une erreur sur un seul endpoint fait échouer l'ensemble (résultat incomplet).
+    `endpoint_urls` restreint l'exécution aux endpoints listés.
+    """
+    import pandas as pd
 
-def execute_raw_query(query, specific_endpoint=None):
-    """Exécute la requête de manière fédérée et fusionne les résultats."""
     if specific_endpoint:
-        return execute_single_query(query, specific_endpoint)
+        return execute_single_query(query, specific_endpoint, strict=strict, use_cache=use_cache)
 
     dataframes = []
-    with ThreadPoolExecutor(max_workers=len(ENDPOINTS) or 1) as executor:
-        future_to_url = {executor.submit(execute_single_query, query, ep['url']): ep for ep in ENDPOINTS}
-        for future in as_completed(future_to_url):
-            try:
-                df = future.result()
-                if not df.empty:
-                    dataframes.append(df)
-            except Exception as e:
-                logger.error(f"Erreur thread: {e}")
+    errors = []
+    future_to_url = {
+        tracing.submit(_query_pool, execute_single_query, query, ep['url'], strict, use_cache): ep
+        for ep in ENDPOINTS if endpoint_urls is None or ep['url'] in endpoint_urls
+    }
+    # Fusion dans l'ordre des endpoints (et non d'arrivée) : un même état des données donne le même résultat
+    for future in future_to_url:
+        try:
+            df = future.result()
+            if not df.empty:
+                dataframes.append(df)
+        except Exception as e:
+            logger.error(f"Erreur thread: {e}")
+            errors.append(f"{future_to_url[future]['name']}: {e}")
+
+    if strict and errors:
+        raise RuntimeError("; ".join(errors))
 
     if not dataframes:
         return pd.DataFrame()
@@ -98,36 +192,84 @@ def extract_label_from_uri(uri):
     if '#' in uri: return uri.split('#')[-1].replace('_', ' ')
     return uri.split('/')[-1].replace('_', ' ')
 
-@lru_cache(maxsize=3600)
-def get_classes():
-    """Récupère les classes (Hybride : Config + Découverte légère)."""
+def configured_classes():
+    """Classes déclarées dans la configuration (manual_class_mapping)."""
     classes_list = []
     seen_uris = set()
-
-    if RESOURCE_TYPES:
-        for label, uri in RESOURCE_TYPES.items():
-            if uri not in seen_uris:
-                classes_list.append({"label": label, "uri": uri, "source": "config"})
-                seen_uris.add(uri)
-
-    query = f"""{CUSTOM_PREFIX} SELECT DISTINCT ?type WHERE {{ ?s a ?type }} LIMIT 50"""
+    for label, uri in RESOURCE_TYPES.items():
+        if uri not in seen_uris:
+            classes_list.append({"label": label, "uri": uri, "source": "config"})
+            seen_uris.add(uri)
+    return classes_list
+
+def discover_classes():
+    """Découvre les classes (Hybride : Config + Découverte légère). Lève une erreur si un endpoint échoue."""
+    classes_list = configured_classes()
+    seen_uris = set(c['uri'] for c in classes_list)
+
+    query = f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?type WHERE {{ ?s a ?type }} LIMIT 50"""
     
-    try:
-        df = execute_raw_query(query)
-        for _, row in df.iterrows():
-            uri = row['type']
-            if uri not in seen_uris:
-                classes_list.append({"label": extract_label_from_uri(uri), "uri": uri, "source": "auto"})
-                seen_uris.add(uri)
-    except Exception as e:
-        logger.warning(f"Erreur découverte classes: {e}")
+    df = execute_raw_query(query, strict=True, use_cache=True)
+    for _, row in df.iterrows():
+        uri = row['type']
+        if uri not in seen_uris:
+            classes_list.append({"label": extract_label_from_uri(uri), "uri": uri, "source": "auto"})
+            seen_uris.add(uri)
 
     return sorted(classes_list, key=lambda x: x['label'])
 
+def discover_properties():
+    """Découvre les propriétés utilisées dans les données (hors propriétés masquées)."""
+    q = f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?property WHERE {{ ?s ?property ?o . FILTER(isIRI(?property)) }} LIMIT {SCHEMA_PROPERTY_LIMIT}"""
+    df = execute_raw_query(q, strict=True, use_cache=True)
+    props = []
+    seen = set()
+    for _, row in df.iterrows():
+        uri = row['property']
+        if uri not in HIDDEN_PROPERTIES and uri not in seen:
+            seen.add(uri)
+            props.append({'uri': uri, 'label': extract_label_from_uri(uri)})
+    return sorted(props, key=lambda x: x['label'])
+
+def discover_prefixes():
+    """Table des préfixes : configuration + espaces de noms standards."""
+    prefixes = {
+        "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+        "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+        "xsd": "http://www.w3.org/2001/XMLSchema#",
+        "owl": "http://www.w3.org/2002/07/owl#",
+        "skos": "http://www.w3.org/2004/02/skos/core#"
+    }
+    prefixes.update(PREFIXES)
+    return prefixes
+
+schema_registry = SchemaRegistry(
+    {"classes": discover_classes, "properties": discover_properties, "prefixes": discover_prefixes},
+    ttl=SCHEMA_TTL,
+    retry_interval=SCHEMA_RETRY_INTERVAL,
+    snapshot_path=SCHEMA_SNAPSHOT_PATH
+)
+Gauge("schema_registry_staleness_seconds", "Âge du dernier rafraîchissement complet du schéma",
+      callback=lambda: {(): schema_registry.stats()['staleness_seconds']})
+Gauge("schema_registry_refresh_duration_seconds", "Durée du dernier rafraîchissement du schéma",
+      callback=lambda: {(): schema_registry.last_refresh_duration})
+Gauge("schema_registry_refresh_failures", "Rafraîchissements du schéma incomplets",
+      callback=lambda: {(): schema_registry.failure_count})
+
+def get_classes(wait=True):
+    """
+    Classes disponibles, servies par le registre de schéma (sans requête SPARQL).
+    Avec `wait=False`, on n'attend pas la fin du préchauffage : les classes configurées sont retournées.
+    """
+    classes = schema_registry.get("classes", wait=wait)
+    if classes is None:
+        return sorted(configured_classes(), key=lambda x: x['label'])
+    return list(classes)
+
 def analyze_class_structure(class_uri):
     """Analyse approfondie (A-Box) pour détecter relations."""
     query = f"""
-    {CUSTOM_PREFIX}
+    {Constants.CUSTOM_PREFIX}
     SELECT DISTINCT ?p ?rangeType WHERE {{
         {{ SELECT ?s WHERE {{ ?s a <{class_uri}> }} LIMIT 20 }}
         ?s ?p ?o .
@@ -149,9 +291,10 @@ def get_ontology_structure():
     relations_dict = {}
 
     with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_uri = {executor.submit(analyze_class_structure, c['uri']): c['uri'] for c in all_classes}
+        future_to_uri = {tracing.submit(executor, analyze_class_structure, c['uri']): c['uri'] for c in all_classes}
         
-        for future in as_completed(future_to_uri):
+        # Dans l'ordre des classes : la structure (et son ETag) ne dépend pas de l'ordre d'arrivée des réponses
+        for future in future_to_uri:
             source_class_uri = future_to_uri[future]
             try:
                 df = future.result()
@@ -196,16 +339,20 @@ def get_ontology_structure():
         "relations": final_relations
     }
 
-@lru_cache(maxsize=3600)
 def get_properties(search_text=None, limit=50):
-    filter_clause = ""
-    if search_text:
-        safe_text = search_text.replace('"', '\\"')
-        filter_clause = f'FILTER(CONTAINS(LCASE(STR(?property)), LCASE("{safe_text}")))'
+    """Propriétés disponibles : liste du registre de schéma, ou recherche SPARQL si un texte est fourni."""
+    if not search_text:
+        return list(schema_registry.get("properties", []))[:limit]
+    return search_properties(search_text, limit)
+
+@lru_cache(maxsize=3600)
+def search_properties(search_text, limit=50):
+    safe_text = search_text.replace('"', '\\"')
+    filter_clause = f'FILTER(CONTAINS(LCASE(STR(?property)), LCASE("{safe_text}")))'
     
-    q = f"""{CUSTOM_PREFIX} SELECT DISTINCT ?property WHERE {{ ?s ?property ?o . FILTER(isIRI(?property)) {filter_clause} }} LIMIT {limit}"""
+    q = f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?property WHERE {{ ?s ?property ?o . FILTER(isIRI(?property)) {filter_clause} }} LIMIT {limit}"""
     
-    df = execute_raw_query(q)
+    df = execute_raw_query(q, use_cache=True)
     props = []
     seen = set()
     for _, row in df.iterrows():
@@ -223,9 +370,9 @@ def get_unique_values(prop_uri, search_text=None, limit=50):
         safe_text = search_text.replace('"', '\\"')
         filter_clause = f'FILTER(CONTAINS(LCASE(?label), LCASE("{safe_text}")) || CONTAINS(LCASE(STR(?value)), LCASE("{safe_text}")))'
 
-    q = f"""{CUSTOM_PREFIX} SELECT DISTINCT ?value ?label WHERE {{ ?s <{prop_uri}> ?value . {opt_labels} BIND({coal_label} AS ?label) {filter_clause} }} LIMIT {limit}"""
+    q = f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?value ?label WHERE {{ ?s <{prop_uri}> ?value . {opt_labels} BIND({coal_label} AS ?label) {filter_clause} }} LIMIT {limit}"""
     
-    df = execute_raw_query(q)
+    df = execute_raw_query(q, use_cache=True)
     res = []
     seen = set()
     for _, row in df.iterrows():
@@ -235,8 +382,47 @@ def get_unique_values(prop_uri, search_text=None, limit=50):
         res.append({"value": row.get('label', v) or v, "uri": v})
     return res
 
-def build_sparql_query(filters_dict, logic="AND"):
-    """Construit la requête SPARQL de filtrage avec logique ET/OU."""
+def build_sparql_query(filters_dict, logic="AND", rewrite=None):
+    """
+    Construit la requête SPARQL de filtrage avec logique ET/OU. Par défaut (`sparql.rewrite_filters`),
+    les filtres sont réécrits en motifs indexables (query_rewriter.py) ; sinon chaque valeur est
+    comparée dans un FILTER, sans tenir compte de la casse.
+    """
+    if rewrite is None:
+        rewrite = FILTER_REWRITE
+    conditions = rewrite_filters(filters_dict) if rewrite else _legacy_filter_conditions(filters_dict)
+
+    if not conditions:
+        opt_labels, coal_label = build_label_selection("?subject", "?subjectLabel", "_m")
+        return f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?subject ?subjectLabel WHERE {{ ?subject a ?type . {opt_labels} BIND({coal_label} AS ?subjectLabel) }} LIMIT 100"""
+
+    where_body = ""
+    if logic == "OR":
+        union_blocks = [f"{{ {cond} }}" for cond in conditions]
+        where_body = " UNION ".join(union_blocks)
+    else:
+        where_body = "\n".join(conditions)
+    # Motifs réécrits avant le type : l'évaluation part des sujets filtrés
+    where_body = f"{where_body}\n?subject a ?type ." if rewrite else f"?subject a ?type . {where_body}"
+
+    opt_labels, coal_label = build_label_selection("?subject", "?subjectLabel", "_m")
+    
+    return f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?subject ?subjectLabel WHERE {{ {{ SELECT DISTINCT ?subject WHERE {{ {where_body} }} LIMIT 1000 }} {opt_labels} BIND({coal_label} AS ?subjectLabel) }} LIMIT 1000"""
+
+def filter_patterns(filters_dict, rewrite=None):
+    """Motif de groupe de chaque propriété filtrée, évaluable seul : liste de (propriété, motif)."""
+    if rewrite is None:
+        rewrite = FILTER_REWRITE
+    build = rewrite_filters if rewrite else _legacy_filter_conditions
+    patterns = []
+    for prop_uri, filter_data in filters_dict.items():
+        conditions = build({prop_uri: filter_data})
+        if conditions:
+            patterns.append((prop_uri, conditions[0]))
+    return patterns
+
+def _legacy_filter_conditions(filters_dict):
+    """Conditions historiques : LCASE(STR()) et conversions xsd:decimal() dans des FILTER."""
     conditions = []
     var_counter = 0
 
@@ -268,25 +454,11 @@ def build_sparql_query(filters_dict, logic="AND"):
             
             if or_conds:
                 conditions.append(f"?subject <{prop_uri}> {val_var} . FILTER({' || '.join(or_conds)})")
-
-    if not conditions:
-        opt_labels, coal_label = build_label_selection("?subject", "?subjectLabel", "_m")
-        return f"""{CUSTOM_PREFIX} SELECT DISTINCT ?subject ?subjectLabel WHERE {{ ?subject a ?type . {opt_labels} BIND({coal_label} AS ?subjectLabel) }} LIMIT 100"""
-
-    where_body = ""
-    if logic == "OR":
-        union_blocks = [f"{{ {cond} }}" for cond in conditions]
-        where_body = " UNION ".join(union_blocks)
-    else:
-        where_body = "\n".join(conditions)
-
-    opt_labels, coal_label = build_label_selection("?subject", "?subjectLabel", "_m")
-    
-    return f"""{CUSTOM_PREFIX} SELECT DISTINCT ?subject ?subjectLabel WHERE {{ {{ SELECT DISTINCT ?subject WHERE {{ ?subject a ?type . {where_body} }} LIMIT 1000 }} {opt_labels} BIND({coal_label} AS ?subjectLabel) }} LIMIT 1000"""
+    return conditions
 
 def get_graph_exploration(resource_uri, depth=2):
     if not resource_uri.startswith('<'): resource_uri = f"<{resource_uri}>"
-    query = f"""{CUSTOM_PREFIX} SELECT DISTINCT ?start ?startLabel ?startType ?predicate ?predicateLabel ?end ?endLabel ?endType ?direction ?depth WHERE {{ BIND({resource_uri} AS ?central) {{ {{ ?central ?predicate ?end . BIND(?central AS ?start) BIND("descendant" AS ?direction) BIND(1 AS ?depth) }} UNION {{ ?start ?predicate ?central . BIND(?central AS ?end) BIND("ancestor" AS ?direction) BIND(1 AS ?depth) }} }} OPTIONAL {{ ?start rdfs:label ?startLabel }} OPTIONAL {{ ?end rdfs:label ?endLabel }} OPTIONAL {{ ?predicate rdfs:label ?predicateLabel }} FILTER(isIRI(?start) && isIRI(?end)) FILTER(?predicate != rdf:type) }} LIMIT 500"""
+    query = f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?start ?startLabel ?startType ?predicate ?predicateLabel ?end ?endLabel ?endType ?direction ?depth WHERE {{ BIND({resource_uri} AS ?central) {{ {{ ?central ?predicate ?end . BIND(?central AS ?start) BIND("descendant" AS ?direction) BIND(1 AS ?depth) }} UNION {{ ?start ?predicate ?central . BIND(?central AS ?end) BIND("ancestor" AS ?direction) BIND(1 AS ?depth) }} }} OPTIONAL {{ ?start rdfs:label ?startLabel }} OPTIONAL {{ ?end rdfs:label ?endLabel }} OPTIONAL {{ ?predicate rdfs:label ?predicateLabel }} FILTER(isIRI(?start) && isIRI(?end)) FILTER(?predicate != rdf:type) }} LIMIT 500"""
     
     try:
         df = execute_raw_query(query)
@@ -306,45 +478,13 @@ def get_resources_by_type(rt):
     if not uri and str(rt).startswith('http'): uri = rt
     if not uri: return []
     opt_labels, coal_label = build_label_selection("?r", "?l", "_t")
-    q = f"""{CUSTOM_PREFIX} SELECT DISTINCT ?r ?l WHERE {{ ?r a <{uri}> . {opt_labels} BIND({coal_label} AS ?l) }} LIMIT 500"""
-    df = execute_raw_query(q)
+    q = f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?r ?l WHERE {{ ?r a <{uri}> . {opt_labels} BIND({coal_label} AS ?l) }} LIMIT 500"""
+    df = execute_raw_query(q, use_cache=True)
     return [{"uri": r['r'], "label": r.get('l', extract_label_from_uri(r['r']))} for _, r in df.iterrows()]
 
-def query_sparql(uri):
-    """
-    Récupère les détails. Inclut la correction pour afficher les Valeurs
-    quand les Labels sont vides.
-    """
-    if not uri.startswith('<'): uri = f"<{uri}>"
-    opt_labels, coal_label = build_label_selection("?value", "?valueLabel", "_det")
-    q = f"""{CUSTOM_PREFIX} SELECT ?property ?value ?valueLabel WHERE {{ {uri} ?property ?value . {opt_labels} BIND({coal_label} AS ?valueLabel) }} LIMIT 1000"""
-    
-    df = execute_raw_query(q)
-    
-    if not df.empty:
-        # 1. Renommage normalisé des colonnes
-        rename_map = {
-            'property': 'Property', 'value': 'Value', 'valueLabel': 'ValueLabel',
-            'Property': 'Property', 'Value': 'Value', 'ValueLabel': 'ValueLabel'
-        }
-        df.rename(columns=rename_map, inplace=True)
-        
-        # 2. FIX CRITIQUE : Remplissage des labels vides
-        # Si 'ValueLabel' n'existe pas ou est vide, on prend 'Value'
-        if 'Value' in df.columns:
-            if 'ValueLabel' not in df.columns:
-                df['ValueLabel'] = df['Value']
-            else:
-                # On remplace les NaN par chaine vide puis on applique le fallback
-                df['ValueLabel'] = df['ValueLabel'].fillna('')
-                df['ValueLabel'] = df.apply(
-                    lambda x: x['ValueLabel'] if str(x['ValueLabel']).strip() != '' else x['Value'],
-                    axis=1
-                )
-    
-    return df
-
 def get_bulk_details(uris):
+    import pandas as pd
+
     if not uris: return pd.DataFrame()
     clean_uris = [f"<{u}>" if not str(u).startswith('<') else u for u in uris]
     all_data = []
@@ -354,7 +494,7 @@ def get_bulk_details(uris):
     
     for i in range(0, len(clean_uris), chunk_size):
         chunk = clean_uris[i:i + chunk_size]
-        q = f"""{CUSTOM_PREFIX} SELECT DISTINCT ?subject ?subjectLabel ?property ?value ?valueLabel WHERE {{ VALUES ?subject {{ {" ".join(chunk)} }} ?subject ?property ?value . {opt_labels_sub} BIND({coal_label_sub} AS ?subjectLabel) {opt_labels_val} BIND({coal_label_val} AS ?valueLabel) }}"""
+        q = f"""{Constants.CUSTOM_PREFIX} SELECT DISTINCT ?subject ?subjectLabel ?property ?value ?valueLabel WHERE {{ VALUES ?subject {{ {" ".join(chunk)} }} ?subject ?property ?value . {opt_labels_sub} BIND({coal_label_sub} AS ?subjectLabel) {opt_labels_val} BIND({coal_label_val} AS ?valueLabel) }}"""
         df = execute_raw_query(q)
         if not df.empty: all_data.append(df)
     
@@ -364,21 +504,62 @@ def get_bulk_details(uris):
         return final_df
     return pd.DataFrame()
 
-def search_resources(text, limit=20, resource_type=None):
-    safe_text = text.replace('"', '\\"')
-    limit = min(limit, 50)
-    tf = f"?subject a <{RESOURCE_TYPES[resource_type]}> ." if resource_type and resource_type in RESOURCE_TYPES else ""
-    opt_labels, coal_label = build_label_selection("?subject", "?label", "_srch")
-    q = f"""{CUSTOM_PREFIX} SELECT DISTINCT ?subject ?label ?type WHERE {{ {{ SELECT DISTINCT ?subject ?label WHERE {{ ?subject rdfs:label ?label . FILTER(CONTAINS(LCASE(?label), LCASE("{safe_text}"))) }} LIMIT {limit} }} {tf} OPTIONAL {{ ?subject a ?type }} BIND(?label as ?finalLabel) }}"""
-    return execute_raw_query(q)
-
-def get_resource_metadata(uri):
-    if not uri.startswith('<'): uri = f"<{uri}>"
-    opt_labels, coal_label = build_label_selection(uri, "?label", "_meta")
-    q = f"""{CUSTOM_PREFIX} SELECT ?type ?label WHERE {{ {uri} a ?type . {opt_labels} BIND({coal_label} AS ?label) }} LIMIT 1"""
-    df = execute_raw_query(q)
-    meta = {"label": "Inconnu", "type": "Resource", "uri": uri.strip('<>')}
-    if not df.empty:
-        meta['label'] = df.iloc[0].get('label', meta['label'])
-        if df.iloc[0].get('type'): meta['type'] = df.iloc[0]['type'].split('/')[-1]
-    return meta
\ No newline at end of file
+def normalize_search_text(text):
+    """Texte de recherche normalisé (espaces, casse) : une même recherche produit la même requête, donc le même cache."""
+    return " ".join(str(text).split()).lower()
+
+def resolve_resource_type(resource_type):
+    """URI de classe d'un filtre de type : clé de RESOURCE_TYPES, label d'une classe connue ou URI."""
+    if not resource_type:
+        return None
+    if resource_type in RESOURCE_TYPES:
+        return RESOURCE_TYPES[resource_type]
+    for c in get_classes(wait=False):
+        if c['label'] == resource_type:
+            return c['uri']
+    return resource_type if is_iri(resource_type) else None
+
+def search_pattern(text, type_uri=None):
+    """Motif de la recherche plein texte (labels contenant le texte), partagé par la page de résultats et les facettes."""
+    type_filter = f" ?subject a <{type_uri}> ." if type_uri else ""
+    return f"?subject rdfs:label ?searchLabel . FILTER(CONTAINS(LCASE(STR(?searchLabel)), {sparql_literal(normalize_search_text(text))})){type_filter}"
+
+def search_resources(text, limit=20, resource_type=None, offset=0):
+    """
+    Page de résultats de la recherche, triée par label. Chaque endpoint renvoie ses `offset + limit`
+    premières ressources dans le même ordre ; la page est extraite après fusion.
+    """
+    import pandas as pd
+
+    type_uri = resolve_resource_type(resource_type)
+    q = f"""{Constants.CUSTOM_PREFIX} SELECT ?subject (SAMPLE(?searchLabel) AS ?label) (SAMPLE(?t) AS ?type) WHERE {{ {search_pattern(text, type_uri)} OPTIONAL {{ ?subject a ?t }} }} GROUP BY ?subject ORDER BY LCASE(STR(?label)) ?subject LIMIT {offset + limit}"""
+    df = execute_raw_query(q, use_cache=True)
+    if df.empty:
+        return df
+    df = df.drop_duplicates('subject')
+    df = df.assign(_key=df['label'].fillna('').str.lower()).sort_values(['_key', 'subject']).drop(columns='_key')
+    if type_uri:
+        df['type'] = type_uri
+    return df.iloc[offset:offset + limit].reset_index(drop=True) if len(df) > offset else pd.DataFrame()
+
+def _lru_cache_stats():
+    stats = {}
+    for f in (search_properties, get_unique_values):
+        info = f.cache_info()
+        stats[(f.__name__, "hit")] = info.hits
+        stats[(f.__name__, "miss")] = info.misses
+    return stats
+
+Gauge("lru_cache_requests", "Accès cumulés aux caches lru_cache des requêtes", ["cache", "result"],
+      callback=_lru_cache_stats)
+
+def _invalidate_after_export(endpoint_url):
+    """
+    Caches fédérés (qui dépendent de tous les endpoints) vidés après un changement de version ; ils sont
+    reconstruits à partir des résultats par endpoint toujours en cache, seul l'endpoint modifié est réinterrogé.
+    """
+    search_properties.cache_clear()
+    get_unique_values.cache_clear()
+    schema_registry.refresh()
+
+dataset_versions.on_change(_invalidate_after_export)
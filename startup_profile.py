@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import subprocess
+from collections import defaultdict
+
+_START = time.perf_counter()
+_MARKS = []
+
+
+def mark(stage):
+    """Enregistre la fin d'une étape de démarrage."""
+    _MARKS.append((stage, time.perf_counter()))
+
+
+def report():
+    """Tableau des étapes de démarrage : durée propre et cumul depuis le premier import."""
+    lines = [f"{'Étape':<40} {'durée (ms)':>12} {'cumul (ms)':>12}"]
+    previous = _START
+    for stage, t in _MARKS:
+        lines.append(f"{stage:<40} {(t - previous) * 1000:>12.1f} {(t - _START) * 1000:>12.1f}")
+        previous = t
+    return "\n".join(lines)
+
+
+def summarize_importtime(stderr_text, top=15):
+    """
+    Agrège la sortie de `python -X importtime` par paquet racine (somme des temps propres)
+    et retourne les `top` paquets les plus coûteux.
+    """
+    totals = defaultdict(int)
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        try:
+            self_us = int(parts[0].split(":")[1])
+        except ValueError:
+            continue
+        totals[parts[2].strip().split(".")[0]] += self_us
+
+    total = sum(totals.values())
+    lines = [f"{'Paquet':<30} {'temps (ms)':>12} {'part':>7}"]
+    for package, us in sorted(totals.items(), key=lambda x: x[1], reverse=True)[:top]:
+        lines.append(f"{package:<30} {us / 1000:>12.1f} {us / total if total else 0:>7.1%}")
+    lines.append(f"{'TOTAL':<30} {total / 1000:>12.1f}")
+    return "\n".join(lines)
+
+
+def importtime_report(module="app", top=15):
+    """Importe `module` dans un processus neuf avec `-X importtime` et résume le coût des imports."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, SEMATHEQUE_SCHEMA_WARMUP='0'),
+        capture_output=True, text=True
+    )
+    return summarize_importtime(completed.stderr, top=top)
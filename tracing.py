@@ -0,0 +1,152 @@
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
+import contextvars
+from collections import deque
+
+from Constants import (
+    TRACING_ENABLED, SLOW_QUERY_THRESHOLD, SLOW_QUERY_LOG, TRACE_HISTORY, MAX_QUERIES_PER_REQUEST
+)
+
+logger = logging.getLogger(__name__)
+
+# Journal des requêtes lentes, éventuellement redirigé vers un fichier dédié
+slow_query_logger = logging.getLogger("sematheque.slow_queries")
+if SLOW_QUERY_LOG:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG, encoding='utf-8')
+    _handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    slow_query_logger.addHandler(_handler)
+
+_current_trace = contextvars.ContextVar('sparql_trace', default=None)
+_recent_traces = deque(maxlen=TRACE_HISTORY)
+
+_PREFIX_RE = re.compile(r'PREFIX\s+[\w-]*:\s*<[^>]*>\s*', re.IGNORECASE)
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """Retire les déclarations PREFIX et normalise les espaces (pour regrouper les requêtes identiques)."""
+    return _SPACES_RE.sub(' ', _PREFIX_RE.sub('', query)).strip()
+
+
+def query_hash(query):
+    return hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()[:12]
+
+
+class RequestTrace:
+    """Ensemble des appels SPARQL (et accès cache) déclenchés par une requête HTTP."""
+
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started = time.time()
+        self.duration = None
+        self.events = []
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self, with_events=True):
+        with self._lock:
+            events = list(self.events)
+        queries = [e for e in events if e['kind'] == 'sparql']
+        endpoints = {}
+        for q in queries:
+            endpoints[q['endpoint']] = endpoints.get(q['endpoint'], 0) + 1
+        summary = {
+            "id": self.id,
+            "request": self.label,
+            "started": self.started,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "sparql_queries": len(queries),
+            "sparql_time_ms": round(sum(q['duration_ms'] for q in queries), 1),
+            "distinct_queries": len(set(q['hash'] for q in queries)),
+            "round_trips_by_endpoint": endpoints,
+            "cache_hits": sum(1 for e in events if e['kind'] == 'cache' and e['cache'] == 'hit'),
+            "cache_misses": sum(1 for e in events if e['kind'] == 'cache' and e['cache'] == 'miss')
+        }
+        if with_events:
+            summary["events"] = events
+        return summary
+
+
+def start_trace(label):
+    """Ouvre une trace pour le contexte courant ; retourne un jeton à passer à `end_trace`."""
+    if not TRACING_ENABLED:
+        return None
+    trace = RequestTrace(label)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(handle):
+    """Clôt la trace, la conserve dans l'historique et signale les pages trop bavardes."""
+    if handle is None:
+        return None
+    trace, token = handle
+    _current_trace.reset(token)
+    trace.duration = time.time() - trace.started
+    _recent_traces.append(trace)
+    summary = trace.summary(with_events=False)
+    if summary['sparql_queries'] > MAX_QUERIES_PER_REQUEST:
+        logger.warning(f"{trace.label} : {summary['sparql_queries']} requêtes SPARQL "
+                       f"({summary['distinct_queries']} distinctes) en {summary['duration_ms']} ms")
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_query(query, endpoint, duration, rows=0, size=0, cache="none", error=None):
+    """Enregistre un appel SPARQL dans la trace courante et dans le journal des requêtes lentes."""
+    if not TRACING_ENABLED:
+        return
+    trace = _current_trace.get()
+    if trace is None and duration < SLOW_QUERY_THRESHOLD:
+        return
+    event = {
+        "kind": "sparql",
+        "hash": query_hash(query),
+        "endpoint": endpoint,
+        "duration_ms": round(duration * 1000, 1),
+        "rows": rows,
+        "bytes": size,
+        "cache": cache,
+        "error": error
+    }
+    if trace is not None:
+        trace.record(event)
+    if duration >= SLOW_QUERY_THRESHOLD:
+        origin = trace.label if trace is not None else "hors requête"
+        slow_query_logger.warning(f"Requête lente ({event['duration_ms']} ms, {endpoint}, {origin}) "
+                                  f"[{event['hash']}] {normalize_query(query)[:2000]}")
+
+
+def record_cache(name, hit):
+    """Enregistre un accès à un cache applicatif dans la trace courante."""
+    trace = _current_trace.get() if TRACING_ENABLED else None
+    if trace is not None:
+        trace.record({"kind": "cache", "cache": "hit" if hit else "miss", "name": name})
+
+
+def submit(executor, fn, *args, **kwargs):
+    """`executor.submit` qui propage la trace courante au thread du pool."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def get_trace(trace_id):
+    for trace in reversed(_recent_traces):
+        if trace.id == trace_id:
+            return trace
+    return None
+
+
+def recent_traces():
+    """Résumés des dernières traces, les plus coûteuses en allers-retours en premier."""
+    summaries = [t.summary(with_events=False) for t in list(_recent_traces)]
+    return sorted(summaries, key=lambda s: s['sparql_queries'], reverse=True)
@@ -1,5 +1,4 @@
 import re
-import pandas as pd
 from Constants import HIDDEN_PROPERTIES, PREFIXES
 
 def extract_item_id(uri: str) -> str:
@@ -70,6 +69,8 @@ def format_value_with_link(value, value_label):
 
 def prepare_csv_data(results):
     """Transforme les résultats bruts SPARQL en DataFrame formaté pour l'export CSV."""
+    import pandas as pd
+
     if results.empty:
         return pd.DataFrame()
         
@@ -0,0 +1,278 @@
+import os
+import re
+import glob
+import json
+import math
+import time
+import base64
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _file_lock(path):
+    """Verrou de fichier bloquant partagé par les workers (sans effet sous Windows)."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _alive(pid):
+    # Sous Windows, os.kill(pid, 0) envoie CTRL_C_EVENT : les autres processus sont considérés arrêtés
+    if os.name == 'nt':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class HyperLogLog:
+    """Estimation du nombre d'éléments distincts en mémoire fixe (2^precision registres d'un octet)."""
+
+    def __init__(self, precision=10, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & ((1 << 64) - 1)
+        rank = 64 - self.precision + 1 if rest == 0 else 65 - rest.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for i, r in enumerate(other.registers):
+            if r > self.registers[i]:
+                self.registers[i] = r
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # Correction pour les petites cardinalités (comptage linéaire)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class VisitStats:
+    """
+    Statistiques de visites en mémoire bornée : un anneau de `bucket_count` compartiments de
+    `bucket_seconds` secondes, chacun avec un compteur et un HyperLogLog des visiteurs.
+    La mémoire ne dépend pas de la durée de vie du processus.
+
+    Avec plusieurs workers, chacun enregistre ses propres visites dans `<flush_path>.<pid>`. Au
+    démarrage, les fichiers des processus arrêtés sont fusionnés (compteurs additionnés, registres
+    HyperLogLog fusionnés) dans `flush_path`, qui est ensuite chargé : chaque worker affiche l'historique
+    consolidé et ses propres visites depuis son démarrage.
+    """
+
+    WINDOWS = {"1h": 3600, "24h": 86400, "7j": 7 * 86400}
+
+    def __init__(self, bucket_seconds=3600, bucket_count=168, precision=10,
+                 flush_path=None, flush_interval=300):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.precision = precision
+        self.flush_path = flush_path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._buckets = [None] * bucket_count
+        self.total = 0
+        self.unique = HyperLogLog(precision)
+        self.since = time.time()
+        # Compteurs chargés au démarrage : retranchés à l'enregistrement, pour n'écrire que les visites du
+        # processus (les registres HyperLogLog sont écrits entiers, leur fusion est idempotente)
+        self._loaded_total = 0
+        self._loaded_counts = {}
+        self._load()
+        if self.flush_path and self.flush_interval:
+            threading.Thread(target=self._flush_loop, name="visit-stats-flush", daemon=True).start()
+
+    def _bucket(self, now):
+        """Retourne le compartiment courant, en réinitialisant celui qui a fait le tour de l'anneau."""
+        slot = int(now // self.bucket_seconds)
+        index = slot % self.bucket_count
+        bucket = self._buckets[index]
+        if bucket is None or bucket['slot'] != slot:
+            bucket = {'slot': slot, 'count': 0, 'hll': HyperLogLog(self.precision)}
+            self._buckets[index] = bucket
+        return bucket
+
+    def record(self, visitor):
+        now = time.time()
+        with self._lock:
+            bucket = self._bucket(now)
+            bucket['count'] += 1
+            bucket['hll'].add(visitor)
+            self.total += 1
+            self.unique.add(visitor)
+
+    def window(self, seconds, now=None):
+        """Nombre de visites et estimation des visiteurs uniques sur les `seconds` dernières secondes."""
+        now = now or time.time()
+        first_slot = int((now - seconds) // self.bucket_seconds) + 1
+        merged = HyperLogLog(self.precision)
+        count = 0
+        with self._lock:
+            buckets = [b for b in self._buckets if b is not None and b['slot'] >= first_slot]
+            for bucket in buckets:
+                count += bucket['count']
+                merged.merge(bucket['hll'])
+        return {"connexions": count, "utilisateurs_uniques": merged.count()}
+
+    def summary(self):
+        now = time.time()
+        retention = self.bucket_seconds * self.bucket_count
+        return {
+            "total_connexions": self.total,
+            "utilisateurs_uniques": self.unique.count(),
+            "depuis": self.since,
+            "fenetres": {name: self.window(seconds, now) for name, seconds in self.WINDOWS.items()
+                         if seconds <= retention}
+        }
+
+    def _encode(self):
+        """État propre au processus, sous le verrou : visites enregistrées depuis son démarrage."""
+        return {
+            "total": self.total - self._loaded_total,
+            "since": self.since,
+            "precision": self.precision,
+            "bucket_seconds": self.bucket_seconds,
+            "unique": base64.b64encode(bytes(self.unique.registers)).decode('ascii'),
+            "buckets": [
+                {"slot": b['slot'], "count": b['count'] - self._loaded_counts.get(b['slot'], 0),
+                 "hll": base64.b64encode(bytes(b['hll'].registers)).decode('ascii')}
+                for b in self._buckets if b is not None
+            ]
+        }
+
+    def _combine(self, state, other):
+        """Somme de deux états enregistrés ; seuls les `bucket_count` derniers compartiments sont conservés."""
+        unique = HyperLogLog(self.precision, base64.b64decode(state['unique']))
+        unique.merge(HyperLogLog(self.precision, base64.b64decode(other['unique'])))
+        buckets = {b['slot']: dict(b) for b in state['buckets']}
+        for b in other['buckets']:
+            current = buckets.get(b['slot'])
+            if current is None:
+                buckets[b['slot']] = dict(b)
+                continue
+            hll = HyperLogLog(self.precision, base64.b64decode(current['hll']))
+            hll.merge(HyperLogLog(self.precision, base64.b64decode(b['hll'])))
+            current['count'] += b['count']
+            current['hll'] = base64.b64encode(bytes(hll.registers)).decode('ascii')
+        last = max(buckets, default=0)
+        return {
+            "total": state['total'] + other['total'],
+            "since": min(state['since'], other['since']),
+            "precision": self.precision,
+            "bucket_seconds": self.bucket_seconds,
+            "unique": base64.b64encode(bytes(unique.registers)).decode('ascii'),
+            "buckets": [b for slot, b in sorted(buckets.items()) if slot > last - self.bucket_count]
+        }
+
+    def _write(self, path, state):
+        """Écriture atomique ; retourne False en cas d'échec."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logger.warning(f"Impossible d'enregistrer les statistiques de visites : {e}")
+            return False
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state['precision'] != self.precision or state['bucket_seconds'] != self.bucket_seconds:
+                logger.warning(f"Statistiques de visites ignorées ({path}) : paramètres différents")
+                return None
+            return state
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Statistiques de visites illisibles ({path}) : {e}")
+            return None
+
+    def _process_files(self):
+        """Fichiers `<flush_path>.<pid>` des processus (en cours ou arrêtés) : liste de (chemin, pid)."""
+        pattern = re.compile(re.escape(os.path.basename(self.flush_path)) + r"\.(\d+)$")
+        files = []
+        for path in glob.glob(f"{glob.escape(self.flush_path)}.*"):
+            match = pattern.match(os.path.basename(path))
+            if match:
+                files.append((path, int(match.group(1))))
+        return files
+
+    def flush(self):
+        """Écrit les visites de ce processus dans `<flush_path>.<pid>` (écriture atomique)."""
+        if not self.flush_path:
+            return
+        with self._lock:
+            state = self._encode()
+        self._write(f"{self.flush_path}.{os.getpid()}", state)
+
+    def _load(self):
+        """
+        Fusionne dans `flush_path` les fichiers des processus arrêtés (un fichier portant le pid de ce
+        processus vient d'un processus précédent), puis charge l'état consolidé. Sous verrou : des
+        workers qui démarrent ensemble ne fusionnent pas deux fois le même fichier.
+        """
+        if not self.flush_path:
+            return
+        with _file_lock(f"{self.flush_path}.lock"):
+            state = self._read(self.flush_path) if os.path.exists(self.flush_path) else None
+            merged = []
+            for path, pid in self._process_files():
+                if pid != os.getpid() and _alive(pid):
+                    continue
+                other = self._read(path)
+                if other is None:
+                    continue
+                state = other if state is None else self._combine(state, other)
+                merged.append(path)
+            if merged and self._write(self.flush_path, state):
+                for path in merged:
+                    os.remove(path)
+        if state is None:
+            return
+
+        self.total = self._loaded_total = state['total']
+        self.since = state['since']
+        self.unique = HyperLogLog(self.precision, base64.b64decode(state['unique']))
+        for b in state['buckets']:
+            current = self._buckets[b['slot'] % self.bucket_count]
+            if current is not None and current['slot'] > b['slot']:
+                continue
+            self._buckets[b['slot'] % self.bucket_count] = {
+                'slot': b['slot'], 'count': b['count'],
+                'hll': HyperLogLog(self.precision, base64.b64decode(b['hll']))
+            }
+            self._loaded_counts[b['slot']] = b['count']
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()